@@ -0,0 +1,369 @@
+from collections import Counter
+from typing import Callable
+import hashlib, os
+
+import numpy as np
+
+from AudioStream import from_pcm, Resampler, BLOCK_FRAMES
+from MetadataStore import METADATA_FOLDER
+from StorageCodecs import open_recording
+
+
+FINGERPRINT_PATH: str = os.path.join(METADATA_FOLDER, "fingerprints.npz")
+
+# recordings are fingerprinted as 8kHz mono, one 32 bit sub-fingerprint per
+# 16ms from overlapping 256ms frames
+FINGERPRINT_RATE: int = 8000
+FRAME_SIZE: int = 2048
+HOP_SIZE: int = 128
+
+# 33 bands between 300Hz and 3kHz give the 32 bits of a sub-fingerprint
+BAND_EDGES: np.ndarray = np.round(
+    np.geomspace(300, 3000, 34) * FRAME_SIZE / FINGERPRINT_RATE
+).astype(np.int64)
+
+# only sub-fingerprints divisible by this are used to find candidate pairs
+ANCHOR_MODULUS: int = 4
+
+
+class Fingerprint:
+    """
+    The fingerprint of a single recording: a sequence of sub-fingerprints,
+    one bit per band telling whether the energy difference to the next band
+    grew since the previous frame, and a digest of the exact audio.
+    """
+    def __init__(self, prints: np.ndarray, digest: bytes,
+                 key: tuple[int, int]) -> None:
+        """
+        Initializes a fingerprint.
+
+        :param prints: the sub-fingerprints, as 32 bit integers.
+        :param digest: a hash of the format and audio data of the recording.
+        :param key: the modification time and size of the fingerprinted file.
+        """
+        self.prints: np.ndarray = prints
+        self.digest: bytes = digest
+        self.key: tuple[int, int] = key
+
+
+def file_key(path: str) -> tuple[int, int]:
+    """
+    Get what tells whether a file changed since it was fingerprinted.
+
+    :param path: the file.
+    :return: the modification time and size of the file.
+    """
+    stat: os.stat_result = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def band_energies(samples: np.ndarray) -> np.ndarray:
+    """
+    Compute the energy per band of every complete frame of a block.
+
+    :param samples: mono samples at the fingerprint rate.
+    :return: an array of shape (frames, bands).
+    """
+    count: int = (len(samples) - FRAME_SIZE) // HOP_SIZE + 1
+    if count <= 0:
+        return np.zeros((0, len(BAND_EDGES) - 1))
+
+    frames: np.ndarray = np.lib.stride_tricks.sliding_window_view(
+        samples, FRAME_SIZE)[::HOP_SIZE][:count]
+    spectrum: np.ndarray = np.abs(
+        np.fft.rfft(frames * np.hanning(FRAME_SIZE), axis=1)) ** 2
+
+    return np.add.reduceat(spectrum, BAND_EDGES, axis=1)[:, :-1]
+
+
+def fingerprint_recording(path: str) -> Fingerprint:
+    """
+    Fingerprint a recording in a single streaming pass.
+
+    :param path: the recording.
+    :return: the fingerprint of the recording.
+    """
+    key: tuple[int, int] = file_key(path)
+    digest = hashlib.blake2b(digest_size=16)
+    prints: list[np.ndarray] = []
+
+    with open_recording(path) as reader:
+        sampwidth: int = reader.getsampwidth()
+        channels: int = reader.getnchannels()
+        rate: int = reader.getframerate()
+        digest.update(f"{rate}:{channels}:{sampwidth}:".encode())
+
+        resampler: Resampler = Resampler(rate, FINGERPRINT_RATE)
+        pending: np.ndarray = np.zeros(0)
+        previous: np.ndarray | None = None # band differences of the last frame
+
+        while len(data := reader.readframes(BLOCK_FRAMES)):
+            digest.update(data)
+
+            mono: np.ndarray = from_pcm(data, sampwidth, channels)
+            mono = resampler.process(mono.mean(axis=1, keepdims=True))[:, 0]
+            pending = np.concatenate((pending, mono))
+
+            energies: np.ndarray = band_energies(pending)
+            pending = pending[len(energies) * HOP_SIZE:]
+            if not len(energies):
+                continue
+
+            differences: np.ndarray = energies[:, :-1] - energies[:, 1:]
+            if previous is not None:
+                differences = np.concatenate((previous, differences))
+            previous = differences[-1:]
+
+            bits: np.ndarray = differences[1:] > differences[:-1]
+            prints.append(np.packbits(bits, axis=1, bitorder="little")
+                          .view("<u4")[:, 0])
+
+    return Fingerprint(np.concatenate(prints) if prints else
+                       np.zeros(0, dtype="<u4"), digest.digest(), key)
+
+
+def bit_error_rate(first: np.ndarray, second: np.ndarray) -> float:
+    """
+    Compare two equally long sequences of sub-fingerprints.
+
+    :param first: the first sequence.
+    :param second: the second sequence.
+    :return: the fraction of bits that differ.
+    """
+    if not len(first):
+        return 1.0
+    differing: np.ndarray = np.unpackbits((first ^ second).view(np.uint8))
+    return int(differing.sum()) / differing.size
+
+
+class FingerprintIndex:
+    """
+    The fingerprints of the recording library, used to find groups of
+    duplicate recordings.
+
+    Exact duplicates share the digest of their audio, whatever format they
+    are stored in. Near duplicates, such as a re-import at another gain or
+    sample rate, share many sub-fingerprints: the index looks up the
+    recordings sharing "anchor" sub-fingerprints, so only recordings that
+    are likely to match are ever compared, and confirms a match by the bit
+    error rate of the aligned fingerprints.
+    """
+    def __init__(self) -> None:
+        """
+        Initializes an empty index.
+        """
+        self.entries: dict[str, Fingerprint] = {}
+
+
+    def update(self, folder: str, recordings: list[str],
+               progress: Callable[[float], None] | None = None) -> None:
+        """
+        Fingerprint the recordings that are new or changed since they were
+        fingerprinted, and forget the ones that are gone.
+
+        :param folder: the folder holding the recordings.
+        :param recordings: the file names of every recording.
+        :param progress: called with the fraction of the recordings done.
+        """
+        entries: dict[str, Fingerprint] = {}
+        for number, recording in enumerate(recordings, 1):
+            path: str = os.path.join(folder, recording)
+            try:
+                entry: Fingerprint | None = self.entries.get(recording)
+                if entry is None or entry.key != file_key(path):
+                    entry = fingerprint_recording(path)
+                entries[recording] = entry
+            except (OSError, EOFError, ValueError):
+                # unreadable or deleted meanwhile
+                pass
+
+            if progress is not None:
+                progress(number / len(recordings))
+
+        self.entries = entries
+
+
+    def duplicates(self, max_error: float = 0.25, coverage: float = 0.8,
+                   min_votes: int = 4, max_group: int = 32) \
+            -> list[tuple[str, list[str]]]:
+        """
+        Find the groups of duplicate recordings.
+
+        :param max_error: the highest bit error rate of a near duplicate.
+        :param coverage: how much of the shorter recording must overlap the
+        longer one.
+        :param min_votes: the number of shared anchors that makes a pair
+        worth comparing.
+        :param max_group: anchors shared by more recordings than this, such
+        as the sub-fingerprint of silence, are ignored.
+        :return: ("exact", names) or ("near", names) for every group, with
+        the names in the order they were given to update.
+        """
+        names: list[str] = list(self.entries)
+        parents: list[int] = list(range(len(names)))
+
+        def find(item: int) -> int:
+            while parents[item] != item:
+                parents[item] = parents[parents[item]]
+                item = parents[item]
+            return item
+
+        def join(first: int, second: int) -> None:
+            parents[find(first)] = find(second)
+
+        # exact duplicates
+        digests: dict[bytes, int] = {}
+        for number, name in enumerate(names):
+            digest: bytes = self.entries[name].digest
+            if digest in digests:
+                join(number, digests[digest])
+            else:
+                digests[digest] = number
+
+        # candidate pairs by the anchors they share
+        values: list[np.ndarray] = []
+        owners: list[np.ndarray] = []
+        for number, name in enumerate(names):
+            prints: np.ndarray = self.entries[name].prints
+            anchors: np.ndarray = np.unique(prints[prints % ANCHOR_MODULUS == 0])
+            values.append(anchors)
+            owners.append(np.full(len(anchors), number))
+
+        votes: Counter = Counter()
+        if values:
+            value: np.ndarray = np.concatenate(values)
+            owner: np.ndarray = np.concatenate(owners)
+            order: np.ndarray = np.argsort(value, kind="stable")
+            value, owner = value[order], owner[order]
+
+            starts: np.ndarray = np.flatnonzero(
+                np.r_[True, value[1:] != value[:-1]])
+            ends: np.ndarray = np.r_[starts[1:], len(value)]
+            shared: np.ndarray = (ends - starts >= 2) & \
+                (ends - starts <= max_group)
+
+            for start, end in zip(starts[shared], ends[shared]):
+                group: list[int] = owner[start:end].tolist()
+                for index, first in enumerate(group):
+                    for second in group[index + 1:]:
+                        votes[first, second] += 1
+
+        for (first, second), count in votes.items():
+            if count >= min_votes and find(first) != find(second) and \
+                    self.matches(names[first], names[second], max_error,
+                                 coverage):
+                join(first, second)
+
+        groups: dict[int, list[int]] = {}
+        for number in range(len(names)):
+            groups.setdefault(find(number), []).append(number)
+
+        found: list[tuple[str, list[str]]] = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            exact: bool = len({self.entries[names[number]].digest
+                               for number in members}) == 1
+            found.append(("exact" if exact else "near",
+                          [names[number] for number in members]))
+        return found
+
+
+    def matches(self, first: str, second: str, max_error: float,
+                coverage: float) -> bool:
+        """
+        Compare two recordings, aligned by their most common anchor offset.
+
+        :param first: the file name of the first recording.
+        :param second: the file name of the second recording.
+        :param max_error: the highest bit error rate of a match.
+        :param coverage: how much of the shorter recording must overlap.
+        :return: whether the recordings are near duplicates.
+        """
+        a: np.ndarray = self.entries[first].prints
+        b: np.ndarray = self.entries[second].prints
+
+        a_positions: np.ndarray = np.flatnonzero(a % ANCHOR_MODULUS == 0)
+        b_positions: np.ndarray = np.flatnonzero(b % ANCHOR_MODULUS == 0)
+        _, a_common, b_common = np.intersect1d(
+            a[a_positions], b[b_positions], return_indices=True)
+        if not len(a_common):
+            return False
+
+        offsets: np.ndarray = a_positions[a_common] - b_positions[b_common]
+        candidates, counts = np.unique(offsets, return_counts=True)
+        offset: int = int(candidates[np.argmax(counts)])
+
+        a_start, b_start = max(offset, 0), max(-offset, 0)
+        length: int = min(len(a) - a_start, len(b) - b_start)
+        if length < coverage * min(len(a), len(b)):
+            return False
+
+        return bit_error_rate(a[a_start:a_start + length],
+                              b[b_start:b_start + length]) <= max_error
+
+
+    def remove(self, recording: str) -> None:
+        """
+        Forget the fingerprint of a recording.
+
+        :param recording: the recording's file name.
+        """
+        self.entries.pop(recording, None)
+
+
+    def save(self, path: str = FINGERPRINT_PATH) -> None:
+        """
+        Store the fingerprints.
+
+        :param path: where the fingerprints are stored.
+        """
+        names: list[str] = list(self.entries)
+        entries: list[Fingerprint] = [self.entries[name] for name in names]
+        lengths: list[int] = [len(entry.prints) for entry in entries]
+
+        folder: str = os.path.dirname(path) or "."
+        os.makedirs(folder, exist_ok=True)
+        temporary: str = os.path.join(folder,
+                                      f".{os.path.basename(path)}.part.npz")
+        np.savez(temporary, names=np.array(names, dtype=str),
+                 keys=np.array([entry.key for entry in entries],
+                               dtype=np.int64).reshape(-1, 2),
+                 # as bytes, a bytes string dtype drops trailing zero bytes
+                 digests=np.frombuffer(
+                     b"".join(entry.digest for entry in entries),
+                     dtype=np.uint8).reshape(-1, 16),
+                 lengths=np.array(lengths, dtype=np.int64),
+                 prints=np.concatenate([entry.prints for entry in entries])
+                 if entries else np.zeros(0, dtype="<u4"))
+        os.replace(temporary, path)
+
+
+    @classmethod
+    def load(cls, path: str = FINGERPRINT_PATH) -> "FingerprintIndex":
+        """
+        Load the stored fingerprints.
+
+        :param path: where the fingerprints are stored.
+        :return: the index, empty if nothing was stored.
+        """
+        index: FingerprintIndex = cls()
+        try:
+            with np.load(path) as data:
+                digests: np.ndarray = data["digests"]
+                if digests.dtype != np.uint8:
+                    # stored in an earlier format that lost some digests,
+                    # so the fingerprints are taken again
+                    raise ValueError("outdated fingerprints")
+
+                prints: list[np.ndarray] = np.split(
+                    data["prints"], np.cumsum(data["lengths"])[:-1])
+                for name, key, digest, entry_prints in zip(
+                        data["names"].tolist(), data["keys"].tolist(),
+                        digests, prints):
+                    index.entries[name] = Fingerprint(entry_prints,
+                                                      digest.tobytes(),
+                                                      tuple(key))
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        return index
@@ -0,0 +1,171 @@
+from typing import Iterator
+
+import numpy as np
+
+
+BLOCK_FRAMES: int = 65536
+FILTER_TAPS: int = 63 # length of the anti-aliasing filter, odd for a whole delay
+
+
+def from_pcm(data: bytes, sampwidth: int, channels: int) -> np.ndarray:
+    """
+    Convert interleaved PCM audio to floating point samples.
+
+    :param data: the PCM audio.
+    :param sampwidth: the number of bytes per sample.
+    :param channels: the number of interleaved channels.
+    :return: an array of shape (frames, channels) with values in [-1, 1).
+    """
+    if sampwidth == 1:
+        # 8-bit wav audio is unsigned
+        samples: np.ndarray = np.frombuffer(data, dtype=np.uint8) - 128.0
+    elif sampwidth == 3:
+        raw: np.ndarray = np.frombuffer(data, dtype=np.uint8)
+        raw = raw.reshape(-1, 3).astype(np.int32)
+        ints: np.ndarray = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        samples = np.where(ints & 0x800000, ints - 0x1000000, ints) * 1.0
+    else:
+        dtype: str = {2: "<i2", 4: "<i4"}[sampwidth]
+        samples = np.frombuffer(data, dtype=dtype) * 1.0
+
+    samples /= 2 ** (8 * sampwidth - 1)
+    return samples.reshape(-1, channels)
+
+
+def to_pcm(samples: np.ndarray, sampwidth: int) -> bytes:
+    """
+    Convert floating point samples to interleaved PCM audio.
+
+    :param samples: an array of shape (frames, channels).
+    :param sampwidth: the number of bytes per sample.
+    :return: the PCM audio, clipped to the range of the sample width.
+    """
+    scale: int = 2 ** (8 * sampwidth - 1)
+    ints: np.ndarray = np.clip(np.round(samples * scale), -scale, scale - 1)
+    ints = ints.astype(np.int64).ravel()
+
+    if sampwidth == 1:
+        return (ints + 128).astype(np.uint8).tobytes()
+    if sampwidth == 3:
+        raw: np.ndarray = ints.astype("<i4").view(np.uint8).reshape(-1, 4)
+        return raw[:, :3].tobytes()
+    return ints.astype({2: "<i2", 4: "<i4"}[sampwidth]).tobytes()
+
+
+def read_blocks(reader, block_frames: int = BLOCK_FRAMES) \
+        -> Iterator[np.ndarray]:
+    """
+    Stream the remaining audio of an open recording in blocks.
+
+    :param reader: an open wave reader, or anything with the same interface.
+    :param block_frames: the number of frames per block.
+    :return: an iterator of arrays of shape (frames, channels).
+    """
+    sampwidth: int = reader.getsampwidth()
+    channels: int = reader.getnchannels()
+
+    while len(data := reader.readframes(block_frames)):
+        yield from_pcm(data, sampwidth, channels)
+
+
+def convert_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    """
+    Change the number of channels of a block of samples. Channels are mixed
+    down to mono before being spread over the new channels.
+
+    :param samples: an array of shape (frames, channels).
+    :param channels: the target number of channels.
+    :return: an array of shape (frames, channels).
+    """
+    if samples.shape[1] == channels:
+        return samples
+
+    mono: np.ndarray = samples.mean(axis=1, keepdims=True)
+    return np.repeat(mono, channels, axis=1)
+
+
+def low_pass(cutoff: float, taps: int = FILTER_TAPS) -> np.ndarray:
+    """
+    Design a windowed-sinc low-pass filter.
+
+    :param cutoff: the cutoff frequency as a fraction of the sample rate.
+    :param taps: the length of the filter.
+    :return: the filter coefficients, normalised to unity gain.
+    """
+    offsets: np.ndarray = np.arange(taps) - (taps - 1) / 2
+    kernel: np.ndarray = np.sinc(2 * cutoff * offsets) * np.blackman(taps)
+    return kernel / kernel.sum()
+
+
+class Resampler:
+    """
+    Changes the sample rate of a stream of blocks using linear
+    interpolation, carrying its position over from one block to the next.
+    When lowering the rate, the blocks are low-pass filtered first so that
+    frequencies above the new Nyquist limit do not alias.
+    """
+    def __init__(self, source_rate: int, target_rate: int) -> None:
+        """
+        Initializes a resampler for a single stream.
+
+        :param source_rate: the sample rate of the incoming blocks.
+        :param target_rate: the sample rate of the outgoing blocks.
+        """
+        self.step: float = source_rate / target_rate
+        self.time: float = 0.0 # position of the next output sample
+        self.last: np.ndarray | None = None # last sample of the previous block
+        self.taps: np.ndarray | None = None # anti-aliasing filter
+        self.history: np.ndarray | None = None # filter input carried over
+
+        if source_rate > target_rate:
+            # keep a margin below the new Nyquist limit for the transition
+            self.taps = low_pass(0.45 * target_rate / source_rate)
+            # the filter delays the stream by half its length, skip that
+            self.time = (len(self.taps) - 1) / 2
+
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of the stream.
+
+        :param samples: an array of shape (frames, channels).
+        :return: the resampled block.
+        """
+        if self.step == 1.0 or not len(samples):
+            return samples
+
+        if self.taps is not None:
+            samples = self.filter(samples)
+
+        # index 0 of the extended block is the last sample of the previous one
+        if self.last is not None:
+            samples = np.concatenate((self.last, samples))
+        self.last = samples[-1:]
+
+        end: int = len(samples) - 1
+        times: np.ndarray = np.arange(self.time, end + 1e-9, self.step)
+        self.time = (times[-1] + self.step - end) if len(times) else \
+            self.time - end
+
+        index: np.ndarray = np.minimum(times.astype(np.int64), end)
+        following: np.ndarray = np.minimum(index + 1, end)
+        fraction: np.ndarray = (times - index)[:, np.newaxis]
+
+        return samples[index] * (1 - fraction) + samples[following] * fraction
+
+
+    def filter(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Low-pass filter the next block of the stream.
+
+        :param samples: an array of shape (frames, channels).
+        :return: the filtered block, of the same shape.
+        """
+        if self.history is None:
+            self.history = np.zeros((len(self.taps) - 1, samples.shape[1]))
+
+        extended: np.ndarray = np.concatenate((self.history, samples))
+        self.history = extended[len(samples):]
+
+        return np.stack([np.convolve(extended[:, channel], self.taps, "valid")
+                         for channel in range(samples.shape[1])], axis=1)
@@ -0,0 +1,365 @@
+from concurrent.futures import ProcessPoolExecutor, CancelledError, wait
+from multiprocessing import Manager
+from typing import Callable
+import os, sys, argparse
+
+import numpy as np
+
+from AudioStream import read_blocks, to_pcm, convert_channels, Resampler
+from MetadataStore import load_metadata, save_metadata
+from StorageCodecs import open_recording, is_recording
+
+
+class BatchCancelled(Exception):
+    """
+    Raised inside a worker when the batch it belongs to was cancelled.
+    """
+
+
+def analyse_recording(path: str, threshold_db: float) -> tuple[int, int, float]:
+    """
+    Find the audible span and the peak level of a recording in one pass.
+
+    :param path: the recording to analyse.
+    :param threshold_db: the level, in dBFS, below which audio is silence.
+    :return: the first and last audible frame (end exclusive) and the peak
+    amplitude of the recording.
+    """
+    threshold: float = 10 ** (threshold_db / 20)
+    first, last, peak, position = -1, 0, 0.0, 0
+
+    with open_recording(path) as reader:
+        for block in read_blocks(reader):
+            levels: np.ndarray = np.abs(block).max(axis=1)
+            audible: np.ndarray = np.flatnonzero(levels > threshold)
+
+            if len(audible):
+                if first < 0:
+                    first = position + int(audible[0])
+                last = position + int(audible[-1]) + 1
+                peak = max(peak, float(levels[audible].max()))
+
+            position += len(block)
+
+    # a completely silent recording is left as it is
+    if first < 0:
+        return 0, position, 0.0
+
+    return first, last, peak
+
+
+def free_destination(path: str, suffix: str) -> str:
+    """
+    Find a name for a recording written alongside another one that does not
+    replace an existing file.
+
+    :param path: the recording that is processed.
+    :param suffix: added to the name of the recording.
+    :return: the path of the new recording.
+    """
+    root, extension = os.path.splitext(path)
+    destination: str = f"{root}{suffix}{extension}"
+    number: int = 2
+    while os.path.exists(destination):
+        destination = f"{root}{suffix}_{number}{extension}"
+        number += 1
+    return destination
+
+
+def update_timings(recording: str, offset: float, duration: float) -> None:
+    """
+    Bring the metadata of a recording whose audio was replaced in line with
+    the new audio. Times in the metadata are seconds into the recording, so
+    they move when the start is trimmed off, and are cut to the new length.
+
+    :param recording: the recording's file name.
+    :param offset: the seconds trimmed off the start.
+    :param duration: the length of the new audio in seconds.
+    """
+    metadata: dict = load_metadata(recording)
+    if not metadata:
+        return
+
+    def clip(time: float) -> float:
+        return min(max(time - offset, 0.0), duration)
+
+    metadata["duration"] = duration
+
+    if "speech_regions" in metadata:
+        metadata["speech_regions"] = [
+            [clip(start), clip(end)]
+            for start, end in metadata["speech_regions"]
+            if clip(end) > clip(start)]
+
+    edits: dict = metadata.get("edits") or {}
+    if edits:
+        edits["trim_in"] = clip(edits.get("trim_in", 0.0))
+        if edits.get("trim_out") is not None:
+            edits["trim_out"] = clip(edits["trim_out"])
+        edits["cuts"] = [[clip(start), clip(end)]
+                         for start, end in edits.get("cuts", [])
+                         if clip(end) > clip(start)]
+        metadata["edits"] = edits
+
+    save_metadata(recording, metadata)
+
+
+def process_recording(path: str, operations: dict, output: str = "replace",
+                      suffix: str = "_processed", cancel_event=None,
+                      updates=None) -> str:
+    """
+    Apply a set of operations to a recording. Runs inside a worker process.
+
+    The supported operations are applied in the following order:
+    trim: {"threshold_db": float} removes silence from the start and end.
+    normalize: {"peak_db": float} scales the audio to the given peak level.
+    gain: {"db": float} changes the level of the audio.
+    convert: {"rate": int, "channels": int, "sampwidth": int} changes the
+    format, any of the keys may be left out.
+
+    :param path: the recording to process.
+    :param operations: the operations to apply and their parameters.
+    :param output: replace -> overwrite the recording and update its
+    metadata, alongside -> write a new recording next to it, under a name
+    that is not taken yet.
+    :param suffix: added to the name of recordings written alongside.
+    :param cancel_event: an event that is set when the batch is cancelled.
+    :param updates: a queue that receives (path, fraction) progress updates.
+    :return: the path of the processed recording.
+    """
+    trim: dict | None = operations.get("trim")
+    normalize: dict | None = operations.get("normalize")
+    convert: dict = operations.get("convert", {})
+
+    start, end, peak = 0, -1, 0.0
+    if trim or normalize:
+        threshold_db: float = trim["threshold_db"] if trim else -120.0
+        start, end, peak = analyse_recording(path, threshold_db)
+
+        # the audible span is only used when trimming
+        if not trim:
+            start, end = 0, -1
+
+    scale: float = 10 ** (operations.get("gain", {}).get("db", 0.0) / 20)
+    if normalize and peak > 0:
+        scale *= 10 ** (normalize["peak_db"] / 20) / peak
+
+    if output == "replace":
+        destination: str = path
+    else:
+        destination = free_destination(path, suffix)
+
+    # write to a temporary file first so the result appears atomically
+    folder, name = os.path.split(destination)
+    temporary: str = os.path.join(folder, f".{name}.part")
+    extension: str = os.path.splitext(destination)[1]
+
+    try:
+        with open_recording(path) as reader, \
+                open_recording(temporary, "wb", extension) as writer:
+            rate: int = convert.get("rate", reader.getframerate())
+            channels: int = convert.get("channels", reader.getnchannels())
+            sampwidth: int = convert.get("sampwidth", reader.getsampwidth())
+
+            writer.setframerate(rate)
+            writer.setnchannels(channels)
+            writer.setsampwidth(sampwidth)
+
+            total: int = reader.getnframes()
+            end = total if end < 0 else end
+            resampler: Resampler = Resampler(reader.getframerate(), rate)
+
+            source_rate: int = reader.getframerate()
+            reader.setpos(start)
+            position: int = start
+
+            for block in read_blocks(reader):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise BatchCancelled(path)
+
+                block = block[:max(end - position, 0)]
+                position += len(block)
+
+                block = convert_channels(block * scale, channels)
+                writer.writeframes(to_pcm(resampler.process(block), sampwidth))
+
+                if updates is not None:
+                    updates.put((path, (position - start) / max(end - start, 1)))
+
+                if position >= end:
+                    break
+
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    if output == "replace":
+        update_timings(os.path.basename(path), start / source_rate,
+                       (position - start) / source_rate)
+
+    return destination
+
+
+class BatchProcessor:
+    """
+    Processes many recordings at once, spreading them over a pool of worker
+    processes.
+    """
+    def __init__(self, operations: dict, output: str = "replace",
+                 suffix: str = "_processed", workers: int | None = None) -> None:
+        """
+        Initializes a batch processor.
+
+        :param operations: the operations to apply, see process_recording.
+        :param output: replace -> overwrite recordings, alongside -> write new
+        recordings next to them.
+        :param suffix: added to the name of recordings written alongside.
+        :param workers: the number of worker processes, one per core if None.
+        """
+        self.operations: dict = operations
+        self.output: str = output
+        self.suffix: str = suffix
+        self.workers: int | None = workers
+
+        self.cancelled: bool = False
+        self.cancel_event = None
+
+
+    def cancel(self) -> None:
+        """
+        Cancel the running batch. Recordings that were already processed are
+        kept, unfinished ones are left untouched.
+        """
+        self.cancelled = True
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+
+    def run(self, paths: list[str],
+            progress: Callable[[float, str], None] | None = None) \
+            -> dict[str, str | BaseException]:
+        """
+        Process a list of recordings, blocking until all of them are done.
+
+        :param paths: the recordings to process.
+        :param progress: called with the overall fraction done and the most
+        recently updated recording.
+        :return: maps each recording to its output path, or to the exception
+        that stopped it from being processed.
+        """
+        results: dict[str, str | BaseException] = {}
+
+        # a recording listed twice is only processed once
+        unique: dict[str, str] = {}
+        for path in paths:
+            unique.setdefault(os.path.realpath(path), path)
+        paths = list(unique.values())
+        if not paths:
+            return results
+
+        fractions: dict[str, float] = {path: 0.0 for path in paths}
+
+        with Manager() as manager, \
+                ProcessPoolExecutor(self.workers) as pool:
+            self.cancel_event = manager.Event()
+            updates = manager.Queue()
+
+            if self.cancelled:
+                self.cancel_event.set()
+
+            futures: dict = {
+                pool.submit(process_recording, path, self.operations,
+                            self.output, self.suffix, self.cancel_event,
+                            updates): path
+                for path in paths
+            }
+            pending: set = set(futures)
+
+            while pending:
+                done, pending = wait(pending, timeout=0.1)
+
+                # recordings that have not started yet are simply dropped
+                if self.cancelled:
+                    for future in pending:
+                        future.cancel()
+
+                latest: str = ""
+                while not updates.empty():
+                    latest, fraction = updates.get()
+                    fractions[latest] = fraction
+
+                for future in done:
+                    latest = futures[future]
+                    fractions[latest] = 1.0
+                    try:
+                        results[latest] = future.result()
+                    except (CancelledError, Exception) as error:
+                        results[latest] = error
+
+                if progress is not None and latest:
+                    progress(sum(fractions.values()) / len(paths), latest)
+
+        self.cancel_event = None
+        return results
+
+
+def main() -> None:
+    """
+    Process recordings from the command line.
+    """
+    parser = argparse.ArgumentParser(description="Batch process recordings.")
+    parser.add_argument("files", nargs="*",
+                        help="recordings to process, all by default")
+    parser.add_argument("--trim", type=float, metavar="DB",
+                        help="trim silence quieter than DB dBFS")
+    parser.add_argument("--normalize", type=float, metavar="DB",
+                        help="normalize the peak level to DB dBFS")
+    parser.add_argument("--gain", type=float, metavar="DB",
+                        help="change the level by DB decibels")
+    parser.add_argument("--rate", type=int, help="convert the sample rate")
+    parser.add_argument("--channels", type=int,
+                        help="convert the number of channels")
+    parser.add_argument("--sampwidth", type=int, choices=(1, 2, 3, 4),
+                        help="convert the number of bytes per sample")
+    parser.add_argument("--alongside", action="store_true",
+                        help="keep the originals and write new recordings")
+    parser.add_argument("--workers", type=int, help="number of processes")
+    args = parser.parse_args()
+
+    operations: dict = {}
+    if args.trim is not None:
+        operations["trim"] = {"threshold_db": args.trim}
+    if args.normalize is not None:
+        operations["normalize"] = {"peak_db": args.normalize}
+    if args.gain is not None:
+        operations["gain"] = {"db": args.gain}
+
+    convert: dict = {key: value for key, value in (("rate", args.rate),
+                                                   ("channels", args.channels),
+                                                   ("sampwidth", args.sampwidth))
+                     if value is not None}
+    if convert:
+        operations["convert"] = convert
+
+    files: list[str] = args.files or \
+        [f"audio_recordings/{name}" for name in sorted(os.listdir("audio_recordings"))
+         if is_recording(name)]
+
+    processor = BatchProcessor(operations,
+                               "alongside" if args.alongside else "replace",
+                               workers=args.workers)
+
+    def report(fraction: float, path: str) -> None:
+        print(f"\r{fraction:6.1%} {path}", end="", file=sys.stderr)
+
+    results = processor.run(files, report)
+
+    print(file=sys.stderr)
+    for path, result in results.items():
+        print(f"{path}: {result}")
+
+
+if __name__ == "__main__":
+    main()
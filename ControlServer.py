@@ -0,0 +1,507 @@
+from threading import Thread, Event, Lock
+from queue import Queue, Empty
+from typing import Callable
+import argparse, errno, itertools, json, os, selectors, socket, stat
+import traceback
+
+
+class ControlError(Exception):
+    """
+    Raised by a command handler for a command that cannot be carried out.
+    The message is sent back to the client.
+    """
+
+
+def parse_address(address: str) -> tuple[int, str | tuple[str, int]]:
+    """
+    Work out where the control socket lives.
+
+    :param address: a port or host:port for a TCP socket on this machine,
+    anything else is the path of a Unix domain socket.
+    :return: the socket family and its address.
+    :raise ValueError: the address names another machine.
+    """
+    host, _, port = address.rpartition(":")
+    if port.isdigit() and host in ("", "localhost", "127.0.0.1"):
+        return socket.AF_INET, ("127.0.0.1", int(port))
+    if port.isdigit() and host:
+        raise ValueError("the control socket only listens on this machine")
+    return socket.AF_UNIX, address
+
+
+def encode(message: dict) -> bytes:
+    """
+    Encode a message as a line of JSON.
+
+    :param message: the message.
+    :return: the encoded line.
+    :raise TypeError: the message holds something JSON cannot represent.
+    :raise ValueError: the message refers to itself.
+    """
+    return json.dumps(message).encode() + b"\n"
+
+
+class ControlConnection:
+    """
+    A connected client. Replies and events may be sent to it from any
+    thread without waiting on the client: what the socket cannot take at
+    once is kept until the server thread can send it, and a client that
+    stops reading is dropped once too much is kept for it. A single large
+    message, such as the list of a big library, is always accepted.
+    """
+    MAX_PENDING: int = 1 << 20
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock: socket.socket = sock
+        self.sock.setblocking(False)
+        self.buffer: bytes = b""
+        self.pending: bytes = b""
+        self.lock: Lock = Lock()
+        self.closed: bool = False
+
+
+    def send(self, data: bytes) -> bool:
+        """
+        Send an encoded message. A client that went away, or that has
+        fallen too far behind, is closed.
+
+        :param data: the message, encoded with encode.
+        :return: whether part of the message is left for flush to send.
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            if len(self.pending) > self.MAX_PENDING:
+                # the client has not read what was sent before
+                self.closed = True
+                return False
+
+            self.pending += data
+            self.write()
+            return bool(self.pending)
+
+
+    def flush(self) -> None:
+        """
+        Send as much of the kept messages as the socket takes now.
+        """
+        with self.lock:
+            if not self.closed:
+                self.write()
+
+
+    def write(self) -> None:
+        # called with the lock held
+        try:
+            sent: int = self.sock.send(self.pending)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.closed = True
+            return
+        self.pending = self.pending[sent:]
+
+
+class ControlServer:
+    """
+    Serves a control API on a local socket, so scripts and test rigs can
+    drive the recorder without clicking through it. Clients send commands
+    as lines of JSON, {"id": 1, "command": "start", ...}, and get a reply
+    with the same id, {"id": 1, "ok": true, "result": ...} or {"id": 1,
+    "ok": false, "error": "..."}. Events, {"event": "saved", ...}, are
+    sent to every client as they happen.
+
+    A single thread accepts clients and reads their commands. Commands are
+    handed to the UI thread with post and carried out in the order they
+    arrived, so the handler can use the application's state freely.
+    """
+    def __init__(self, address: str, handler: Callable[[str, dict], object],
+                 post: Callable[[Callable[[], None]], None]) -> None:
+        """
+        Initializes a server. Nothing listens until it is started.
+
+        :param address: a port, host:port on this machine or the path of a
+        Unix domain socket.
+        :param handler: called on the UI thread with the command and its
+        arguments, returns the result sent back. Raises ControlError to
+        refuse a command.
+        :param post: runs a callback on the UI thread.
+        """
+        self.address: str = address
+        self.family, self.socket_address = parse_address(address)
+        self.handler: Callable[[str, dict], object] = handler
+        self.post: Callable[[Callable[[], None]], None] = post
+
+        self.clients: set[ControlConnection] = set()
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.thread: Thread | None = None
+        self.listener: socket.socket | None = None
+
+        # written to when a client has messages left to send, so the
+        # server thread starts waiting for its socket to take them
+        self.wakeup: tuple[socket.socket, socket.socket] | None = None
+
+
+    def start(self) -> None:
+        """
+        Start listening in a separate thread.
+
+        :raise OSError: the address is in use.
+        """
+        if self.family == socket.AF_UNIX:
+            self.remove_stale_socket()
+
+        self.listener = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(self.socket_address)
+        self.listener.listen()
+
+        self.wakeup = socket.socketpair()
+        for sock in self.wakeup:
+            sock.setblocking(False)
+
+        self.stopped.clear()
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def remove_stale_socket(self) -> None:
+        """
+        Remove a socket left behind by an earlier run that did not stop.
+        Anything else at the socket's path is left alone.
+
+        :raise OSError: the path is taken by another file, or by the socket
+        of a running server.
+        """
+        try:
+            mode: int = os.stat(self.socket_address).st_mode
+        except FileNotFoundError:
+            return
+
+        in_use: OSError = OSError(errno.EADDRINUSE,
+                                  "the control address is in use",
+                                  self.socket_address)
+        if not stat.S_ISSOCK(mode):
+            raise in_use
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(self.socket_address)
+            except ConnectionRefusedError:
+                # nothing listens on it any more
+                os.remove(self.socket_address)
+                return
+        raise in_use
+
+
+    def stop(self) -> None:
+        """
+        Stop listening, disconnect every client and wait for the server
+        thread to finish.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.family == socket.AF_UNIX and \
+                os.path.exists(self.socket_address):
+            os.remove(self.socket_address)
+
+
+    def broadcast(self, event: str, **fields) -> None:
+        """
+        Send an event to every client.
+
+        :param event: the kind of event.
+        :param fields: the details of the event.
+        """
+        data: bytes = encode({"event": event, **fields})
+        with self.lock:
+            clients: list[ControlConnection] = list(self.clients)
+        for client in clients:
+            self.deliver(client, data)
+
+
+    def deliver(self, client: ControlConnection, data: bytes) -> None:
+        """
+        Send a message to a client without waiting on it.
+
+        :param client: the client.
+        :param data: the message, encoded with encode.
+        """
+        if client.send(data):
+            try:
+                self.wakeup[1].send(b"\0")
+            except OSError:
+                # the server thread has been woken up already
+                pass
+
+
+    def run(self) -> None:
+        """
+        Accept clients and read their commands until stopped.
+        """
+        selector: selectors.BaseSelector = selectors.DefaultSelector()
+        selector.register(self.listener, selectors.EVENT_READ)
+        selector.register(self.wakeup[0], selectors.EVENT_READ)
+
+        while not self.stopped.is_set():
+            # wait for the sockets of clients with messages left to send
+            with self.lock:
+                clients: list[ControlConnection] = list(self.clients)
+            for client in clients:
+                if client.closed:
+                    self.disconnect(selector, client)
+                    continue
+                events: int = selectors.EVENT_READ
+                if client.pending:
+                    events |= selectors.EVENT_WRITE
+                if selector.get_key(client.sock).events != events:
+                    selector.modify(client.sock, events, client)
+
+            for key, events in selector.select(0.1):
+                if key.fileobj is self.wakeup[0]:
+                    try:
+                        while self.wakeup[0].recv(4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+
+                if key.fileobj is self.listener:
+                    sock, _ = self.listener.accept()
+                    if self.family == socket.AF_INET:
+                        # replies and events are small, send them at once
+                        sock.setsockopt(socket.IPPROTO_TCP,
+                                        socket.TCP_NODELAY, 1)
+                    client: ControlConnection = ControlConnection(sock)
+                    with self.lock:
+                        self.clients.add(client)
+                    selector.register(sock, selectors.EVENT_READ, client)
+                    continue
+
+                client = key.data
+                if events & selectors.EVENT_WRITE:
+                    client.flush()
+                if not events & selectors.EVENT_READ:
+                    continue
+
+                try:
+                    data: bytes = key.fileobj.recv(65536)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+
+                if not data or client.closed:
+                    self.disconnect(selector, client)
+                    continue
+
+                client.buffer += data
+                *lines, client.buffer = client.buffer.split(b"\n")
+                for line in lines:
+                    if line.strip():
+                        self.receive(client, line)
+
+        for key in list(selector.get_map().values()):
+            if key.data is not None:
+                self.disconnect(selector, key.data)
+        selector.close()
+        self.listener.close()
+        for sock in self.wakeup:
+            sock.close()
+
+
+    def disconnect(self, selector: selectors.BaseSelector,
+                   client: ControlConnection) -> None:
+        selector.unregister(client.sock)
+        with self.lock:
+            self.clients.discard(client)
+        with client.lock:
+            client.closed = True
+            client.sock.close()
+
+
+    def receive(self, client: ControlConnection, line: bytes) -> None:
+        """
+        Hand a command to the UI thread.
+
+        :param client: the client that sent it.
+        :param line: the command as a line of JSON.
+        """
+        try:
+            message: dict = json.loads(line)
+            if not isinstance(message, dict) or \
+                    not isinstance(message.get("command"), str):
+                raise ValueError("expected an object with a command")
+        except ValueError as error:
+            self.deliver(client, encode({"id": None, "ok": False,
+                                         "error": str(error)}))
+            return
+
+        self.post(lambda: self.execute(client, message))
+
+
+    def execute(self, client: ControlConnection, message: dict) -> None:
+        """
+        Carry out a command and reply to the client. Runs on the UI thread.
+
+        :param client: the client that sent the command.
+        :param message: the command and its arguments.
+        """
+        arguments: dict = {key: value for key, value in message.items()
+                           if key not in ("id", "command")}
+        try:
+            result = self.handler(message["command"], arguments)
+            data: bytes = encode({"id": message.get("id"), "ok": True,
+                                  "result": result})
+        except ControlError as error:
+            data = encode({"id": message.get("id"), "ok": False,
+                           "error": str(error)})
+        except Exception as error:
+            # a failing command, or a result that cannot be sent, must not
+            # leave the client waiting
+            traceback.print_exc()
+            data = encode({"id": message.get("id"), "ok": False,
+                           "error": f"{type(error).__name__}: {error}"})
+
+        self.deliver(client, data)
+
+
+class ControlClient:
+    """
+    Connects to a control server, for scripts driving the recorder. Events
+    that arrive while waiting for a reply are kept for events to return.
+    """
+    def __init__(self, address: str, timeout: float = 10.0) -> None:
+        """
+        Connect to a control server.
+
+        :param address: the address the server listens on.
+        :param timeout: the longest time to wait for a reply in seconds.
+        """
+        family, socket_address = parse_address(address)
+        self.timeout: float = timeout
+        self.sock: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(socket_address)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        self.buffer: bytes = b""
+        self.ids = itertools.count(1)
+        self.pending_events: Queue = Queue()
+
+
+    def __enter__(self) -> "ControlClient":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+    def read(self) -> dict:
+        # a line read partly before a timeout is kept for the next read
+        while b"\n" not in self.buffer:
+            data: bytes = self.sock.recv(65536)
+            if not data:
+                raise ConnectionError("the control server went away")
+            self.buffer += data
+
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line)
+
+
+    def call(self, command: str, **arguments):
+        """
+        Send a command and wait for its reply.
+
+        :param command: the command.
+        :param arguments: the arguments of the command.
+        :return: the result of the command.
+        :raise ControlError: the command was refused.
+        """
+        number: int = next(self.ids)
+        self.sock.sendall(json.dumps({"id": number, "command": command,
+                                      **arguments}).encode() + b"\n")
+        while True:
+            message: dict = self.read()
+            if "event" in message:
+                self.pending_events.put(message)
+            elif message.get("id") in (number, None):
+                if not message["ok"]:
+                    raise ControlError(message["error"])
+                return message["result"]
+
+
+    def events(self, timeout: float | None = None):
+        """
+        Yield the events received so far, then every event as it arrives.
+
+        :param timeout: stop after this many seconds without an event, wait
+        forever if None.
+        """
+        try:
+            while True:
+                yield self.pending_events.get_nowait()
+        except Empty:
+            pass
+
+        while True:
+            # a call made between events waits with the usual timeout
+            self.sock.settimeout(timeout)
+            try:
+                message: dict = self.read()
+            except socket.timeout:
+                return
+            finally:
+                self.sock.settimeout(self.timeout)
+            if "event" in message:
+                yield message
+
+
+def main() -> None:
+    """
+    Send a command to a running recorder from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Control a running voice recorder.")
+    parser.add_argument("address",
+                        help="the port or socket path the recorder listens on")
+    parser.add_argument("command", nargs="?",
+                        help="start, pause, stop, save, discard, play, "
+                        "stop_playback, list, delete or state")
+    parser.add_argument("arguments", nargs="?", default="{}",
+                        help="the arguments of the command as a JSON object")
+    parser.add_argument("--follow", action="store_true",
+                        help="print events until interrupted")
+    args = parser.parse_args()
+
+    with ControlClient(args.address) as client:
+        if args.command:
+            try:
+                print(json.dumps(client.call(args.command,
+                                             **json.loads(args.arguments)),
+                                 indent=1))
+            except ControlError as error:
+                parser.exit(1, f"error: {error}\n")
+
+        if args.follow:
+            try:
+                for event in client.events():
+                    print(json.dumps(event))
+            except KeyboardInterrupt:
+                pass
+
+
+if __name__ == "__main__":
+    main()
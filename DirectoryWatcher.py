@@ -0,0 +1,285 @@
+from threading import Thread, Event
+from typing import Callable
+import ctypes, ctypes.util, os, select, struct, sys
+
+
+# (inode, modification time, size) of every file in a folder
+Snapshot = dict[str, tuple[int, int, int]]
+
+# ("added", name), ("removed", name), ("modified", name) or
+# ("renamed", old_name, new_name)
+Change = tuple[str, ...]
+
+
+def file_state(entry: os.DirEntry) -> tuple[int, int, int]:
+    """
+    Get the state of a file that is compared between snapshots.
+
+    :param entry: the file's directory entry.
+    :return: the inode, modification time and size of the file.
+    """
+    stat: os.stat_result = entry.stat()
+    return entry.inode(), stat.st_mtime_ns, stat.st_size
+
+
+def take_snapshot(folder: str,
+                  include: Callable[[str], bool] = lambda name: True) \
+        -> Snapshot:
+    """
+    Record the state of every file in a folder.
+
+    :param folder: the folder.
+    :param include: decides which file names are recorded.
+    :return: the snapshot of the folder.
+    """
+    with os.scandir(folder) as entries:
+        return {entry.name: file_state(entry) for entry in entries
+                if include(entry.name) and entry.is_file()}
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> list[Change]:
+    """
+    Find the changes between two snapshots of a folder. A file that
+    disappeared and a file that appeared with the same inode and size are
+    reported as a rename.
+
+    :param old: the earlier snapshot.
+    :param new: the later snapshot.
+    :return: the changes, in no particular order.
+    """
+    removed: set[str] = old.keys() - new.keys()
+    added: set[str] = new.keys() - old.keys()
+    changes: list[Change] = []
+
+    # match up renamed files by inode and size
+    appeared: dict[tuple[int, int], str] = {
+        (new[name][0], new[name][2]): name for name in added if new[name][0]
+    }
+    for name in removed:
+        match: str | None = appeared.pop((old[name][0], old[name][2]), None)
+        if match is None:
+            changes.append(("removed", name))
+        else:
+            changes.append(("renamed", name, match))
+            added.discard(match)
+
+    changes.extend(("added", name) for name in added)
+    changes.extend(("modified", name) for name in old.keys() & new.keys()
+                   if old[name] != new[name])
+    return changes
+
+
+class Inotify:
+    """
+    A minimal binding to the Linux inotify api, reporting the names of files
+    that changed in a single folder.
+    """
+    CREATE: int = 0x100
+    DELETE: int = 0x200
+    MOVED_FROM: int = 0x40
+    MOVED_TO: int = 0x80
+    CLOSE_WRITE: int = 0x8
+    Q_OVERFLOW: int = 0x4000
+    NONBLOCK: int = 0o4000
+    CLOEXEC: int = 0o2000000
+
+    EVENT: struct.Struct = struct.Struct("iIII")
+
+    def __init__(self, folder: str) -> None:
+        """
+        Start watching a folder.
+
+        :param folder: the folder to watch.
+        :raise OSError: inotify is not available.
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on linux")
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd: int = libc.inotify_init1(self.NONBLOCK | self.CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask: int = self.CREATE | self.DELETE | self.MOVED_FROM | \
+            self.MOVED_TO | self.CLOSE_WRITE
+        if libc.inotify_add_watch(self.fd, os.fsencode(folder), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+        # set once the kernel has dropped events because too many queued up,
+        # the folder has to be rescanned to know what changed
+        self.overflowed: bool = False
+
+
+    def read(self, timeout: float) -> set[str]:
+        """
+        Wait for changes. Sets overflowed if events were lost.
+
+        :param timeout: the longest time to wait in seconds.
+        :return: the names of the files that changed, empty on a timeout.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        try:
+            data: bytes = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return set()
+
+        names: set[str] = set()
+        offset: int = 0
+        while offset < len(data):
+            _, event_mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            if event_mask & self.Q_OVERFLOW:
+                self.overflowed = True
+            name: bytes = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+
+        return names
+
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Reports additions, removals, renames and modifications in a folder from
+    a background thread, by keeping a snapshot of the folder and diffing it.
+    inotify is used to find out what changed where it is available, and the
+    folder is rescanned if inotify drops events. Otherwise the folder is
+    rescanned every poll.
+    """
+    def __init__(self, folder: str, callback: Callable[[list[Change]], None],
+                 include: Callable[[str], bool] = lambda name: True,
+                 interval: float = 1.0) -> None:
+        """
+        Initializes a watcher. Nothing is watched until it is started.
+
+        :param folder: the folder to watch.
+        :param callback: called from the watcher thread with every batch of
+        changes.
+        :param include: decides which file names are watched.
+        :param interval: seconds between polls when inotify is unavailable.
+        """
+        self.folder: str = folder
+        self.callback: Callable[[list[Change]], None] = callback
+        self.include: Callable[[str], bool] = include
+        self.interval: float = interval
+
+        self.snapshot: Snapshot = {}
+        self.stopped: Event = Event()
+        self.thread: Thread | None = None
+
+
+    def start(self, snapshot: Snapshot | None = None) -> None:
+        """
+        Start watching in a separate thread.
+
+        :param snapshot: the known state of the folder, taken now if None.
+        """
+        self.snapshot = snapshot if snapshot is not None else \
+            take_snapshot(self.folder, self.include)
+        self.stopped.clear()
+
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self) -> None:
+        """
+        Stop watching and wait for the watcher thread to finish.
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+    def run(self) -> None:
+        """
+        Watch the folder until the watcher is stopped.
+        """
+        try:
+            inotify: Inotify | None = Inotify(self.folder)
+        except (OSError, AttributeError):
+            inotify = None
+
+        try:
+            if inotify is not None:
+                self.watch_events(inotify)
+            else:
+                self.poll()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+
+    def watch_events(self, inotify: Inotify) -> None:
+        """
+        Update the snapshot for the files inotify reports as changed.
+
+        :param inotify: the inotify watch on the folder.
+        """
+        while not self.stopped.is_set():
+            names: set[str] = inotify.read(0.2)
+
+            # gather the events of a burst, such as both halves of a rename
+            while names and len(more := inotify.read(0.05)):
+                names |= more
+
+            if inotify.overflowed:
+                # events were lost, so compare the whole folder
+                inotify.overflowed = False
+                try:
+                    self.publish(take_snapshot(self.folder, self.include))
+                except FileNotFoundError:
+                    pass
+                continue
+
+            names = {name for name in names if self.include(name)}
+            if not names:
+                continue
+
+            updated: Snapshot = {name: state for name, state
+                                 in self.snapshot.items() if name not in names}
+            for name in names:
+                try:
+                    stat: os.stat_result = os.stat(
+                        os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    continue
+                updated[name] = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+            self.publish(updated)
+
+
+    def poll(self) -> None:
+        """
+        Rescan the folder every interval. The folder's own modification
+        time only changes when files are added, removed or renamed, so the
+        files' modification times and sizes are compared every time to
+        notice files written in place.
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.publish(take_snapshot(self.folder, self.include))
+            except FileNotFoundError:
+                continue
+
+
+    def publish(self, snapshot: Snapshot) -> None:
+        """
+        Replace the snapshot and report the differences.
+
+        :param snapshot: the new snapshot of the folder.
+        """
+        changes: list[Change] = diff_snapshots(self.snapshot, snapshot)
+        self.snapshot = snapshot
+        if changes:
+            self.callback(changes)
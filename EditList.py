@@ -0,0 +1,222 @@
+from bisect import bisect_right
+
+from AudioStream import from_pcm, to_pcm
+from MetadataStore import load_metadata, update_metadata
+
+
+class EditList:
+    """
+    The non-destructive edits of a recording: a trimmed span, regions cut
+    out of it and a gain. Times are seconds in the original recording. The
+    list is stored in the recording's metadata, the audio file is never
+    changed.
+    """
+    def __init__(self, trim_in: float = 0.0, trim_out: float | None = None,
+                 cuts: list[tuple[float, float]] | None = None,
+                 gain_db: float = 0.0) -> None:
+        """
+        Initializes an edit list.
+
+        :param trim_in: where the edited recording starts.
+        :param trim_out: where the edited recording ends, None for the end
+        of the original.
+        :param cuts: the (start, end) regions left out, regions that do not
+        end after they start are dropped.
+        :param gain_db: the change in level of the edited recording.
+        """
+        self.trim_in: float = trim_in
+        self.trim_out: float | None = trim_out
+        self.cuts: list[tuple[float, float]] = [tuple(cut)
+                                                for cut in cuts or []
+                                                if cut[1] > cut[0]]
+        self.gain_db: float = gain_db
+
+
+    def __bool__(self) -> bool:
+        return bool(self.trim_in or self.trim_out is not None or self.cuts or
+                    self.gain_db)
+
+
+    def to_dict(self) -> dict:
+        """
+        Convert the edits to their stored form.
+
+        :return: the edits, an empty dict if there are none.
+        """
+        if not self:
+            return {}
+        return {"trim_in": self.trim_in, "trim_out": self.trim_out,
+                "cuts": [list(cut) for cut in self.cuts],
+                "gain_db": self.gain_db}
+
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "EditList":
+        """
+        Create an edit list from its stored form.
+
+        :param data: the stored edits.
+        :return: the edit list.
+        """
+        return cls(data.get("trim_in", 0.0), data.get("trim_out"),
+                   data.get("cuts"), data.get("gain_db", 0.0))
+
+
+    @classmethod
+    def load(cls, recording: str) -> "EditList":
+        """
+        Load the edits of a recording.
+
+        :param recording: the recording's file name.
+        :return: the edit list, empty if the recording was never edited.
+        """
+        return cls.from_dict(load_metadata(recording).get("edits") or {})
+
+
+    def save(self, recording: str) -> None:
+        """
+        Store the edits of a recording.
+
+        :param recording: the recording's file name.
+        """
+        update_metadata(recording, edits=self.to_dict())
+
+
+    def segments(self, frames: int, rate: int) -> list[tuple[int, int]]:
+        """
+        Find the spans of the original recording that are kept.
+
+        :param frames: the length of the original recording in frames.
+        :param rate: the sample rate of the recording.
+        :return: the (start, end) frames of every kept span, in order.
+        """
+        def frame(time: float) -> int:
+            return min(max(round(time * rate), 0), frames)
+
+        start: int = frame(self.trim_in)
+        end: int = frames if self.trim_out is None else frame(self.trim_out)
+
+        segments: list[tuple[int, int]] = []
+        for cut_start, cut_end in sorted((frame(first), frame(last))
+                                         for first, last in self.cuts):
+            # a reversed cut would step back and repeat audio
+            if cut_end <= cut_start:
+                continue
+            if cut_start > start:
+                segments.append((start, min(cut_start, end)))
+            start = max(start, cut_end)
+        segments.append((start, end))
+
+        return [(first, last) for first, last in segments if last > first]
+
+
+class EditedReader:
+    """
+    Reads a recording through its edit list, rendering the edits as the
+    audio is read. Positions in the edited recording are mapped to the
+    original through the kept spans, so opening and seeking cost nothing
+    however long the recording is.
+    """
+    def __init__(self, reader, edits: EditList) -> None:
+        """
+        Initializes an edited view of an open recording.
+
+        :param reader: an open wave reader, or anything with the same
+        interface.
+        :param edits: the edits to render.
+        """
+        self.reader = reader
+        self.scale: float = 10 ** (edits.gain_db / 20)
+        self.segments: list[tuple[int, int]] = edits.segments(
+            reader.getnframes(), reader.getframerate())
+
+        # the edited position each kept span starts at
+        self.starts: list[int] = []
+        length: int = 0
+        for start, end in self.segments:
+            self.starts.append(length)
+            length += end - start
+
+        self.frames: int = length
+        self.position: int = 0
+
+
+    def __enter__(self) -> "EditedReader":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        self.reader.close()
+
+
+    def getnchannels(self) -> int:
+        return self.reader.getnchannels()
+
+
+    def getsampwidth(self) -> int:
+        return self.reader.getsampwidth()
+
+
+    def getframerate(self) -> int:
+        return self.reader.getframerate()
+
+
+    def getnframes(self) -> int:
+        return self.frames
+
+
+    def getparams(self) -> tuple:
+        return (self.getnchannels(), self.getsampwidth(), self.getframerate(),
+                self.frames, "NONE", "not compressed")
+
+
+    def tell(self) -> int:
+        return self.position
+
+
+    def setpos(self, position: int) -> None:
+        if not 0 <= position <= self.frames:
+            raise ValueError("position not in range")
+        self.position = position
+
+
+    def rewind(self) -> None:
+        self.position = 0
+
+
+    def readframes(self, frames: int) -> bytes:
+        """
+        Read the next frames of the edited recording.
+
+        :param frames: the number of frames to read.
+        :return: the PCM audio, shorter at the end of the recording.
+        """
+        chunks: list[bytes] = []
+        frame_size: int = self.getnchannels() * self.getsampwidth()
+
+        while frames > 0 and self.position < self.frames:
+            index: int = bisect_right(self.starts, self.position) - 1
+            start, end = self.segments[index]
+            source: int = start + self.position - self.starts[index]
+
+            if self.reader.tell() != source:
+                self.reader.setpos(source)
+
+            data: bytes = self.reader.readframes(min(frames, end - source))
+            if not data:
+                break
+
+            chunks.append(data)
+            frames -= len(data) // frame_size
+            self.position += len(data) // frame_size
+
+        data = b"".join(chunks)
+        if self.scale != 1.0 and data:
+            data = to_pcm(from_pcm(data, self.getsampwidth(),
+                                   self.getnchannels()) * self.scale,
+                          self.getsampwidth())
+        return data
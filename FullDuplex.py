@@ -0,0 +1,199 @@
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+import os
+
+from AudioStream import to_pcm, convert_channels, Resampler
+from AudioStream import read_blocks
+from EditList import EditList, EditedReader
+from StorageCodecs import open_recording
+
+
+# PortAudio flags, as exported by pyaudio
+PA_CONTINUE: int = 0
+
+
+class DuplexSession:
+    """
+    Plays a reference recording while recording, through a single
+    full-duplex stream. Every callback hands over a recorded buffer and
+    takes the next buffer to play, so capture and playback run on the same
+    clock and never drift apart, and a pause halts both at the same frame.
+
+    Sound played through the output reaches the input one round trip later,
+    so a take played along to the reference is late by the round trip
+    latency. The latency is measured from the stream's buffer timestamps
+    and recorded so the take can be shifted back into line.
+    """
+    def __init__(self, audio, reference: str, rate: int = 44100,
+                 frames_per_buffer: int = 1024,
+                 latency: float | None = None) -> None:
+        """
+        Open the duplex stream. Nothing is played or recorded until started.
+
+        :param audio: the pyaudio.PyAudio instance to open the stream with.
+        :param reference: the path of the recording played back, with its
+        edits applied.
+        :param rate: the sample rate of the stream.
+        :param frames_per_buffer: the number of frames per callback.
+        :param latency: the calibrated round trip latency in seconds, taken
+        from the stream if None.
+        """
+        self.reference: str = reference
+        self.rate: int = rate
+        self.calibrated_latency: float | None = latency
+
+        # the reference, decoded ahead of time into mono 16 bit blocks
+        self.playback: Queue = Queue(maxsize=32)
+        self.playback_buffer: bytes = b""
+        self.playback_done: bool = False
+        self.underruns: int = 0
+
+        self.captured: Queue = Queue()
+        self.paused: bool = True
+        self.stopped: Event = Event()
+        self.measured_latency: float | None = None
+
+        self.prefetch_thread: Thread = Thread(target=self.prefetch)
+        self.prefetch_thread.daemon = True
+
+        self.stream = audio.open(format=audio.get_format_from_width(2),
+                                 channels=1, rate=rate, input=True,
+                                 output=True,
+                                 frames_per_buffer=frames_per_buffer,
+                                 stream_callback=self.callback, start=False)
+
+
+    @property
+    def latency(self) -> float:
+        """
+        The round trip latency in seconds: calibrated, measured from the
+        stream's timestamps, or reported by the stream, in that order.
+        """
+        if self.calibrated_latency is not None:
+            return self.calibrated_latency
+        if self.measured_latency is not None:
+            return self.measured_latency
+        return self.stream.get_input_latency() + \
+            self.stream.get_output_latency()
+
+
+    def prefetch(self) -> None:
+        """
+        Decode the reference recording ahead of playback. Runs on its own
+        thread so the callback never touches the disk.
+        """
+        reader = open_recording(self.reference)
+        edits: EditList = EditList.load(os.path.basename(self.reference))
+        if edits:
+            reader = EditedReader(reader, edits)
+
+        with reader:
+            resampler: Resampler = Resampler(reader.getframerate(), self.rate)
+            for block in read_blocks(reader, 4096):
+                if not self.queue_playback(to_pcm(
+                        resampler.process(convert_channels(block, 1)), 2)):
+                    return
+
+        # an empty block marks the end of the reference
+        self.queue_playback(b"")
+
+
+    def queue_playback(self, data: bytes) -> bool:
+        """
+        Wait for room in the playback queue, unless the session is stopped,
+        as nothing empties the queue any more then.
+
+        :param data: the block to queue.
+        :return: whether the block was queued.
+        """
+        while not self.stopped.is_set():
+            try:
+                self.playback.put(data, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+
+    def callback(self, data: bytes, frame_count: int, time_info: dict,
+                 status: int) -> tuple[bytes, int]:
+        """
+        Exchange a recorded buffer for the next buffer to play. Runs on
+        PortAudio's callback thread.
+        """
+        size: int = frame_count * 2
+        if self.paused:
+            return bytes(size), PA_CONTINUE
+
+        if self.measured_latency is None:
+            # the input buffer was recorded at its adc time, the output
+            # buffer handed back now is heard at its dac time
+            adc: float = time_info.get("input_buffer_adc_time", 0.0)
+            dac: float = time_info.get("output_buffer_dac_time", 0.0)
+            if adc > 0 and dac > adc:
+                self.measured_latency = dac - adc
+
+        self.captured.put(data)
+
+        while len(self.playback_buffer) < size and not self.playback_done:
+            try:
+                block: bytes = self.playback.get_nowait()
+            except Empty:
+                self.underruns += 1
+                break
+            if not block:
+                self.playback_done = True
+            self.playback_buffer += block
+
+        output: bytes = self.playback_buffer[:size]
+        self.playback_buffer = self.playback_buffer[size:]
+        return output + bytes(size - len(output)), PA_CONTINUE
+
+
+    def start(self) -> None:
+        """
+        Start playing and recording.
+        """
+        self.prefetch_thread.start()
+
+        # give playback a head start before the first callback
+        while self.playback.qsize() < 4 and self.prefetch_thread.is_alive():
+            self.stopped.wait(0.005)
+
+        self.paused = False
+        self.stream.start_stream()
+
+
+    def pause(self) -> None:
+        self.paused = True
+
+
+    def resume(self) -> None:
+        self.paused = False
+
+
+    def read(self, timeout: float = 0.1) -> bytes:
+        """
+        Get the next recorded buffer.
+
+        :param timeout: the longest time to wait in seconds.
+        :return: 16 bit mono PCM audio, empty if nothing was recorded in
+        time.
+        """
+        try:
+            return self.captured.get(timeout=timeout)
+        except Empty:
+            return b""
+
+
+    def stop(self) -> None:
+        """
+        Stop playing and recording, and close the stream.
+        """
+        self.paused = True
+        self.stopped.set()
+        self.stream.stop_stream()
+        self.stream.close()
+        if self.prefetch_thread.is_alive():
+            self.prefetch_thread.join()
+
@@ -0,0 +1,422 @@
+from threading import Event
+from typing import Callable
+import argparse, json, os, time
+
+import numpy as np
+
+from MetadataStore import METADATA_FOLDER
+
+
+CALIBRATION_PATH: str = os.path.join(METADATA_FOLDER, "calibration.json")
+
+# PortAudio flags, as exported by pyaudio
+PA_CONTINUE: int = 0
+PA_COMPLETE: int = 1
+PA_XRUN: int = 0x1 | 0x2 | 0x4 | 0x8 # input underflow/overflow, output too
+
+
+# the longest round trip looked for by default in seconds, enough for most
+# bluetooth and large-buffer usb devices
+MAX_LATENCY: float = 0.5
+
+
+class CalibrationError(Exception):
+    """
+    Raised when the test signal could not be found in the recorded audio.
+    """
+
+
+def chirp(rate: int, duration: float = 0.05, low: float = 200.0,
+          high: float = 8000.0) -> np.ndarray:
+    """
+    Create a windowed logarithmic sweep, which has a single sharp peak in
+    its autocorrelation.
+
+    :param rate: the sample rate.
+    :param duration: the length of the sweep in seconds.
+    :param low: the start frequency.
+    :param high: the end frequency.
+    :return: the sweep, with values in [-0.5, 0.5].
+    """
+    times: np.ndarray = np.arange(round(duration * rate)) / rate
+    growth: float = np.log(high / low)
+    phase: np.ndarray = 2 * np.pi * low * duration / growth * \
+        (np.exp(times / duration * growth) - 1)
+    return 0.5 * np.sin(phase) * np.hanning(len(times))
+
+
+def test_signal(rate: int, repeats: int = 8, interval: float = 0.25) \
+        -> tuple[np.ndarray, np.ndarray, list[int]]:
+    """
+    Create a test signal of sweeps separated by silence.
+
+    :param rate: the sample rate.
+    :param repeats: the number of sweeps.
+    :param interval: seconds between the starts of the sweeps.
+    :return: the signal, the sweep and the frame every sweep starts at.
+    """
+    sweep: np.ndarray = chirp(rate)
+    step: int = round(interval * rate)
+    starts: list[int] = [round(0.1 * rate) + number * step
+                         for number in range(repeats)]
+
+    signal: np.ndarray = np.zeros(starts[-1] + step)
+    for start in starts:
+        signal[start:start + len(sweep)] = sweep
+    return signal, sweep, starts
+
+
+def find_delays(recorded: np.ndarray, sweep: np.ndarray, starts: list[int],
+                window: int, min_clarity: float = 8.0) -> np.ndarray:
+    """
+    Find how late every sweep arrived, by cross-correlating the recording
+    with the sweep.
+
+    :param recorded: the recorded audio.
+    :param sweep: the sweep that was played.
+    :param starts: the frames the sweeps were played at.
+    :param window: the longest delay looked for, in frames.
+    :param min_clarity: how far a correlation peak must stand out from the
+    rest of its window.
+    :return: the delay of every sweep in frames.
+    :raise CalibrationError: a sweep was not found in the recording.
+    """
+    size: int = len(recorded) + len(sweep)
+    correlation: np.ndarray = np.fft.irfft(
+        np.fft.rfft(recorded, size) * np.conj(np.fft.rfft(sweep, size)),
+        size)[:len(recorded)]
+    correlation = np.abs(correlation)
+
+    delays: list[int] = []
+    for start in starts:
+        span: np.ndarray = correlation[start:start + window]
+        if not len(span):
+            raise CalibrationError("the recording ended too early")
+
+        peak: int = int(np.argmax(span))
+        if span[peak] < min_clarity * (np.median(span) + 1e-12):
+            # a sweep arriving after its window stands out in the rest of
+            # the recording
+            rest: np.ndarray = correlation[start + window:]
+            if len(rest) and rest.max() >= min_clarity * (np.median(span) +
+                                                          1e-12):
+                raise CalibrationError(
+                    f"the latency exceeds the measurable window of "
+                    f"{window} frames, allow a longer maximum latency")
+            raise CalibrationError("test signal not found, connect the "
+                                   "output to the input")
+        delays.append(peak)
+
+    return np.array(delays)
+
+
+class PyAudioLoopback:
+    """
+    Plays audio and records it back through a full-duplex stream, on real
+    devices wired or placed so the output reaches the input.
+    """
+    def __init__(self, audio, input_device: int | None = None,
+                 output_device: int | None = None) -> None:
+        """
+        Initializes a loopback over a pair of devices.
+
+        :param audio: the pyaudio.PyAudio instance to open streams with.
+        :param input_device: the index of the input device, None for the
+        default.
+        :param output_device: the index of the output device, None for the
+        default.
+        """
+        self.audio = audio
+        self.input_device: int | None = input_device
+        self.output_device: int | None = output_device
+
+
+    def play_and_record(self, signal: np.ndarray, rate: int,
+                        frames_per_buffer: int) -> tuple[np.ndarray, int]:
+        """
+        Play a signal and record at the same time.
+
+        :param signal: the mono signal to play.
+        :param rate: the sample rate.
+        :param frames_per_buffer: the number of frames per callback.
+        :return: the recorded audio, as long as the signal, and the number
+        of buffers with an underflow or overflow.
+        """
+        pcm: bytes = (np.clip(signal, -1, 1) * 32767).astype("<i2").tobytes()
+        recorded: list[bytes] = []
+        xruns: list[int] = [0]
+        done: Event = Event()
+        position: list[int] = [0]
+
+        def callback(data: bytes, frame_count: int, time_info: dict,
+                     status: int) -> tuple[bytes, int]:
+            recorded.append(data)
+            if status & PA_XRUN:
+                xruns[0] += 1
+
+            start: int = position[0] * 2
+            output: bytes = pcm[start:start + frame_count * 2]
+            position[0] += frame_count
+            if position[0] >= len(signal):
+                done.set()
+                return output + bytes(frame_count * 2 - len(output)), \
+                    PA_COMPLETE
+            return output, PA_CONTINUE
+
+        stream = self.audio.open(format=self.audio.get_format_from_width(2),
+                                 channels=1, rate=rate, input=True,
+                                 output=True,
+                                 input_device_index=self.input_device,
+                                 output_device_index=self.output_device,
+                                 frames_per_buffer=frames_per_buffer,
+                                 stream_callback=callback)
+        done.wait(len(signal) / rate + 5.0)
+        stream.stop_stream()
+        stream.close()
+
+        audio: np.ndarray = np.frombuffer(b"".join(recorded), dtype="<i2")
+        return audio[:len(signal)] / 32768.0, xruns[0]
+
+
+class SimulatedLoopback:
+    """
+    A loopback without any audio hardware, for testing: the played signal
+    comes back delayed by a fixed latency, plus the time the audio spends
+    in two buffers, random jitter and some noise.
+    """
+    def __init__(self, latency: float = 0.02, jitter: float = 0.0005,
+                 noise: float = 0.01, xrun_below: int = 512,
+                 seed: int | None = None) -> None:
+        """
+        Initializes a simulated loopback.
+
+        :param latency: the fixed part of the round trip in seconds.
+        :param jitter: the standard deviation of the round trip in seconds.
+        :param noise: the level of the noise added to the recording.
+        :param xrun_below: buffers smaller than this report xruns.
+        :param seed: seeds the random jitter and noise.
+        """
+        self.latency: float = latency
+        self.jitter: float = jitter
+        self.noise: float = noise
+        self.xrun_below: int = xrun_below
+        self.random: np.random.Generator = np.random.default_rng(seed)
+
+
+    def play_and_record(self, signal: np.ndarray, rate: int,
+                        frames_per_buffer: int) -> tuple[np.ndarray, int]:
+        """
+        Pretend to play a signal and record it back.
+
+        :param signal: the mono signal to play.
+        :param rate: the sample rate.
+        :param frames_per_buffer: the number of frames per callback.
+        :return: the recorded audio, as long as the signal, and the number
+        of buffers with an underflow or overflow.
+        """
+        recorded: np.ndarray = self.random.normal(0, self.noise, len(signal))
+
+        # every stretch of sound arrives with its own share of jitter
+        sounding: np.ndarray = np.flatnonzero(np.diff(
+            np.r_[0, (signal != 0).astype(np.int8), 0]))
+        for start, end in zip(sounding[::2], sounding[1::2]):
+            delay: int = round((self.latency + 2 * frames_per_buffer / rate +
+                                self.random.normal(0, self.jitter)) * rate)
+            target: int = start + max(delay, 0)
+            length: int = max(min(end, len(signal) - target + start) - start, 0)
+            recorded[target:target + length] += 0.5 * signal[start:start +
+                                                              length]
+
+        xruns: int = len(signal) // frames_per_buffer \
+            if frames_per_buffer < self.xrun_below else 0
+        return recorded, xruns
+
+
+def measure_latency(loopback, rate: int = 44100,
+                    frames_per_buffer: int = 1024, repeats: int = 8,
+                    max_latency: float = MAX_LATENCY) -> dict:
+    """
+    Measure the round trip latency of a loopback at one buffer size.
+
+    :param loopback: a PyAudioLoopback, SimulatedLoopback or anything with
+    the same play_and_record method.
+    :param rate: the sample rate.
+    :param frames_per_buffer: the number of frames per callback.
+    :param repeats: the number of sweeps measured.
+    :param max_latency: the longest round trip looked for in seconds, the
+    sweeps are spaced further apart than this so each is found in its own
+    window.
+    :return: the mean "latency" and the "jitter" (standard deviation) in
+    seconds, the "frames_per_buffer" and the number of "xruns".
+    :raise CalibrationError: the test signal did not come back, or not
+    within max_latency.
+    """
+    signal, sweep, starts = test_signal(rate, repeats, max_latency + 0.1)
+    recorded, xruns = loopback.play_and_record(signal, rate,
+                                               frames_per_buffer)
+
+    window: int = starts[1] - starts[0] if len(starts) > 1 else len(signal)
+    delays: np.ndarray = find_delays(recorded, sweep, starts, window) / rate
+
+    return {"latency": float(delays.mean()), "jitter": float(delays.std()),
+            "frames_per_buffer": frames_per_buffer, "xruns": xruns}
+
+
+def calibrate(loopback, rate: int = 44100,
+              buffer_sizes: tuple[int, ...] = (256, 512, 1024, 2048),
+              max_jitter: float = 0.002,
+              progress: Callable[[float], None] | None = None,
+              max_latency: float = MAX_LATENCY) -> dict:
+    """
+    Measure a loopback at several buffer sizes and recommend one: the
+    smallest that had no underflows or overflows and little jitter.
+
+    :param loopback: the loopback to measure.
+    :param rate: the sample rate.
+    :param buffer_sizes: the buffer sizes to try.
+    :param max_jitter: the most jitter, in seconds, a recommended buffer
+    size may have.
+    :param progress: called with the fraction of the buffer sizes measured.
+    :param max_latency: the longest round trip looked for in seconds.
+    :return: the measurement of the recommended buffer size, with the
+    measurements of every size under "measurements".
+    :raise CalibrationError: no buffer size could be measured.
+    """
+    measurements: list[dict] = []
+    failure: CalibrationError | None = None
+    for number, frames_per_buffer in enumerate(buffer_sizes, 1):
+        try:
+            measurements.append(measure_latency(
+                loopback, rate, frames_per_buffer, max_latency=max_latency))
+        except CalibrationError as error:
+            failure = error
+
+        if progress is not None:
+            progress(number / len(buffer_sizes))
+
+    if not measurements:
+        raise failure or CalibrationError("no buffer sizes to measure")
+
+    stable: list[dict] = [measurement for measurement in measurements
+                          if not measurement["xruns"] and
+                          measurement["jitter"] <= max_jitter]
+    recommended: dict = min(stable, key=lambda m: m["frames_per_buffer"]) \
+        if stable else min(measurements, key=lambda m: (m["xruns"],
+                                                        m["jitter"]))
+
+    return {**recommended, "rate": rate, "measured": time.time(),
+            "measurements": measurements}
+
+
+def device_key(input_device: int | None, output_device: int | None) -> str:
+    """
+    Get the key a calibration is stored under.
+
+    :param input_device: the index of the input device, None for default.
+    :param output_device: the index of the output device, None for default.
+    :return: the key of the device pair.
+    """
+    return f"{'default' if input_device is None else input_device}->" \
+        f"{'default' if output_device is None else output_device}"
+
+
+def load_calibration(input_device: int | None = None,
+                     output_device: int | None = None,
+                     path: str = CALIBRATION_PATH) -> dict | None:
+    """
+    Load the stored calibration of a pair of devices.
+
+    :param input_device: the index of the input device, None for default.
+    :param output_device: the index of the output device, None for default.
+    :param path: where calibrations are stored.
+    :return: the calibration, None if the devices were never calibrated.
+    """
+    try:
+        with open(path, "r") as calibration_file:
+            calibrations: dict = json.load(calibration_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    return calibrations.get(device_key(input_device, output_device))
+
+
+def save_calibration(calibration: dict, input_device: int | None = None,
+                     output_device: int | None = None,
+                     path: str = CALIBRATION_PATH) -> None:
+    """
+    Store the calibration of a pair of devices, replacing an earlier one.
+
+    :param calibration: the result of calibrate.
+    :param input_device: the index of the input device, None for default.
+    :param output_device: the index of the output device, None for default.
+    :param path: where calibrations are stored.
+    """
+    try:
+        with open(path, "r") as calibration_file:
+            calibrations: dict = json.load(calibration_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        calibrations = {}
+    calibrations[device_key(input_device, output_device)] = calibration
+
+    folder: str = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    with open(f"{path}.tmp", "w") as calibration_file:
+        json.dump(calibrations, calibration_file, indent=1)
+    os.replace(f"{path}.tmp", path)
+
+
+def main() -> None:
+    """
+    Calibrate from the command line, on real devices or a simulated
+    loopback.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure the round trip latency of an audio loopback.")
+    parser.add_argument("--input", type=int, default=None,
+                        help="input device index, the default device if "
+                        "left out")
+    parser.add_argument("--output", type=int, default=None,
+                        help="output device index, the default device if "
+                        "left out")
+    parser.add_argument("--rate", type=int, default=44100)
+    parser.add_argument("--simulate", type=float, metavar="LATENCY",
+                        help="measure a simulated loopback with the given "
+                        "latency in seconds instead of real devices")
+    parser.add_argument("--max-latency", type=float, default=MAX_LATENCY,
+                        metavar="SECONDS",
+                        help="the longest round trip looked for")
+    parser.add_argument("--save", action="store_true",
+                        help="store the calibration for the devices")
+    args = parser.parse_args()
+
+    try:
+        if args.simulate is not None:
+            loopback = SimulatedLoopback(args.simulate, seed=0)
+            result: dict = calibrate(loopback, args.rate,
+                                     max_latency=args.max_latency)
+        else:
+            import pyaudio
+
+            audio = pyaudio.PyAudio()
+            try:
+                result = calibrate(PyAudioLoopback(audio, args.input,
+                                                   args.output),
+                                   args.rate, max_latency=args.max_latency)
+            finally:
+                audio.terminate()
+    except CalibrationError as error:
+        parser.exit(1, f"error: {error}\n")
+
+    for measurement in result["measurements"]:
+        print(f"{measurement['frames_per_buffer']:>5} frames: "
+              f"{measurement['latency'] * 1000:7.2f} ms round trip, "
+              f"{measurement['jitter'] * 1000:5.2f} ms jitter, "
+              f"{measurement['xruns']} xruns")
+    print(f"recommended buffer: {result['frames_per_buffer']} frames, "
+          f"{result['latency'] * 1000:.2f} ms round trip")
+
+    if args.save:
+        save_calibration(result, args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
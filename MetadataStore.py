@@ -0,0 +1,82 @@
+import json, os
+
+
+METADATA_FOLDER: str = "audio_metadata"
+
+
+def metadata_path(recording: str) -> str:
+    """
+    Get the location of the metadata file belonging to a recording.
+
+    :param recording: the recording's file name.
+    :return: the path of the recording's metadata file.
+    """
+    return f"{METADATA_FOLDER}/{recording}.json"
+
+
+def load_metadata(recording: str) -> dict:
+    """
+    Load the metadata stored for a recording.
+
+    :param recording: the recording's file name.
+    :return: the stored metadata, an empty dict if there is none.
+    """
+    try:
+        with open(metadata_path(recording), "r") as metadata_file:
+            return json.load(metadata_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_metadata(recording: str, metadata: dict) -> None:
+    """
+    Store the metadata of a recording, replacing any existing metadata.
+
+    :param recording: the recording's file name.
+    :param metadata: the metadata to be stored.
+    """
+    os.makedirs(METADATA_FOLDER, exist_ok=True)
+
+    # write to a temporary file first so a crash never leaves half a file
+    path: str = metadata_path(recording)
+    with open(f"{path}.tmp", "w") as metadata_file:
+        json.dump(metadata, metadata_file)
+    os.replace(f"{path}.tmp", path)
+
+
+def update_metadata(recording: str, **fields) -> dict:
+    """
+    Add or overwrite individual fields of a recording's metadata.
+
+    :param recording: the recording's file name.
+    :return: the updated metadata.
+    """
+    metadata: dict = load_metadata(recording)
+    metadata.update(fields)
+    save_metadata(recording, metadata)
+    return metadata
+
+
+def rename_metadata(old_recording: str, new_recording: str) -> None:
+    """
+    Move a recording's metadata along with a renamed recording.
+
+    :param old_recording: the previous file name of the recording.
+    :param new_recording: the new file name of the recording.
+    """
+    try:
+        os.replace(metadata_path(old_recording), metadata_path(new_recording))
+    except FileNotFoundError:
+        pass
+
+
+def delete_metadata(recording: str) -> None:
+    """
+    Remove the metadata of a deleted recording.
+
+    :param recording: the recording's file name.
+    """
+    try:
+        os.remove(metadata_path(recording))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,382 @@
+from collections import deque
+from threading import Thread, Event, Lock
+import time
+
+import numpy as np
+
+from AudioStream import from_pcm, to_pcm, Resampler
+from StorageCodecs import open_recording
+
+
+# PortAudio flags, as exported by pyaudio
+PA_CONTINUE: int = 0
+PA_INPUT_OVERFLOW: int = 0x2
+
+
+class DeviceCapture:
+    """
+    Records one input device. PortAudio calls back on its own thread for
+    every buffer, which is only timestamped against the host's monotonic
+    clock and queued, so a slow disk or a busy writer never makes the
+    device drop frames.
+    """
+    def __init__(self, audio, device: int, rate: int, channels: int = 1,
+                 frames_per_buffer: int = 1024) -> None:
+        """
+        Open an input device. Nothing is recorded until it is started.
+
+        :param audio: the pyaudio.PyAudio instance to open the stream with.
+        :param device: the index of the input device.
+        :param rate: the nominal sample rate of the device.
+        :param channels: the number of channels to record.
+        :param frames_per_buffer: the number of frames per callback.
+        """
+        self.device: int = device
+        self.rate: int = rate
+        self.channels: int = channels
+
+        # (time of the first frame, 16 bit PCM data, frames were lost before)
+        self.buffers: deque[tuple[float, bytes, bool]] = deque()
+        self.overflows: int = 0
+
+        self.stream = audio.open(format=audio.get_format_from_width(2),
+                                 channels=channels, rate=rate, input=True,
+                                 input_device_index=device,
+                                 frames_per_buffer=frames_per_buffer,
+                                 stream_callback=self.callback, start=False)
+
+
+    def callback(self, data: bytes, frame_count: int, time_info: dict,
+                 status: int) -> tuple[None, int]:
+        """
+        Queue a recorded buffer. Runs on PortAudio's callback thread.
+        """
+        now: float = time.monotonic()
+        overflowed: bool = bool(status & PA_INPUT_OVERFLOW)
+        if overflowed:
+            self.overflows += 1
+
+        self.buffers.append((now - frame_count / self.rate, data, overflowed))
+        return None, PA_CONTINUE
+
+
+    def start(self) -> None:
+        self.stream.start_stream()
+
+
+    def stop(self) -> None:
+        self.stream.stop_stream()
+
+
+    def close(self) -> None:
+        self.stream.close()
+
+
+class TrackAligner:
+    """
+    Puts the buffers of one device on the common clock. Lost buffers are
+    filled with silence, and the device's real sample rate, measured against
+    the host clock, is resampled to the output rate so tracks of devices
+    with drifting clocks stay the same length. The real rate is the slope of
+    a least squares fit of the frame count over the buffer timestamps, which
+    evens out the jitter of the callback thread. Any offset built up while
+    the rate was being measured is slowly steered back out.
+    """
+    def __init__(self, rate: int, output_rate: int,
+                 settle_time: float = 2.0, max_drift: float = 0.01,
+                 correction_time: float = 2.0) -> None:
+        """
+        Initializes an aligner for one device.
+
+        :param rate: the nominal sample rate of the device.
+        :param output_rate: the sample rate of the aligned track.
+        :param settle_time: seconds recorded before the measured rate is
+        trusted.
+        :param max_drift: the largest believable difference between the
+        measured and nominal rate, as a fraction.
+        :param correction_time: seconds over which an offset from the common
+        clock is corrected.
+        """
+        self.rate: int = rate
+        self.output_rate: int = output_rate
+        self.settle_time: float = settle_time
+        self.max_drift: float = max_drift
+        self.correction_time: float = correction_time
+
+        self.measured_rate: float = rate
+        self.start_segment()
+
+
+    def start_segment(self) -> None:
+        """
+        Start a new stretch of continuous recording, after a pause. The
+        measured rate is kept.
+        """
+        self.first_time: float | None = None
+        self.frames: int = 0
+        self.produced: int = 0
+        self.resampler: Resampler = Resampler(self.rate, self.output_rate)
+
+        # sums of the (time, frames) points for the least squares fit
+        self.points: int = 0
+        self.sum_t, self.sum_f, self.sum_tt, self.sum_tf = 0.0, 0.0, 0.0, 0.0
+
+
+    def push(self, timestamp: float, samples: np.ndarray) -> np.ndarray:
+        """
+        Align the next buffer of the device.
+
+        :param timestamp: the host time of the first frame of the buffer.
+        :param samples: an array of shape (frames, channels).
+        :return: the aligned samples at the output rate.
+        """
+        if self.first_time is None:
+            self.first_time = timestamp
+
+        # frames lost to an overflow show up as a jump in the timestamps
+        expected: float = self.first_time + self.frames / self.measured_rate
+        gap: int = round((timestamp - expected) * self.measured_rate)
+        if gap > 2 * len(samples):
+            samples = np.concatenate(
+                (np.zeros((gap, samples.shape[1])), samples))
+
+        # the buffer's first frame was recorded at its timestamp
+        elapsed: float = timestamp - self.first_time
+        self.points += 1
+        self.sum_t += elapsed
+        self.sum_f += self.frames
+        self.sum_tt += elapsed * elapsed
+        self.sum_tf += elapsed * self.frames
+        self.frames += len(samples)
+
+        spread: float = self.points * self.sum_tt - self.sum_t ** 2
+        if elapsed >= self.settle_time and spread > 0:
+            measured: float = (self.points * self.sum_tf -
+                               self.sum_t * self.sum_f) / spread
+            self.measured_rate = min(max(measured,
+                                         self.rate * (1 - self.max_drift)),
+                                     self.rate * (1 + self.max_drift))
+
+        # frames ahead of the common clock are taken back over time
+        ahead: float = self.produced - elapsed * self.output_rate
+        correction: float = ahead / (self.output_rate * self.correction_time)
+        correction = min(max(correction, -self.max_drift), self.max_drift)
+
+        self.resampler.step = self.measured_rate / self.output_rate * \
+            (1 + correction)
+        aligned: np.ndarray = self.resampler.process(samples)
+        self.produced += len(aligned)
+        return aligned
+
+
+class MultiCapture:
+    """
+    Records several input devices at once into tracks aligned on a common
+    clock, either as one recording per device or as one recording with a
+    channel per device. Each device is recorded by its own PortAudio
+    callback, and a single writer thread aligns the buffers and streams
+    them to disk.
+    """
+    LAYOUTS: tuple[str, ...] = ("separate", "interleaved")
+
+    def __init__(self, audio, devices: list[int], paths: list[str],
+                 layout: str = "separate", rate: int = 44100,
+                 frames_per_buffer: int = 1024) -> None:
+        """
+        Open the input devices. Nothing is recorded until started.
+
+        :param audio: the pyaudio.PyAudio instance to open the streams with.
+        :param devices: the indexes of the input devices.
+        :param paths: where the recordings are written, one per device for
+        the separate layout, a single one for the interleaved layout.
+        :param layout: separate -> a mono recording per device,
+        interleaved -> one recording with a channel per device.
+        :param rate: the sample rate of the devices and the recordings.
+        :param frames_per_buffer: the number of frames per callback.
+        """
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"unknown layout: {layout}")
+        if len(paths) != (len(devices) if layout == "separate" else 1):
+            raise ValueError("expected a path per device, or a single path "
+                             "when interleaving")
+
+        self.layout: str = layout
+        self.rate: int = rate
+        self.paths: list[str] = paths
+
+        self.captures: list[DeviceCapture] = [
+            DeviceCapture(audio, device, rate, 1, frames_per_buffer)
+            for device in devices]
+        self.aligners: list[TrackAligner] = [TrackAligner(rate, rate)
+                                             for _ in devices]
+
+        # aligned samples waiting to be written, and the frames written
+        self.pending: list[np.ndarray] = [np.zeros((0, 1)) for _ in devices]
+        self.written: list[int] = [0] * len(devices)
+        self.segment_start: float | None = None
+
+        self.writers: list = []
+        for path in paths:
+            writer = open_recording(path, "wb")
+            writer.setnchannels(1 if layout == "separate" else len(devices))
+            writer.setsampwidth(2)
+            writer.setframerate(rate)
+            self.writers.append(writer)
+
+        self.lock: Lock = Lock()
+        self.stopped: Event = Event()
+        self.thread: Thread | None = None
+        self.running: bool = False
+
+
+    @property
+    def duration(self) -> float:
+        return max(self.written, default=0) / self.rate
+
+
+    @property
+    def overflows(self) -> int:
+        return sum(capture.overflows for capture in self.captures)
+
+
+    def start(self) -> None:
+        """
+        Start recording all devices, and the writer thread.
+        """
+        self.thread = Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+        self.resume()
+
+
+    def pause(self) -> None:
+        """
+        Stop recording until resumed. The tracks stay aligned.
+        """
+        for capture in self.captures:
+            capture.stop()
+        self.running = False
+
+
+    def resume(self) -> None:
+        """
+        Continue recording after a pause.
+        """
+        with self.lock:
+            self.drain()
+            self.pad_tracks()
+            for aligner in self.aligners:
+                aligner.start_segment()
+            self.segment_start = None
+
+        for capture in self.captures:
+            capture.start()
+        self.running = True
+
+
+    def stop(self) -> list[str]:
+        """
+        Stop recording and finish the recordings. Tracks are padded with
+        silence to the same length.
+
+        :return: the paths of the recordings.
+        """
+        self.pause()
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+        with self.lock:
+            self.drain()
+            self.pad_tracks()
+
+        for capture in self.captures:
+            capture.close()
+        for writer in self.writers:
+            writer.close()
+
+        return self.paths
+
+
+    def run(self) -> None:
+        """
+        Align and write the recorded buffers until stopped.
+        """
+        while not self.stopped.wait(0.01):
+            with self.lock:
+                self.drain()
+
+
+    def drain(self) -> None:
+        """
+        Align every queued buffer and write out what is aligned.
+        """
+        if self.segment_start is None:
+            # the segment starts with the earliest device, once every device
+            # delivered its first buffer or was given time to
+            firsts: list[float] = [capture.buffers[0][0] for capture
+                                   in self.captures if capture.buffers]
+            if not firsts or (len(firsts) < len(self.captures) and
+                              time.monotonic() - min(firsts) < 0.5):
+                return
+            self.segment_start = min(firsts)
+
+        for index, capture in enumerate(self.captures):
+            while capture.buffers:
+                timestamp, data, _ = capture.buffers.popleft()
+
+                # devices that started later are padded to the earliest
+                if self.aligners[index].first_time is None:
+                    delay: float = max(timestamp - self.segment_start, 0.0)
+                    self.append(index, np.zeros((round(delay * self.rate), 1)))
+
+                self.append(index, self.aligners[index].push(
+                    timestamp, from_pcm(data, 2, 1)))
+
+        self.write()
+
+
+    def append(self, index: int, samples: np.ndarray) -> None:
+        """
+        Queue aligned samples of a device for writing.
+
+        :param index: the device's position in the device list.
+        :param samples: an array of shape (frames, 1).
+        """
+        if len(samples):
+            self.pending[index] = np.concatenate((self.pending[index],
+                                                  samples))
+
+
+    def write(self) -> None:
+        """
+        Write the aligned samples. Interleaved recordings are written as far
+        as every device has delivered.
+        """
+        if self.layout == "separate":
+            for index, writer in enumerate(self.writers):
+                writer.writeframes(to_pcm(self.pending[index], 2))
+                self.written[index] += len(self.pending[index])
+                self.pending[index] = self.pending[index][:0]
+            return
+
+        count: int = min(map(len, self.pending))
+        if count:
+            block: np.ndarray = np.hstack([samples[:count]
+                                           for samples in self.pending])
+            self.writers[0].writeframes(to_pcm(block, 2))
+            for index in range(len(self.pending)):
+                self.pending[index] = self.pending[index][count:]
+                self.written[index] += count
+
+
+    def pad_tracks(self) -> None:
+        """
+        Pad every track with silence to the length of the longest, so the
+        next segment starts aligned.
+        """
+        totals: list[int] = [written + len(pending) for written, pending
+                             in zip(self.written, self.pending)]
+        for index, total in enumerate(totals):
+            self.append(index, np.zeros((max(totals) - total, 1)))
+        self.write()
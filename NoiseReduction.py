@@ -0,0 +1,323 @@
+from typing import Callable
+import os, time
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from AudioStream import read_blocks, to_pcm
+from MetadataStore import METADATA_FOLDER
+from StorageCodecs import open_recording
+
+
+NOISE_PROFILE_PATH: str = f"{METADATA_FOLDER}/noise_profile.npz"
+
+
+def stft_frames(samples: np.ndarray, window: np.ndarray, hop: int) \
+        -> np.ndarray:
+    """
+    Compute the spectra of all complete windows in a block of samples.
+
+    :param samples: an array of shape (frames, channels).
+    :param window: the analysis window.
+    :param hop: the distance between consecutive windows.
+    :return: an array of shape (windows, channels, bins).
+    """
+    windows: np.ndarray = sliding_window_view(samples, len(window), axis=0)
+    return np.fft.rfft(windows[::hop] * window, axis=-1)
+
+
+class NoiseProfile:
+    """
+    The average spectrum of a stretch of background noise.
+    """
+    def __init__(self, mean: np.ndarray, deviation: np.ndarray,
+                 rate: int) -> None:
+        """
+        Initializes a noise profile.
+
+        :param mean: the mean magnitude of each frequency bin.
+        :param deviation: the standard deviation of each frequency bin.
+        :param rate: the sample rate of the noise.
+        """
+        self.mean: np.ndarray = mean
+        self.deviation: np.ndarray = deviation
+        self.rate: int = rate
+
+
+    @property
+    def fft_size(self) -> int:
+        return 2 * (len(self.mean) - 1)
+
+
+    @classmethod
+    def learn(cls, path: str, start: float, end: float,
+              fft_size: int = 2048) -> "NoiseProfile":
+        """
+        Learn the noise profile from a quiet span of a recording.
+
+        :param path: the recording.
+        :param start: the start of the quiet span in seconds.
+        :param end: the end of the quiet span in seconds.
+        :param fft_size: the number of samples per analysis window.
+        :return: the learned noise profile.
+        :raise ValueError: the span is empty, reversed or too short.
+        """
+        if start < 0 or end <= start:
+            raise ValueError("the noise span must end after it starts")
+
+        window: np.ndarray = np.sqrt(np.hanning(fft_size + 1)[:-1])
+        magnitudes: list[np.ndarray] = []
+
+        with open_recording(path) as reader:
+            rate: int = reader.getframerate()
+            reader.setpos(min(int(start * rate), reader.getnframes()))
+            remaining: int = int((end - start) * rate)
+
+            for block in read_blocks(reader):
+                block = block[:remaining].mean(axis=1, keepdims=True)
+                remaining -= len(block)
+
+                if len(block) >= fft_size:
+                    spectra = stft_frames(block, window, fft_size // 2)
+                    magnitudes.append(np.abs(spectra[:, 0]))
+
+                if remaining <= 0:
+                    break
+
+        if not magnitudes:
+            raise ValueError("the noise span is too short")
+
+        all_magnitudes: np.ndarray = np.concatenate(magnitudes)
+        return cls(all_magnitudes.mean(axis=0), all_magnitudes.std(axis=0),
+                   rate)
+
+
+    def save(self, path: str = NOISE_PROFILE_PATH) -> None:
+        """
+        Store the noise profile.
+
+        :param path: where the profile is stored.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, mean=self.mean, deviation=self.deviation,
+                 rate=self.rate)
+
+
+    @classmethod
+    def load(cls, path: str = NOISE_PROFILE_PATH) -> "NoiseProfile | None":
+        """
+        Load a stored noise profile.
+
+        :param path: where the profile is stored.
+        :return: the noise profile, None if no profile was stored.
+        """
+        try:
+            with np.load(path) as data:
+                return cls(data["mean"], data["deviation"], int(data["rate"]))
+        except FileNotFoundError:
+            return None
+
+
+class SpectralGate:
+    """
+    A streaming noise reduction filter. Frequency bins that are not clearly
+    louder than the noise profile are attenuated, using overlapping short
+    time Fourier transforms.
+    """
+    def __init__(self, profile: NoiseProfile, channels: int = 1,
+                 sensitivity: float = 1.5, reduction_db: float = 18.0,
+                 overlap: int = 4, rate: int | None = None) -> None:
+        """
+        Initializes a filter for a single stream.
+
+        :param profile: the noise to be removed.
+        :param channels: the number of channels of the stream.
+        :param sensitivity: how many standard deviations above the mean noise
+        a bin must be to be kept.
+        :param reduction_db: how much the noise is attenuated.
+        :param overlap: the number of windows overlapping each sample.
+        :param rate: the sample rate of the stream, checked against the
+        profile's if given.
+        :raise ValueError: the profile was learned at another sample rate,
+        so its frequency bins do not line up with the stream's.
+        """
+        if rate is not None and rate != profile.rate:
+            raise ValueError(f"the noise profile was learned at "
+                             f"{profile.rate} Hz, not {rate} Hz")
+
+        self.fft_size: int = profile.fft_size
+        self.hop: int = self.fft_size // overlap
+        self.overlap: int = overlap
+
+        self.window: np.ndarray = np.sqrt(np.hanning(self.fft_size + 1)[:-1])
+        # the squared windows of all overlapping frames add up to this
+        self.window_sum: np.ndarray = \
+            (self.window ** 2).reshape(overlap, self.hop).sum(axis=0)
+
+        self.threshold: np.ndarray = profile.mean + \
+            sensitivity * profile.deviation
+        self.floor: float = 10 ** (-reduction_db / 20)
+
+        # start with silence so the first samples are covered by all windows
+        self.pending: np.ndarray = \
+            np.zeros((self.fft_size - self.hop, channels))
+        self.tail: np.ndarray = \
+            np.zeros(((overlap - 1) * self.hop, channels))
+
+        self.delay: int = self.fft_size - self.hop # samples to drop
+        self.received: int = 0
+        self.sent: int = 0
+
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Filter the next block of the stream. The output lags behind the
+        input by about one window, see flush.
+
+        :param samples: an array of shape (frames, channels).
+        :return: the filtered samples that are ready.
+        """
+        self.received += len(samples)
+        samples = np.concatenate((self.pending, samples))
+
+        count: int = (len(samples) - self.fft_size) // self.hop + 1
+        if count <= 0:
+            self.pending = samples
+            return samples[:0]
+
+        spectra: np.ndarray = stft_frames(samples, self.window, self.hop)
+        spectra = spectra[:count]
+        self.pending = samples[count * self.hop:]
+
+        # keep bins above the noise, smoothing the gains across frequency
+        gains: np.ndarray = np.where(np.abs(spectra) > self.threshold,
+                                     1.0, self.floor)
+        padded: np.ndarray = np.pad(gains, ((0, 0), (0, 0), (2, 2)), "edge")
+        gains = sliding_window_view(padded, 5, axis=-1).mean(axis=-1)
+
+        frames: np.ndarray = np.fft.irfft(spectra * gains, n=self.fft_size,
+                                          axis=-1) * self.window
+
+        # overlap-add the filtered windows, one segment per hop
+        channels: int = samples.shape[1]
+        output: np.ndarray = np.zeros((count + self.overlap - 1, self.hop,
+                                       channels))
+        for segment in range(self.overlap):
+            part: np.ndarray = frames[:, :, segment * self.hop:
+                                      (segment + 1) * self.hop]
+            output[segment:segment + count] += part.transpose(0, 2, 1)
+
+        normalization: np.ndarray = np.tile(self.window_sum,
+                                            count + self.overlap - 1)
+        output = output.reshape(-1, channels) / normalization[:, np.newaxis]
+        output[:len(self.tail)] += self.tail
+
+        ready: np.ndarray = output[:count * self.hop]
+        self.tail = output[count * self.hop:]
+
+        # drop the silence the stream was started with
+        skipped: int = min(self.delay, len(ready))
+        self.delay -= skipped
+        ready = ready[skipped:]
+
+        self.sent += len(ready)
+        return ready
+
+
+    def flush(self) -> np.ndarray:
+        """
+        Finish the stream.
+
+        :return: the remaining filtered samples.
+        """
+        missing: int = self.received - self.sent
+        silence: np.ndarray = np.zeros((self.fft_size, self.pending.shape[1]))
+
+        ready: np.ndarray = self.process(silence)[:missing]
+        self.received -= len(silence)
+        self.sent = self.received
+        return ready
+
+
+def reduce_noise(path: str, destination: str, profile: NoiseProfile,
+                 progress: Callable[[float], None] | None = None) -> str:
+    """
+    Remove noise from a recording, streaming it block by block.
+
+    :param path: the recording.
+    :param destination: where the filtered recording is written.
+    :param profile: the noise to be removed.
+    :param progress: called with the fraction of the recording done.
+    :return: the path of the filtered recording.
+    :raise ValueError: the profile was learned at another sample rate.
+    """
+    folder, name = os.path.split(destination)
+    temporary: str = os.path.join(folder, f".{name}.part")
+
+    try:
+        extension: str = os.path.splitext(destination)[1]
+        with open_recording(path) as reader, \
+                open_recording(temporary, "wb", extension) as writer:
+            writer.setparams(reader.getparams())
+            sampwidth: int = reader.getsampwidth()
+            total: int = max(reader.getnframes(), 1)
+
+            gate: SpectralGate = SpectralGate(profile, reader.getnchannels(),
+                                              rate=reader.getframerate())
+            for block in read_blocks(reader):
+                writer.writeframes(to_pcm(gate.process(block), sampwidth))
+
+                if progress is not None:
+                    progress(reader.tell() / total)
+
+            writer.writeframes(to_pcm(gate.flush(), sampwidth))
+
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    return destination
+
+
+def benchmark(seconds: float = 60.0, rate: int = 44100,
+              chunk: int = 1024) -> None:
+    """
+    Measure how much faster than real time the filter runs, both on large
+    offline blocks and on capture sized chunks.
+
+    :param seconds: the length of the generated test audio.
+    :param rate: the sample rate of the generated test audio.
+    :param chunk: the number of frames per chunk in the live measurement.
+    """
+    generator: np.random.Generator = np.random.default_rng(0)
+    frames: int = int(seconds * rate)
+
+    # a tone over broadband noise and mains hum
+    times: np.ndarray = np.arange(frames) / rate
+    noise: np.ndarray = 0.02 * generator.standard_normal(frames) + \
+        0.02 * np.sin(2 * np.pi * 50 * times)
+    audio: np.ndarray = (noise + 0.3 * np.sin(2 * np.pi * 440 * times) *
+                         (times % 2 < 1))[:, np.newaxis]
+
+    magnitudes: np.ndarray = np.abs(stft_frames(
+        noise[:rate, np.newaxis], np.sqrt(np.hanning(2049)[:-1]), 1024)[:, 0])
+    profile: NoiseProfile = NoiseProfile(magnitudes.mean(axis=0),
+                                         magnitudes.std(axis=0), rate)
+
+    for name, size in (("offline", 65536), ("live", chunk)):
+        gate: SpectralGate = SpectralGate(profile)
+
+        start: float = time.perf_counter()
+        for offset in range(0, frames, size):
+            gate.process(audio[offset:offset + size])
+        gate.flush()
+        elapsed: float = time.perf_counter() - start
+
+        print(f"{name:>8}: {seconds:.0f}s of audio in {elapsed:.3f}s "
+              f"({seconds / elapsed:.0f}x real time)")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,254 @@
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import os
+
+from AudioStream import from_pcm, to_pcm, convert_channels, Resampler
+from AudioStream import BLOCK_FRAMES
+from StorageCodecs import open_recording, split_recording_name
+from EditList import EditList, EditedReader
+
+
+# (sample rate, channels, sample width) of a recording
+AudioFormat = tuple[int, int, int]
+
+
+class EditCancelled(Exception):
+    """
+    Raised when a merge, split or export is cancelled. Nothing is written.
+    """
+
+
+def recording_format(reader) -> AudioFormat:
+    """
+    Get the format of an open recording.
+
+    :param reader: an open wave reader, or anything with the same interface.
+    :return: the sample rate, channels and sample width of the recording.
+    """
+    return reader.getframerate(), reader.getnchannels(), reader.getsampwidth()
+
+
+def partial_path(destination: str) -> str:
+    """
+    Get the hidden path a recording is written to before it appears.
+
+    :param destination: the path of the new recording.
+    :return: the path of the partial recording.
+    """
+    folder, name = os.path.split(destination)
+    return os.path.join(folder, f".{name}.part")
+
+
+@contextmanager
+def atomic_writer(destination: str, audio_format: AudioFormat,
+                  publish: bool = True) -> Iterator:
+    """
+    Open a recording for writing that only appears at its destination once
+    it is complete. If anything fails, the partial recording is removed.
+
+    :param destination: the path of the new recording.
+    :param audio_format: the format of the new recording.
+    :param publish: move the recording to its destination once written,
+    otherwise it is left at its partial_path for the caller to move.
+    :return: a writer with the same interface as the wave module.
+    """
+    temporary: str = partial_path(destination)
+    extension: str = split_recording_name(os.path.basename(destination))[1]
+
+    try:
+        with open_recording(temporary, "wb", extension) as writer:
+            rate, channels, sampwidth = audio_format
+            writer.setframerate(rate)
+            writer.setnchannels(channels)
+            writer.setsampwidth(sampwidth)
+            yield writer
+
+        if publish:
+            os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+def copy_frames(reader, writer, audio_format: AudioFormat, frames: int,
+                report: Callable[[int], None]) -> None:
+    """
+    Stream frames from the current position of a reader to a writer in large
+    blocks. The raw PCM data is copied as it is when the formats match, and
+    only converted when they do not.
+
+    :param reader: the open source recording.
+    :param writer: the open destination recording.
+    :param audio_format: the format of the destination.
+    :param frames: the number of frames to copy, fewer if the source ends.
+    :param report: called with the number of frames copied after every
+    block.
+    """
+    source: AudioFormat = recording_format(reader)
+    frame_size: int = source[1] * source[2]
+    resampler: Resampler | None = None
+    if source != audio_format:
+        resampler = Resampler(source[0], audio_format[0])
+
+    while frames > 0 and \
+            len(data := reader.readframes(min(frames, BLOCK_FRAMES))):
+        copied: int = len(data) // frame_size
+        frames -= copied
+
+        if resampler is None:
+            writer.writeframes(data)
+        else:
+            block = convert_channels(from_pcm(data, source[2], source[1]),
+                                     audio_format[1])
+            writer.writeframes(to_pcm(resampler.process(block),
+                                      audio_format[2]))
+
+        report(copied)
+
+
+class Progress:
+    """
+    Turns copied frame counts into progress reports, and checks for
+    cancellation between blocks.
+    """
+    def __init__(self, total: int,
+                 progress: Callable[[float], None] | None = None,
+                 cancel_event=None) -> None:
+        """
+        Initializes the progress of an operation.
+
+        :param total: the number of frames the operation copies.
+        :param progress: called with the fraction of the frames copied.
+        :param cancel_event: an event that is set to cancel the operation.
+        """
+        self.total: int = max(total, 1)
+        self.done: int = 0
+        self.progress: Callable[[float], None] | None = progress
+        self.cancel_event = cancel_event
+
+
+    def __call__(self, frames: int) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise EditCancelled()
+
+        self.done += frames
+        if self.progress is not None:
+            self.progress(min(self.done / self.total, 1.0))
+
+
+def merge_recordings(paths: list[str], destination: str,
+                     progress: Callable[[float], None] | None = None,
+                     cancel_event=None) -> str:
+    """
+    Concatenate recordings into a new one, in the format of the first.
+
+    :param paths: the recordings, in order.
+    :param destination: the path of the merged recording.
+    :param progress: called with the fraction of the work done.
+    :param cancel_event: an event that is set to cancel the merge.
+    :return: the path of the merged recording.
+    :raise ValueError: no recordings were given.
+    """
+    if not paths:
+        raise ValueError("nothing to merge")
+
+    with open_recording(paths[0]) as reader:
+        audio_format: AudioFormat = recording_format(reader)
+
+    total: int = 0
+    for path in paths:
+        with open_recording(path) as reader:
+            total += reader.getnframes()
+
+    report: Progress = Progress(total, progress, cancel_event)
+    with atomic_writer(destination, audio_format) as writer:
+        for path in paths:
+            with open_recording(path) as reader:
+                copy_frames(reader, writer, audio_format, reader.getnframes(),
+                            report)
+
+    return destination
+
+
+def split_recording(path: str, times: list[float], destinations: list[str],
+                    progress: Callable[[float], None] | None = None,
+                    cancel_event=None) -> list[str]:
+    """
+    Cut a recording into pieces. The original is left as it is, and the
+    pieces only appear once all of them are written.
+
+    :param path: the recording.
+    :param times: the points to cut at in seconds, in increasing order.
+    :param destinations: the paths of the pieces, one more than the times.
+    :param progress: called with the fraction of the work done.
+    :param cancel_event: an event that is set to cancel the split.
+    :return: the paths of the pieces.
+    :raise ValueError: the times are out of order or outside the recording.
+    """
+    if len(destinations) != len(times) + 1:
+        raise ValueError("expected one more destination than split times")
+
+    written: list[str] = []
+    with open_recording(path) as reader:
+        audio_format: AudioFormat = recording_format(reader)
+        total: int = reader.getnframes()
+
+        bounds: list[int] = [0, *(round(time * audio_format[0])
+                                  for time in times), total]
+        if any(end <= start for start, end in zip(bounds, bounds[1:])):
+            raise ValueError("split times must increase within the recording")
+
+        report: Progress = Progress(total, progress, cancel_event)
+        try:
+            for start, end, destination in zip(bounds, bounds[1:],
+                                               destinations):
+                with atomic_writer(destination, audio_format,
+                                   publish=False) as writer:
+                    copy_frames(reader, writer, audio_format, end - start,
+                                report)
+                written.append(destination)
+        except BaseException:
+            # a cancelled split leaves no pieces behind
+            for destination in written:
+                os.remove(partial_path(destination))
+            raise
+
+    # move the pieces in one go, so they are listed together
+    for destination in written:
+        os.replace(partial_path(destination), destination)
+
+    return written
+
+
+def export_recording(path: str, destination: str,
+                     audio_format: AudioFormat | None = None,
+                     progress: Callable[[float], None] | None = None,
+                     cancel_event=None, edits: EditList | None = None) -> str:
+    """
+    Write a copy of a recording, in the format given by the extension of the
+    destination and, optionally, another sample rate, channel count or
+    sample width. This is where non-destructive edits are rendered.
+
+    :param path: the recording.
+    :param destination: the path of the copy.
+    :param audio_format: the format of the copy, the original's if None.
+    :param progress: called with the fraction of the work done.
+    :param cancel_event: an event that is set to cancel the export.
+    :param edits: the edits to apply to the copy.
+    :return: the path of the copy.
+    """
+    reader = open_recording(path)
+    if edits:
+        reader = EditedReader(reader, edits)
+
+    with reader:
+        audio_format = audio_format or recording_format(reader)
+        report: Progress = Progress(reader.getnframes(), progress,
+                                    cancel_event)
+
+        with atomic_writer(destination, audio_format) as writer:
+            copy_frames(reader, writer, audio_format, reader.getnframes(),
+                        report)
+
+    return destination
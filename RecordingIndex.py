@@ -0,0 +1,335 @@
+from array import array
+import time
+
+import numpy as np
+
+
+class RecordingIndex:
+    """
+    An in-memory index over the recording library, kept in sync with every
+    change instead of being rebuilt from the audio_recordings folder.
+
+    Every recording owns a slot in a set of columns. The names and tags of
+    all recordings are kept in a single byte string, so a query is a handful
+    of vectorized comparisons however large the library is. Removed
+    recordings leave blanked out slots behind, which are compacted once they
+    make up most of the index.
+
+    A search query is made of whitespace separated terms, all of which must
+    match a recording:
+    text -> the name or a tag contains the text.
+    ^text -> the name starts with the text.
+    tag:text -> a tag starts with the text.
+    date:text -> the creation date (YYYY, YYYY-MM or YYYY-MM-DD) matches.
+    dur>n, dur<n -> the recording is longer or shorter than n seconds.
+    size>n, size<n -> the recording is larger or smaller than n kilobytes.
+    """
+    def __init__(self) -> None:
+        """
+        Initializes an empty index.
+        """
+        self.slots: dict[str, int] = {}
+        self.slot_names: list[str | None] = []
+        self.slot_tags: list[list[str]] = []
+        self.slot_spans: list[tuple[int, int]] = []
+
+        self.created: array = array("d")
+        self.sizes: array = array("d")
+        self.durations: array = array("d") # nan when unknown
+        self.alive: array = array("b")
+
+        # search text, and the slot each of its bytes belongs to
+        self.text: bytearray = bytearray()
+        self.text_slots: array = array("i")
+        self.dead_bytes: int = 0
+
+        # whether slots are in order of creation
+        self.ordered: bool = True
+        self.latest: float = float("-inf")
+
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots
+
+
+    def add(self, name: str, created: float, size: int,
+            duration: float | None = None,
+            tags: list[str] | None = None) -> None:
+        """
+        Add a recording to the index, replacing an existing entry.
+
+        :param name: the file name of the recording.
+        :param created: the creation time of the recording.
+        :param size: the size of the recording in bytes.
+        :param duration: the length of the recording in seconds, if known.
+        :param tags: the tags given to the recording.
+        """
+        if name in self.slots:
+            self.remove(name)
+
+        slot: int = len(self.slot_names)
+        self.slots[name] = slot
+        self.slot_names.append(name)
+        self.slot_tags.append(list(tags or []))
+        self.slot_spans.append((0, 0))
+
+        self.created.append(created)
+        self.sizes.append(size)
+        self.durations.append(float("nan") if duration is None else duration)
+        self.alive.append(1)
+
+        if created < self.latest:
+            self.ordered = False
+        self.latest = max(self.latest, created)
+
+        self.write_text(slot)
+
+
+    def remove(self, name: str) -> None:
+        """
+        Remove a recording from the index.
+
+        :param name: the file name of the recording.
+        """
+        slot: int | None = self.slots.pop(name, None)
+        if slot is None:
+            return
+
+        self.erase_text(slot)
+        self.slot_names[slot] = None
+        self.alive[slot] = 0
+
+        if self.dead_bytes > max(len(self.text) // 2, 1 << 20):
+            self.compact()
+
+
+    def rename(self, old_name: str, new_name: str) -> None:
+        """
+        Move an entry to the new name of its recording.
+
+        :param old_name: the previous file name of the recording.
+        :param new_name: the new file name of the recording.
+        """
+        slot: int | None = self.slots.pop(old_name, None)
+        if slot is None:
+            return
+
+        self.remove(new_name)
+        self.slots[new_name] = slot
+        self.slot_names[slot] = new_name
+        self.erase_text(slot)
+        self.write_text(slot)
+
+
+    def update(self, name: str, size: int | None = None,
+               duration: float | None = None,
+               tags: list[str] | None = None) -> None:
+        """
+        Change some of the details of an entry.
+
+        :param name: the file name of the recording.
+        :param size: the new size of the recording in bytes.
+        :param duration: the length of the recording in seconds.
+        :param tags: the new tags of the recording.
+        """
+        slot: int | None = self.slots.get(name)
+        if slot is None:
+            return
+
+        if size is not None:
+            self.sizes[slot] = size
+        if duration is not None:
+            self.durations[slot] = duration
+        if tags is not None:
+            self.slot_tags[slot] = list(tags)
+            self.erase_text(slot)
+            self.write_text(slot)
+
+
+    def details(self, name: str) -> dict | None:
+        """
+        Get the indexed details of a recording.
+
+        :param name: the file name of the recording.
+        :return: the creation time, size, duration and tags of the recording,
+        None if it is not indexed.
+        """
+        slot: int | None = self.slots.get(name)
+        if slot is None:
+            return None
+
+        duration: float = self.durations[slot]
+        return {"created": self.created[slot], "size": int(self.sizes[slot]),
+                "duration": None if duration != duration else duration,
+                "tags": list(self.slot_tags[slot])}
+
+
+    def clear(self) -> None:
+        """
+        Remove every recording from the index.
+        """
+        self.__init__()
+
+
+    def names(self) -> list[str]:
+        """
+        Get every recording in the index.
+
+        :return: the names of the recordings, oldest first.
+        """
+        return self.search("")
+
+
+    def write_text(self, slot: int) -> None:
+        """
+        Append the search line of a slot to the search text. Every line starts
+        with a newline and every tag with a tab, so prefixes can be searched
+        for as plain substrings.
+
+        :param slot: the slot to write.
+        """
+        line: bytes = "\t".join(["\n" + self.slot_names[slot],
+                                 *self.slot_tags[slot]]).lower().encode()
+
+        start: int = len(self.text)
+        self.text += line
+        self.text_slots.extend(array("i", [slot]) * len(line))
+        self.slot_spans[slot] = (start, len(self.text))
+
+
+    def erase_text(self, slot: int) -> None:
+        """
+        Blank out the search line of a slot. Queries never contain zero
+        bytes, so blanked lines never match.
+
+        :param slot: the slot to erase.
+        """
+        start, end = self.slot_spans[slot]
+        self.text[start:end] = bytes(end - start)
+        self.dead_bytes += end - start
+        self.slot_spans[slot] = (0, 0)
+
+
+    def compact(self) -> None:
+        """
+        Drop removed slots, putting the remaining ones in order of creation.
+        """
+        entries: list[tuple] = sorted(
+            (self.created[slot], name, int(self.sizes[slot]),
+             self.durations[slot], self.slot_tags[slot])
+            for name, slot in self.slots.items())
+
+        self.__init__()
+        for created, name, size, duration, tags in entries:
+            self.add(name, created, size,
+                     None if duration != duration else duration, tags)
+
+
+    def search(self, query: str) -> list[str]:
+        """
+        Find the recordings matching a query.
+
+        :param query: the search query, see the class description.
+        :return: the names of the matching recordings, oldest first.
+        """
+        matches: np.ndarray = np.frombuffer(self.alive, dtype=np.int8) > 0
+        for term in query.lower().split():
+            matches &= self.match(term)
+
+        slots: np.ndarray = np.flatnonzero(matches)
+        if not self.ordered:
+            created: np.ndarray = np.frombuffer(self.created)[slots]
+            slots = slots[np.argsort(created, kind="stable")]
+
+        return list(map(self.slot_names.__getitem__, slots.tolist()))
+
+
+    def match(self, term: str) -> np.ndarray:
+        """
+        Find the recordings that match a single search term.
+
+        :param term: the search term.
+        :return: a mask over the slots.
+        """
+        if term.startswith("^"):
+            return self.contains("\n" + term[1:])
+        if term.startswith("tag:"):
+            return self.contains("\t" + term[4:])
+        if term.startswith("date:"):
+            return self.created_within(term[5:])
+
+        for field, column, scale in (("dur", self.durations, 1),
+                                     ("size", self.sizes, 1024)):
+            for operator in "<>":
+                if not term.startswith(f"{field}{operator}"):
+                    continue
+
+                values: np.ndarray = np.frombuffer(column)
+                try:
+                    limit: float = float(term[len(field) + 1:]) * scale
+                except ValueError:
+                    return np.ones(len(values), dtype=bool)
+
+                # unknown values are nan and never match
+                return values > limit if operator == ">" else values < limit
+
+        return self.contains(term)
+
+
+    def contains(self, text: str) -> np.ndarray:
+        """
+        Find the recordings whose search line contains some text.
+
+        :param text: the text to look for.
+        :return: a mask over the slots.
+        """
+        found: np.ndarray = np.zeros(len(self.slot_names), dtype=bool)
+        pattern: bytes = text.encode()
+
+        haystack: np.ndarray = np.frombuffer(self.text, dtype=np.uint8)
+        last_start: int = len(haystack) - len(pattern)
+        if last_start < 0:
+            return found
+
+        # narrow down the candidate positions one byte at a time
+        positions: np.ndarray = \
+            np.flatnonzero(haystack[:last_start + 1] == pattern[0])
+        for offset in range(1, len(pattern)):
+            positions = positions[haystack[positions + offset] ==
+                                  pattern[offset]]
+
+        found[np.frombuffer(self.text_slots, dtype=np.int32)[positions]] = True
+        return found
+
+
+    def created_within(self, date: str) -> np.ndarray:
+        """
+        Find the recordings created in a year, month or day.
+
+        :param date: the date, as YYYY, YYYY-MM or YYYY-MM-DD.
+        :return: a mask over the slots.
+        """
+        created: np.ndarray = np.frombuffer(self.created)
+        try:
+            values: list[int] = [int(part) for part in date.split("-") if part]
+        except ValueError:
+            return np.zeros(len(created), dtype=bool)
+        if not values or len(values) > 3:
+            return np.ones(len(created), dtype=bool)
+
+        # the start of the period and the start of the next one
+        start: list[int] = values + [1] * (3 - len(values))
+        end: list[int] = start.copy()
+        end[len(values) - 1] += 1
+
+        try:
+            first: float = time.mktime((*start, 0, 0, 0, 0, 0, -1))
+            after: float = time.mktime((*end, 0, 0, 0, 0, 0, -1))
+        except (OverflowError, ValueError, OSError):
+            # a date the clock cannot represent matches nothing
+            return np.zeros(len(created), dtype=bool)
+        return (created >= first) & (created < after)
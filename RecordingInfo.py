@@ -0,0 +1,249 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable
+import os, struct
+
+from StorageCodecs import RiceWriter
+
+
+class RecordingInfo:
+    """
+    The format details of a recording, read from its header.
+    """
+    def __init__(self, frames: int, rate: int, channels: int, sampwidth: int,
+                 size: int) -> None:
+        """
+        Initializes the details of a recording.
+
+        :param frames: the number of frames in the recording.
+        :param rate: the sample rate of the recording.
+        :param channels: the number of channels of the recording.
+        :param sampwidth: the number of bytes per sample.
+        :param size: the size of the file in bytes.
+        """
+        self.frames: int = frames
+        self.rate: int = rate
+        self.channels: int = channels
+        self.sampwidth: int = sampwidth
+        self.size: int = size
+
+
+    @property
+    def duration(self) -> float:
+        return self.frames / self.rate if self.rate else 0.0
+
+
+    def describe(self) -> str:
+        """
+        Summarize the details for the recordings list.
+
+        :return: the duration, sample rate, channels and size, e.g.
+        "01:05 44.1k 1ch 5.7M".
+        """
+        minutes, seconds = divmod(int(self.duration), 60)
+        length: str = f"{minutes:02d}:{seconds:02d}" if minutes < 100 else \
+            f"{minutes // 60}h{minutes % 60:02d}"
+
+        size: float = self.size
+        for unit in "BKMGT":
+            if size < 1000 or unit == "T":
+                break
+            size /= 1024
+
+        return f"{length} {self.rate / 1000:g}k {self.channels}ch " \
+            f"{size:.3g}{unit}"
+
+
+def read_wav_header(path: str) -> RecordingInfo:
+    """
+    Read the details of a wav recording by walking its RIFF chunks, without
+    reading any audio data.
+
+    :param path: the recording.
+    :return: the details of the recording.
+    """
+    with open(path, "rb") as file:
+        riff, _, form = struct.unpack("<4sI4s", file.read(12))
+        if riff != b"RIFF" or form != b"WAVE":
+            raise ValueError(f"not a wav recording: {path}")
+
+        rate, channels, block_align, sampwidth, data_size = 0, 0, 0, 0, -1
+        while data_size < 0 and len(header := file.read(8)) == 8:
+            chunk, size = struct.unpack("<4sI", header)
+
+            if chunk == b"fmt ":
+                fmt: bytes = file.read(16)
+                _, channels, rate, _, block_align, bits = \
+                    struct.unpack("<HHIIHH", fmt)
+                sampwidth = (bits + 7) // 8
+                file.seek(size - 16 + size % 2, os.SEEK_CUR)
+            elif chunk == b"data":
+                data_size = size
+            else:
+                # chunks are padded to an even size
+                file.seek(size + size % 2, os.SEEK_CUR)
+
+        file_size: int = os.fstat(file.fileno()).st_size
+
+    frames: int = max(data_size, 0) // block_align if block_align else 0
+    return RecordingInfo(frames, rate, channels, sampwidth, file_size)
+
+
+def read_rlac_header(path: str) -> RecordingInfo:
+    """
+    Read the details of an RLAC recording from its header.
+
+    :param path: the recording.
+    :return: the details of the recording.
+    """
+    with open(path, "rb") as file:
+        header: bytes = file.read(RiceWriter.HEADER.size)
+        file_size: int = os.fstat(file.fileno()).st_size
+
+    magic, _, channels, sampwidth, rate, frames, _ = \
+        RiceWriter.HEADER.unpack(header)
+    if magic != RiceWriter.MAGIC:
+        raise ValueError(f"not an RLAC recording: {path}")
+
+    return RecordingInfo(frames, rate, channels, sampwidth, file_size)
+
+
+HEADER_READERS: dict[str, Callable[[str], RecordingInfo]] = {
+    ".wav": read_wav_header,
+    ".rlac": read_rlac_header,
+}
+
+
+def read_header(path: str) -> RecordingInfo:
+    """
+    Read the details of a recording in any supported format.
+
+    :param path: the recording.
+    :return: the details of the recording.
+    """
+    return HEADER_READERS[os.path.splitext(path)[1]](path)
+
+
+class RecordingInfoLoader:
+    """
+    Reads recording headers on a pool of background threads, remembering the
+    result for each (path, modification time) so unchanged recordings are
+    only ever read once. Recordings that could not be read are remembered
+    the same way, and only tried again once they change.
+    """
+    def __init__(self, folder: str,
+                 callback: Callable[[str, RecordingInfo], None],
+                 workers: int = 4) -> None:
+        """
+        Initializes a loader.
+
+        :param folder: the folder holding the recordings.
+        :param callback: called from a worker thread with the name and the
+        details of every recording that was loaded.
+        :param workers: the number of worker threads.
+        """
+        self.folder: str = folder
+        self.callback: Callable[[str, RecordingInfo], None] = callback
+        self.executor: ThreadPoolExecutor = ThreadPoolExecutor(workers)
+
+        self.lock: Lock = Lock()
+        self.memo: dict[tuple[str, int], RecordingInfo] = {}
+        self.known: dict[str, RecordingInfo] = {}
+        self.pending: set[str] = set()
+        self.failed: dict[str, tuple[str, int]] = {}
+
+
+    def get(self, recording: str) -> RecordingInfo | None:
+        """
+        Get the details of a recording if they were loaded already.
+
+        :param recording: the recording's file name.
+        :return: the details, None if they are not loaded yet.
+        """
+        return self.known.get(recording)
+
+
+    def request(self, recordings: list[str]) -> None:
+        """
+        Load the details of recordings that are not known yet.
+
+        :param recordings: the recordings' file names.
+        """
+        with self.lock:
+            missing: list[str] = [recording for recording in recordings
+                                  if recording not in self.known and
+                                  recording not in self.pending and
+                                  not self.still_failing(recording)]
+            self.pending.update(missing)
+
+        for recording in missing:
+            self.executor.submit(self.load, recording)
+
+
+    def still_failing(self, recording: str) -> bool:
+        """
+        Check whether a recording could not be read and has not changed
+        since. Called with the lock held.
+
+        :param recording: the recording's file name.
+        :return: True -> reading it again would fail the same way.
+        """
+        key: tuple[str, int] | None = self.failed.get(recording)
+        if key is None:
+            return False
+
+        try:
+            return os.stat(key[0]).st_mtime_ns == key[1]
+        except OSError:
+            return True
+
+
+    def forget(self, recording: str) -> None:
+        """
+        Drop the known details of a recording that changed.
+
+        :param recording: the recording's file name.
+        """
+        with self.lock:
+            self.known.pop(recording, None)
+            self.failed.pop(recording, None)
+
+
+    def load(self, recording: str) -> None:
+        """
+        Load the details of a recording. Runs on a worker thread.
+
+        :param recording: the recording's file name.
+        """
+        path: str = os.path.join(self.folder, recording)
+        try:
+            key: tuple[str, int] = (path, os.stat(path).st_mtime_ns)
+        except OSError:
+            # gone already, the watcher reports it
+            with self.lock:
+                self.pending.discard(recording)
+            return
+
+        try:
+            info: RecordingInfo | None = self.memo.get(key)
+            if info is None:
+                info = read_header(path)
+        except (OSError, ValueError, KeyError, struct.error):
+            with self.lock:
+                self.failed[recording] = key
+                self.pending.discard(recording)
+            return
+
+        with self.lock:
+            self.memo[key] = info
+            self.known[recording] = info
+            self.pending.discard(recording)
+
+        self.callback(recording, info)
+
+
+    def shutdown(self) -> None:
+        """
+        Stop the worker threads, dropping requests that have not started.
+        """
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,191 @@
+import argparse, json, os, subprocess, sys, tempfile, wave
+
+
+APP_FOLDER: str = os.path.dirname(os.path.abspath(__file__))
+
+# run in a child process: starts the application, times the first window
+# and the end of library loading, then closes it again
+WINDOW_SCRIPT: str = """
+import json, time
+start = time.perf_counter()
+
+import tkinter
+import VoiceRecorder
+imported = time.perf_counter()
+
+times = {"import": imported - start}
+mainloop = tkinter.Tk.mainloop
+
+def timed_mainloop(root, n=0):
+    def mapped(event):
+        times.setdefault("window", time.perf_counter() - start)
+
+    def loaded(event):
+        times["library"] = time.perf_counter() - start
+        root.destroy()
+
+    root.bind("<Map>", mapped, add="+")
+    root.bind("<<LibraryLoaded>>", loaded, add="+")
+    mainloop(root, n)
+
+tkinter.Tk.mainloop = timed_mainloop
+VoiceRecorder.Recorder()
+print(json.dumps(times))
+"""
+
+
+def import_times(module: str = "VoiceRecorder") -> list[tuple[str, int, int]]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    :param module: the module to import.
+    :return: the (name, self, cumulative) import time in microseconds of
+    every module imported on the way, nested modules indented as reported.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {module}"], cwd=APP_FOLDER,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    times: list[tuple[str, int, int]] = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        times.append((name.rstrip()[1:], int(own), int(cumulative)))
+    return times
+
+
+def create_library(folder: str, recordings: int) -> None:
+    """
+    Fill a folder with short silent recordings, half of them with metadata,
+    to start the application on.
+
+    :param folder: the folder the application is started in.
+    :param recordings: the number of recordings.
+    """
+    os.makedirs(os.path.join(folder, "audio_recordings"))
+    os.makedirs(os.path.join(folder, "audio_metadata"))
+
+    for number in range(recordings):
+        name: str = f"recording_{number:06}.wav"
+        with wave.open(os.path.join(folder, "audio_recordings", name),
+                       "wb") as sound_file:
+            sound_file.setnchannels(1)
+            sound_file.setsampwidth(2)
+            sound_file.setframerate(44100)
+            sound_file.writeframes(bytes(882))
+
+        if number % 2:
+            with open(os.path.join(folder, "audio_metadata", f"{name}.json"),
+                      "w") as metadata_file:
+                json.dump({"duration": 0.01, "tags": ["benchmark"]},
+                          metadata_file)
+
+
+def window_times(recordings: int) -> dict:
+    """
+    Start the application on a generated library and time it.
+
+    :param recordings: the number of recordings in the library.
+    :return: the seconds until the imports were done ("import"), the window
+    was shown ("window") and the library was listed ("library").
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        create_library(folder, recordings)
+
+        environment: dict = {**os.environ, "PYTHONPATH": APP_FOLDER}
+        result = subprocess.run([sys.executable, "-c", WINDOW_SCRIPT],
+                                cwd=folder, env=environment,
+                                capture_output=True, text=True, timeout=600)
+        if result.returncode:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """
+    Find the timings that got slower than a baseline.
+
+    :param current: the timings just measured.
+    :param baseline: the timings measured before.
+    :param tolerance: the fraction a timing may grow by.
+    :return: a description of every regression.
+    """
+    regressions: list[str] = []
+    for key, value in current.items():
+        before: float | None = baseline.get(key)
+        if before and value > before * (1 + tolerance):
+            regressions.append(f"{key}: {before * 1000:.1f} ms -> "
+                               f"{value * 1000:.1f} ms")
+    return regressions
+
+
+def main() -> None:
+    """
+    Benchmark the startup of the application from the command line.
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure how long the voice recorder takes to start.")
+    parser.add_argument("--top", type=int, default=15,
+                        help="the number of slowest imports shown")
+    parser.add_argument("--recordings", type=int, default=2000,
+                        help="the size of the library the window is timed "
+                        "with, 0 to skip timing the window")
+    parser.add_argument("--save", metavar="PATH",
+                        help="store the timings as a baseline")
+    parser.add_argument("--baseline", metavar="PATH",
+                        help="compare the timings with a stored baseline, "
+                        "failing if any got slower")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="the fraction a timing may grow by before it "
+                        "counts as slower")
+    args = parser.parse_args()
+
+    times: list[tuple[str, int, int]] = import_times()
+    total: int = sum(own for _, own, _ in times)
+    print(f"imports: {total / 1000:.1f} ms over {len(times)} modules")
+    for name, own, cumulative in sorted(times, key=lambda time: time[1],
+                                        reverse=True)[:args.top]:
+        print(f"  {own / 1000:7.1f} ms self {cumulative / 1000:7.1f} ms "
+              f"total  {name.strip()}")
+
+    # modules are reported after the ones they import, so the application's
+    # own imports are the outermost ones listed just before it
+    print("imported by the application:")
+    names: list[str] = [name for name, _, _ in times]
+    end: int = names.index("VoiceRecorder")
+    start: int = end
+    while start > 0 and names[start - 1].startswith(" "):
+        start -= 1
+    for name, own, cumulative in times[start:end]:
+        if not name.startswith("    "):
+            print(f"  {cumulative / 1000:7.1f} ms  {name.strip()}")
+
+    timings: dict = {"imports": total / 1e6}
+    if args.recordings:
+        try:
+            timings.update(window_times(args.recordings))
+            print(f"window shown after {timings['window'] * 1000:.1f} ms, "
+                  f"{args.recordings} recordings listed after "
+                  f"{timings['library'] * 1000:.1f} ms")
+        except RuntimeError as error:
+            print(f"window not timed: {error}")
+
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(timings, baseline_file, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, "r") as baseline_file:
+            regressions: list[str] = compare(timings, json.load(baseline_file),
+                                             args.tolerance)
+        for regression in regressions:
+            print(f"slower: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
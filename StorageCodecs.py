@@ -0,0 +1,500 @@
+import os, struct, wave
+
+import numpy as np
+
+
+class RiceWriter:
+    """
+    Writes recordings in the RLAC format, a lossless format made of blocks
+    in which every channel is predicted with a fixed polynomial predictor and
+    the prediction residuals are Rice coded.
+
+    The quotients of the Rice codes are stored in a unary bit stream and the
+    remainders in a separate fixed width bit stream, so both can be decoded
+    without a per-sample loop.
+    """
+    MAGIC: bytes = b"RLAC"
+    HEADER: struct.Struct = struct.Struct("<4sBHBIQI")
+    BLOCK: struct.Struct = struct.Struct("<II")
+    CHANNEL: struct.Struct = struct.Struct("<BBII")
+
+    def __init__(self, path: str, block_frames: int = 4096) -> None:
+        """
+        Initializes a writer for a new recording.
+
+        :param path: where the recording is written.
+        :param block_frames: the number of frames per block.
+        """
+        self.file = open(path, "wb")
+        self.block_frames: int = block_frames
+        self.channels: int = 1
+        self.sampwidth: int = 2
+        self.rate: int = 44100
+        self.frames: int = 0
+        self.buffer: bytearray = bytearray()
+        self.header_written: bool = False
+
+
+    def __enter__(self) -> "RiceWriter":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def setnchannels(self, channels: int) -> None:
+        self.channels = channels
+
+
+    def setsampwidth(self, sampwidth: int) -> None:
+        if sampwidth not in (1, 2, 3):
+            raise ValueError("RLAC supports 8, 16 and 24 bit audio")
+        self.sampwidth = sampwidth
+
+
+    def setframerate(self, rate: int) -> None:
+        self.rate = int(rate)
+
+
+    def setparams(self, params: tuple) -> None:
+        self.setnchannels(params[0])
+        self.setsampwidth(params[1])
+        self.setframerate(params[2])
+
+
+    def write_header(self) -> None:
+        """
+        Write the file header. The number of frames is filled in on close.
+        """
+        self.file.write(self.HEADER.pack(self.MAGIC, 1, self.channels,
+                                         self.sampwidth, self.rate,
+                                         self.frames, self.block_frames))
+        self.header_written = True
+
+
+    def writeframes(self, data: bytes) -> None:
+        """
+        Add interleaved PCM audio to the recording.
+
+        :param data: the PCM audio.
+        """
+        if not self.header_written:
+            self.write_header()
+
+        self.buffer += data
+        block_bytes: int = self.block_frames * self.channels * self.sampwidth
+
+        while len(self.buffer) >= block_bytes:
+            self.write_block(bytes(self.buffer[:block_bytes]))
+            del self.buffer[:block_bytes]
+
+
+    def write_block(self, data: bytes) -> None:
+        """
+        Encode and write a single block.
+
+        :param data: the interleaved PCM audio of the block.
+        """
+        samples: np.ndarray = pcm_to_ints(data, self.sampwidth)
+        samples = samples.reshape(-1, self.channels)
+
+        payload: list[bytes] = [encode_channel(samples[:, channel])
+                                for channel in range(self.channels)]
+        size: int = sum(len(part) for part in payload)
+
+        self.file.write(self.BLOCK.pack(len(samples), size))
+        self.file.write(b''.join(payload))
+        self.frames += len(samples)
+
+
+    def close(self) -> None:
+        """
+        Write the remaining audio and finish the file.
+        """
+        if self.file.closed:
+            return
+
+        if not self.header_written:
+            self.write_header()
+        if self.buffer:
+            self.write_block(bytes(self.buffer))
+            self.buffer.clear()
+
+        self.file.seek(0)
+        self.write_header()
+        self.file.close()
+
+
+class RiceReader:
+    """
+    Reads recordings in the RLAC format, decoding one block at a time.
+    """
+    def __init__(self, path: str) -> None:
+        """
+        Initializes a reader for an existing recording.
+
+        :param path: the recording.
+        """
+        self.file = open(path, "rb")
+
+        header: bytes = self.file.read(RiceWriter.HEADER.size)
+        magic, version, self.channels, self.sampwidth, self.rate, \
+            self.frames, self.block_frames = RiceWriter.HEADER.unpack(header)
+        if magic != RiceWriter.MAGIC or version != 1:
+            self.file.close()
+            raise ValueError(f"not an RLAC recording: {path}")
+
+        self.position: int = 0
+        self.decoded: bytes = b''
+
+
+    def __enter__(self) -> "RiceReader":
+        return self
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def getnchannels(self) -> int:
+        return self.channels
+
+
+    def getsampwidth(self) -> int:
+        return self.sampwidth
+
+
+    def getframerate(self) -> int:
+        return self.rate
+
+
+    def getnframes(self) -> int:
+        return self.frames
+
+
+    def getparams(self) -> tuple:
+        return (self.channels, self.sampwidth, self.rate, self.frames,
+                "NONE", "not compressed")
+
+
+    def tell(self) -> int:
+        return self.position
+
+
+    def read_block(self) -> bytes:
+        """
+        Decode the next block of the file.
+
+        :return: the interleaved PCM audio of the block, empty at the end.
+        """
+        header: bytes = self.file.read(RiceWriter.BLOCK.size)
+        if len(header) < RiceWriter.BLOCK.size:
+            return b''
+
+        frames, size = RiceWriter.BLOCK.unpack(header)
+        payload: memoryview = memoryview(self.file.read(size))
+
+        samples: np.ndarray = np.empty((frames, self.channels), dtype=np.int64)
+        offset: int = 0
+        for channel in range(self.channels):
+            samples[:, channel], offset = decode_channel(payload, offset,
+                                                         frames)
+
+        return ints_to_pcm(samples.ravel(), self.sampwidth)
+
+
+    def readframes(self, count: int) -> bytes:
+        """
+        Read up to a number of frames.
+
+        :param count: the number of frames to read.
+        :return: the interleaved PCM audio.
+        """
+        frame_bytes: int = self.channels * self.sampwidth
+        wanted: int = count * frame_bytes
+
+        chunks: list[bytes] = [self.decoded]
+        available: int = len(self.decoded)
+        while available < wanted and len(block := self.read_block()):
+            chunks.append(block)
+            available += len(block)
+
+        data: bytes = b''.join(chunks)
+        self.decoded = data[wanted:]
+        self.position += len(data[:wanted]) // frame_bytes
+        return data[:wanted]
+
+
+    def setpos(self, position: int) -> None:
+        """
+        Move to a frame, skipping whole blocks without decoding them.
+
+        :param position: the frame to move to.
+        """
+        self.file.seek(RiceWriter.HEADER.size)
+        self.position, self.decoded = 0, b''
+
+        while True:
+            header: bytes = self.file.read(RiceWriter.BLOCK.size)
+            if len(header) < RiceWriter.BLOCK.size:
+                return
+
+            frames, size = RiceWriter.BLOCK.unpack(header)
+            if self.position + frames > position:
+                self.file.seek(-RiceWriter.BLOCK.size, os.SEEK_CUR)
+                break
+
+            self.file.seek(size, os.SEEK_CUR)
+            self.position += frames
+
+        self.readframes(position - self.position)
+
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def pcm_to_ints(data: bytes, sampwidth: int) -> np.ndarray:
+    """
+    Convert PCM audio to signed integers.
+
+    :param data: the PCM audio.
+    :param sampwidth: the number of bytes per sample.
+    :return: the samples.
+    """
+    if sampwidth == 1:
+        return np.frombuffer(data, dtype=np.uint8).astype(np.int64) - 128
+    if sampwidth == 3:
+        raw: np.ndarray = np.frombuffer(data, dtype=np.uint8)
+        raw = raw.reshape(-1, 3).astype(np.int64)
+        ints: np.ndarray = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(ints & 0x800000, ints - 0x1000000, ints)
+    return np.frombuffer(data, dtype="<i2").astype(np.int64)
+
+
+def ints_to_pcm(samples: np.ndarray, sampwidth: int) -> bytes:
+    """
+    Convert signed integers to PCM audio.
+
+    :param samples: the samples.
+    :param sampwidth: the number of bytes per sample.
+    :return: the PCM audio.
+    """
+    if sampwidth == 1:
+        return (samples + 128).astype(np.uint8).tobytes()
+    if sampwidth == 3:
+        raw: np.ndarray = samples.astype("<i4").view(np.uint8).reshape(-1, 4)
+        return raw[:, :3].tobytes()
+    return samples.astype("<i2").tobytes()
+
+
+def encode_channel(samples: np.ndarray) -> bytes:
+    """
+    Encode the samples of one channel of a block.
+
+    :param samples: the samples.
+    :return: the encoded channel.
+    """
+    # pick the fixed predictor that leaves the smallest residuals
+    order: int = min(range(min(3, len(samples))),
+                     key=lambda order: np.abs(np.diff(samples, n=order)).sum())
+    residuals: np.ndarray = np.diff(samples, n=order)
+
+    # zigzag the residuals into unsigned values
+    values: np.ndarray = np.where(residuals >= 0, 2 * residuals,
+                                  -2 * residuals - 1)
+
+    # pick the rice parameter that gives the fewest bits
+    mean: float = float(values.mean()) if len(values) else 0.0
+    guess: int = int(np.log2(mean)) if mean >= 1 else 0
+    k: int = min((k for k in range(max(guess - 1, 0), guess + 2)),
+                 key=lambda k: int((values >> k).sum()) + len(values) * k)
+
+    # unary quotients: a run of zeros closed by a one
+    quotients: np.ndarray = values >> k
+    unary: np.ndarray = np.zeros(int(quotients.sum()) + len(values),
+                                 dtype=np.uint8)
+    unary[np.cumsum(quotients + 1) - 1] = 1
+    unary_bytes: bytes = np.packbits(unary).tobytes()
+
+    # fixed width remainders, most significant bit first
+    shifts: np.ndarray = np.arange(k - 1, -1, -1)
+    remainder_bits: np.ndarray = (values[:, np.newaxis] >> shifts) & 1
+    remainder_bytes: bytes = np.packbits(
+        remainder_bits.astype(np.uint8).ravel()).tobytes()
+
+    warmup: bytes = samples[:order].astype("<i4").tobytes()
+    return RiceWriter.CHANNEL.pack(order, k, len(unary_bytes),
+                                   len(remainder_bytes)) + \
+        warmup + unary_bytes + remainder_bytes
+
+
+def decode_channel(payload: memoryview, offset: int, frames: int) \
+        -> tuple[np.ndarray, int]:
+    """
+    Decode the samples of one channel of a block.
+
+    :param payload: the encoded block.
+    :param offset: where the channel starts in the block.
+    :param frames: the number of frames in the block.
+    :return: the samples and the offset of the next channel.
+    """
+    order, k, unary_size, remainder_size = \
+        RiceWriter.CHANNEL.unpack_from(payload, offset)
+    offset += RiceWriter.CHANNEL.size
+
+    warmup: np.ndarray = np.frombuffer(payload, dtype="<i4", count=order,
+                                       offset=offset).astype(np.int64)
+    offset += 4 * order
+
+    count: int = frames - order
+    unary: np.ndarray = np.unpackbits(
+        np.frombuffer(payload, dtype=np.uint8, count=unary_size, offset=offset))
+    offset += unary_size
+    remainder_bits: np.ndarray = np.unpackbits(
+        np.frombuffer(payload, dtype=np.uint8, count=remainder_size,
+                      offset=offset))
+    offset += remainder_size
+
+    ends: np.ndarray = np.flatnonzero(unary)[:count]
+    quotients: np.ndarray = np.diff(ends, prepend=-1) - 1
+
+    weights: np.ndarray = 1 << np.arange(k - 1, -1, -1, dtype=np.int64)
+    remainders: np.ndarray = \
+        remainder_bits[:count * k].reshape(count, k).astype(np.int64) @ weights
+
+    values: np.ndarray = (quotients.astype(np.int64) << k) | remainders
+    sequence: np.ndarray = (values >> 1) ^ -(values & 1)
+
+    # undo the differences, starting from the highest order
+    for level in range(order - 1, -1, -1):
+        start: int = int(np.diff(warmup, n=level)[0])
+        sequence = np.concatenate(([start], start + np.cumsum(sequence)))
+
+    return sequence, offset
+
+
+class Codec:
+    """
+    A storage format for recordings, identified by its file extension.
+    """
+    extension: str = ""
+    name: str = ""
+
+    def open_reader(self, path: str):
+        raise NotImplementedError
+
+
+    def open_writer(self, path: str):
+        raise NotImplementedError
+
+
+class WavCodec(Codec):
+    """
+    Uncompressed PCM audio in a wav file.
+    """
+    extension: str = ".wav"
+    name: str = "WAV"
+
+    def open_reader(self, path: str) -> wave.Wave_read:
+        return wave.open(path, "rb")
+
+
+    def open_writer(self, path: str) -> wave.Wave_write:
+        return wave.open(path, "wb")
+
+
+class RiceCodec(Codec):
+    """
+    Lossless compressed audio in an RLAC file.
+    """
+    extension: str = ".rlac"
+    name: str = "RLAC"
+
+    def open_reader(self, path: str) -> RiceReader:
+        return RiceReader(path)
+
+
+    def open_writer(self, path: str) -> RiceWriter:
+        return RiceWriter(path)
+
+
+CODECS: dict[str, Codec] = {codec.extension: codec
+                            for codec in (WavCodec(), RiceCodec())}
+
+
+def is_recording(filename: str) -> bool:
+    """
+    Check whether a file is a finished recording in a supported format.
+
+    :param filename: the name of the file.
+    :return: True -> the file is a recording, False -> any other file.
+    """
+    return not filename.startswith(".") and \
+        os.path.splitext(filename)[1] in CODECS
+
+
+def split_recording_name(filename: str) -> tuple[str, str]:
+    """
+    Split a recording's file name into its title and its extension.
+
+    :param filename: the name of the recording.
+    :return: the title and the extension of the recording.
+    """
+    title, extension = os.path.splitext(filename)
+    if extension in CODECS:
+        return title, extension
+    return filename, ""
+
+
+def open_recording(path: str, mode: str = "rb", extension: str = ""):
+    """
+    Open a recording for streaming, in whatever format it is stored.
+
+    :param path: the recording.
+    :param mode: rb -> read an existing recording, wb -> write a new one.
+    :param extension: the format to use, taken from the path if empty.
+    :return: a reader or writer with the same interface as the wave module.
+    """
+    codec: Codec = CODECS[extension or os.path.splitext(path)[1]]
+    if mode == "rb":
+        return codec.open_reader(path)
+    return codec.open_writer(path)
+
+
+def transcode(path: str, extension: str, block_frames: int = 65536) -> str:
+    """
+    Convert a recording to another format. The converted recording replaces
+    the original once it is complete.
+
+    :param path: the recording.
+    :param extension: the target format.
+    :param block_frames: the number of frames converted at a time.
+    :return: the path of the converted recording.
+    """
+    folder, filename = os.path.split(path)
+    title, _ = split_recording_name(filename)
+    destination: str = os.path.join(folder, f"{title}{extension}")
+    temporary: str = os.path.join(folder, f".{title}{extension}.part")
+
+    try:
+        with open_recording(path) as reader, \
+                open_recording(temporary, "wb", extension) as writer:
+            writer.setnchannels(reader.getnchannels())
+            writer.setsampwidth(reader.getsampwidth())
+            writer.setframerate(reader.getframerate())
+
+            while len(data := reader.readframes(block_frames)):
+                writer.writeframes(data)
+
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    if destination != path:
+        os.remove(path)
+
+    return destination
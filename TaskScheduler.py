@@ -0,0 +1,312 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import wait as wait_futures
+from queue import Queue, Empty
+from threading import Event, Lock
+from typing import Callable
+import os, time, traceback
+
+
+class TaskCancelled(Exception):
+    """
+    Raised by a task that stops because it was cancelled.
+    """
+
+
+class CancelToken:
+    """
+    Tells a running task it should stop. It has the same is_set and wait as
+    a threading.Event, so it can be passed wherever a cancel event is
+    expected, and a task can wait on it in place of sleeping to wake up as
+    soon as it is cancelled.
+    """
+    def __init__(self) -> None:
+        self.event: Event = Event()
+        self.lock: Lock = Lock()
+        self.callbacks: list[Callable[[], None]] = []
+
+
+    def is_set(self) -> bool:
+        return self.event.is_set()
+
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait until the task is cancelled.
+
+        :param timeout: the longest time to wait in seconds.
+        :return: whether the task was cancelled.
+        """
+        return self.event.wait(timeout)
+
+
+    def cancel(self) -> None:
+        """
+        Cancel the task, and call the callbacks registered with on_cancel.
+        """
+        with self.lock:
+            if self.event.is_set():
+                return
+            self.event.set()
+            callbacks: list[Callable[[], None]] = self.callbacks
+            self.callbacks = []
+
+        for callback in callbacks:
+            callback()
+
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """
+        Have a callback called when the task is cancelled, for work that is
+        stopped by other means than the token. The callback is called at
+        once if the task is cancelled already.
+
+        :param callback: called without arguments, on the cancelling thread.
+        """
+        with self.lock:
+            if not self.event.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+
+    def check(self) -> None:
+        """
+        :raise TaskCancelled: the task was cancelled.
+        """
+        if self.event.is_set():
+            raise TaskCancelled()
+
+
+class Task:
+    """
+    A unit of work submitted to the scheduler.
+    """
+    def __init__(self, name: str, lane: str, token: CancelToken) -> None:
+        self.name: str = name
+        self.lane: str = lane
+        self.token: CancelToken = token
+        self.future: Future | None = None
+
+
+    def cancel(self) -> None:
+        """
+        Ask the task to stop. A task that has not started yet never runs.
+        """
+        self.token.cancel()
+        if self.future is not None:
+            self.future.cancel()
+
+
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """
+        Wait for the task to finish.
+
+        :param timeout: the longest time to wait in seconds, None to wait
+        as long as it takes.
+        :return: whether the task finished.
+        """
+        if self.future is None:
+            return False
+        return not wait_futures([self.future], timeout).not_done
+
+
+class TaskScheduler:
+    """
+    Runs the application's background work on a fixed number of threads.
+    Work is submitted to a lane, and each lane has its own small pool, so
+    recording, playback and file work never wait on each other while the
+    number of threads stays bounded however often buttons are pressed.
+    Work that arrives while a lane is busy waits for its turn.
+
+    Every task gets a cancellation token, and an optional completion
+    callback. Completion callbacks, and anything else tasks post, are
+    queued until the UI thread runs them with run_callbacks, so no task
+    ever calls into the UI itself and the UI thread can safely wait for a
+    task. Shutting down cancels every task and waits for the threads to
+    finish.
+    """
+    LANES: dict[str, int] = {"capture": 1, "playback": 1, "files": 2,
+                             "background": 2}
+
+    def __init__(self, lanes: dict[str, int] | None = None) -> None:
+        """
+        Initializes a scheduler. Threads are started as work arrives.
+
+        :param lanes: the maximum number of threads of every lane.
+        """
+        self.callbacks: Queue = Queue()
+        self.wakeup: tuple[int, int] | None = None
+        self.pools: dict[str, ThreadPoolExecutor] = {
+            lane: ThreadPoolExecutor(workers, thread_name_prefix=lane)
+            for lane, workers in (lanes or self.LANES).items()}
+
+        self.lock: Lock = Lock()
+        self.tasks: set[Task] = set()
+        self.closed: bool = False
+
+
+    def submit(self, lane: str, work: Callable, *args,
+               done: Callable | None = None, name: str = "") -> Task:
+        """
+        Schedule work on a lane.
+
+        :param lane: the lane to run on.
+        :param work: called with the arguments and a cancel token as the
+        last argument.
+        :param args: the arguments of the work.
+        :param done: called by run_callbacks with the work's return value
+        once it returns. Not called if the work raised an exception, or
+        once the scheduler is shut down.
+        :param name: describes the task.
+        :return: the scheduled task.
+        :raise RuntimeError: the scheduler was shut down.
+        """
+        task: Task = Task(name or getattr(work, "__name__", "task"), lane,
+                          CancelToken())
+
+        def run() -> None:
+            try:
+                result = work(*args, task.token)
+            except TaskCancelled:
+                return
+            except Exception:
+                traceback.print_exc()
+                return
+
+            if done is not None:
+                self.post(lambda: done(result))
+
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("scheduler is shut down")
+            self.tasks.add(task)
+            task.future = self.pools[lane].submit(run)
+
+        # also called for tasks cancelled before they started
+        task.future.add_done_callback(lambda future: self.forget(task))
+        return task
+
+
+    def forget(self, task: Task) -> None:
+        with self.lock:
+            self.tasks.discard(task)
+
+
+    def post(self, callback: Callable[[], None]) -> None:
+        """
+        Have a callback run on the UI thread. Safe to call from any thread,
+        callbacks posted after shutdown are dropped.
+
+        :param callback: called without arguments by run_callbacks.
+        """
+        if self.closed:
+            return
+
+        self.callbacks.put(callback)
+        if self.wakeup is not None:
+            try:
+                os.write(self.wakeup[1], b"\0")
+            except OSError:
+                # the pipe is full, so the UI thread wakes up anyway
+                pass
+
+
+    def wakeup_fd(self) -> int:
+        """
+        Get a file descriptor that becomes readable whenever a callback is
+        posted, for UI loops that can watch files to run callbacks straight
+        away instead of on their next poll.
+
+        :return: the read end of a pipe, emptied by run_callbacks.
+        """
+        if self.wakeup is None:
+            # only used once both ends are non-blocking, a blocking read end
+            # would hang run_callbacks once it is empty
+            wakeup: tuple[int, int] = os.pipe()
+            try:
+                for fd in wakeup:
+                    os.set_blocking(fd, False)
+            except (AttributeError, OSError):
+                for fd in wakeup:
+                    os.close(fd)
+                raise
+            self.wakeup = wakeup
+        return self.wakeup[0]
+
+
+    def run_callbacks(self) -> None:
+        """
+        Run the callbacks posted so far. Call this periodically, or when
+        the wakeup file descriptor is readable, on the UI thread.
+        """
+        if self.wakeup is not None:
+            try:
+                while os.read(self.wakeup[0], 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+        while not self.closed:
+            try:
+                callback: Callable[[], None] = self.callbacks.get_nowait()
+            except Empty:
+                return
+
+            # a failing callback must not keep the ones after it from running
+            try:
+                callback()
+            except Exception:
+                traceback.print_exc()
+
+
+    def running(self, lane: str | None = None) -> list[Task]:
+        """
+        Get the tasks that are queued or running.
+
+        :param lane: only the tasks of this lane, all tasks if None.
+        :return: the unfinished tasks.
+        """
+        with self.lock:
+            return [task for task in self.tasks
+                    if lane is None or task.lane == lane]
+
+
+    def cancel(self, lane: str | None = None) -> None:
+        """
+        Cancel the queued and running tasks.
+
+        :param lane: only the tasks of this lane, all tasks if None.
+        """
+        for task in self.running(lane):
+            task.cancel()
+
+
+    def shutdown(self, timeout: float = 5.0) -> bool:
+        """
+        Cancel every task and wait for the threads to finish. No completion
+        callbacks are posted from now on.
+
+        :param timeout: the longest time to wait in seconds.
+        :return: whether every thread finished in time.
+        """
+        with self.lock:
+            self.closed = True
+        self.cancel()
+
+        deadline: float = time.monotonic() + timeout
+        for pool in self.pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        futures: list[Future] = [task.future for task in self.running()
+                                 if task.future is not None]
+        finished: bool = not wait_futures(
+            futures, max(deadline - time.monotonic(), 0)).not_done
+        if finished:
+            # the threads exit as soon as their last task is done
+            for pool in self.pools.values():
+                pool.shutdown(wait=True)
+        return finished
@@ -0,0 +1,203 @@
+from collections import deque
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    """
+    Classifies chunks of 16-bit PCM audio as speech or silence from their
+    short-term energy and zero-crossing rate.
+    """
+    def __init__(self, rate: int = 44100, channels: int = 1,
+                 frame_size: int = 256, threshold_db: float = -50.0,
+                 margin_db: float = 12.0, zcr_threshold: float = 0.25,
+                 hangover: float = 0.3) -> None:
+        """
+        Initializes a detector for audio with the given format.
+
+        :param rate: the sample rate of the audio.
+        :param channels: the number of interleaved channels in the audio.
+        :param frame_size: the number of samples per analysis frame.
+        :param threshold_db: the lowest energy, in dBFS, considered speech.
+        :param margin_db: how far above the noise floor speech must be.
+        :param zcr_threshold: the zero-crossing rate above which a frame must
+        be especially loud to count as speech.
+        :param hangover: seconds of audio still treated as speech after the
+        last speech frame, so pauses between words are kept.
+        """
+        self.rate: int = rate
+        self.channels: int = channels
+        self.frame_size: int = frame_size
+        self.threshold_db: float = threshold_db
+        self.margin_db: float = margin_db
+        self.zcr_threshold: float = zcr_threshold
+        self.hangover: int = int(hangover * rate)
+
+        self.noise_floor: float = threshold_db - margin_db # dBFS
+        self.hangover_left: int = 0 # frames
+
+
+    def is_speech(self, data: bytes) -> bool:
+        """
+        Classify a chunk of audio.
+
+        :param data: a chunk of interleaved 16-bit PCM audio.
+        :return: True -> the chunk contains speech, False -> silence.
+        """
+        samples: np.ndarray = np.frombuffer(data, dtype=np.int16)
+        samples = samples.reshape(-1, self.channels).mean(axis=1)
+
+        # split the chunk into analysis frames, at least one per chunk
+        size: int = min(self.frame_size, len(samples)) or 1
+        count: int = len(samples) // size
+        frames: np.ndarray = samples[:count * size].reshape(count, size) / 32768
+
+        energy: np.ndarray = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+        zcr: np.ndarray = np.count_nonzero(np.diff(np.signbit(frames), axis=1),
+                                           axis=1) / size
+
+        threshold: float = max(self.threshold_db,
+                               self.noise_floor + self.margin_db)
+
+        # noisy (high zero-crossing) frames must be louder to count as speech
+        speech: np.ndarray = (energy > threshold) & \
+            ((zcr < self.zcr_threshold) | (energy > threshold + self.margin_db))
+
+        # follow the noise floor down quickly and up slowly
+        if len(energy):
+            quietest: float = float(energy.min())
+            if quietest < self.noise_floor:
+                self.noise_floor = quietest
+            elif not speech.any():
+                self.noise_floor += 0.05 * (quietest - self.noise_floor)
+
+        if speech.any():
+            self.hangover_left = self.hangover
+            return True
+
+        if self.hangover_left > 0:
+            self.hangover_left -= len(samples)
+            return True
+
+        return False
+
+
+class SpeechGate:
+    """
+    Decides which captured chunks are written to a recording, based on a
+    voice activity detector and one of the following modes:
+
+    skip: silent spans are left out of the recording.
+    trigger: the recording starts on the first speech and finishes after a
+    sustained silence.
+    mark: everything is written, speech regions are only recorded.
+    """
+    MODES: tuple[str, ...] = ("skip", "trigger", "mark")
+
+    def __init__(self, detector: VoiceActivityDetector, mode: str,
+                 preroll: float = 0.2, stop_after: float = 2.0) -> None:
+        """
+        Initializes a gate for a single recording.
+
+        :param detector: the detector used to classify chunks.
+        :param mode: one of skip, trigger or mark.
+        :param preroll: seconds of silence kept before speech so the start
+        of words is not clipped.
+        :param stop_after: seconds of silence after which a triggered
+        recording finishes.
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"unknown voice activity mode: {mode}")
+
+        self.detector: VoiceActivityDetector = detector
+        self.mode: str = mode
+        self.frame_bytes: int = 2 * detector.channels
+        self.preroll: int = int(preroll * detector.rate)
+        self.stop_after: int = int(stop_after * detector.rate)
+
+        self.held: deque[bytes] = deque()
+        self.held_frames: int = 0
+
+        self.triggered: bool = False
+        self.finished: bool = False
+        self.silence: int = 0 # frames
+
+        self.position: int = 0 # frames written so far
+        self.in_speech: bool = False
+        self.regions: list[list[int]] = []
+
+
+    def process(self, data: bytes) -> list[bytes]:
+        """
+        Pass a captured chunk through the gate.
+
+        :param data: a chunk of interleaved 16-bit PCM audio.
+        :return: the chunks that should be written to the recording.
+        """
+        if self.finished:
+            return []
+
+        speech: bool = self.detector.is_speech(data)
+
+        if self.mode == "mark":
+            chunks: list[bytes] = [data]
+        elif self.mode == "skip" or not self.triggered:
+            self.triggered = speech
+            chunks = self.release(data) if speech else self.hold(data)
+        else:
+            chunks = [data]
+            self.silence = 0 if speech else \
+                self.silence + len(data) // self.frame_bytes
+            self.finished = self.silence >= self.stop_after
+
+        # keep track of speech regions in the written audio
+        if speech and not self.in_speech:
+            self.regions.append([self.position, self.position])
+        self.in_speech = speech
+
+        self.position += sum(len(chunk) for chunk in chunks) // self.frame_bytes
+        if speech:
+            self.regions[-1][1] = self.position
+
+        return chunks
+
+
+    def hold(self, data: bytes) -> list[bytes]:
+        """
+        Keep a silent chunk as pre-roll, dropping the oldest held audio.
+
+        :param data: the silent chunk.
+        :return: an empty list, nothing is written.
+        """
+        self.held.append(data)
+        self.held_frames += len(data) // self.frame_bytes
+
+        while self.held and \
+                self.held_frames - len(self.held[0]) // self.frame_bytes \
+                >= self.preroll:
+            self.held_frames -= len(self.held.popleft()) // self.frame_bytes
+
+        return []
+
+
+    def release(self, data: bytes) -> list[bytes]:
+        """
+        Release the held pre-roll followed by a speech chunk.
+
+        :param data: the speech chunk.
+        :return: the chunks to be written.
+        """
+        chunks: list[bytes] = list(self.held) + [data]
+        self.held.clear()
+        self.held_frames = 0
+        return chunks
+
+
+    def speech_regions(self) -> list[list[float]]:
+        """
+        Get the speech regions of the written audio.
+
+        :return: a list of [start, end] pairs in seconds.
+        """
+        rate: int = self.detector.rate
+        return [[start / rate, end / rate] for start, end in self.regions]
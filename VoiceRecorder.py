@@ -1,27 +1,54 @@
 from tkinter import Tk, Label, Button, Listbox, Scrollbar, Frame, Toplevel, Entry
-from tkinter import END, LEFT, RIGHT, TOP
+from tkinter import Checkbutton, IntVar, StringVar
+from tkinter import END, LEFT, RIGHT, TOP, READABLE
 from tkinter.ttk import Notebook
 
-from threading import Thread
-import time, os, shutil
+from queue import Queue, Empty
+import argparse, os, shutil
 
-import pyaudio, wave
+import wave
 
 import random as rng, string
 
+from VoiceActivity import VoiceActivityDetector, SpeechGate
+from MetadataStore import update_metadata, rename_metadata, delete_metadata
+from MetadataStore import load_metadata, METADATA_FOLDER
+from NoiseReduction import NoiseProfile, SpectralGate, reduce_noise
+from AudioStream import from_pcm, to_pcm
+from StorageCodecs import CODECS, is_recording, split_recording_name
+from StorageCodecs import open_recording, transcode
+from RecordingIndex import RecordingIndex
+from DirectoryWatcher import DirectoryWatcher, Snapshot, Change
+from RecordingInfo import RecordingInfoLoader
+from RecordingEditor import merge_recordings, split_recording, export_recording
+from RecordingEditor import EditCancelled
+from EditList import EditList, EditedReader
+from MultiCapture import MultiCapture
+from FullDuplex import DuplexSession
+from LatencyCalibration import PyAudioLoopback, CalibrationError, calibrate
+from LatencyCalibration import load_calibration, save_calibration
+from TaskScheduler import TaskScheduler, Task, CancelToken
+from ControlServer import ControlServer, ControlError
+
 
 class Recorder:
     """
     Represents an instance of the application.
     """
-    def __init__(self) -> None:
+    def __init__(self, control: str | None = None,
+                 headless: bool = False) -> None:
         """
         Initializes an instance of the recorder application. Sets up the
         UI elements and class attributes.
+
+        :param control: the port or socket path the control API listens
+        on, None to not serve it.
+        :param headless: keep the window hidden, for when the recorder is
+        only driven through the control API.
         """
         # tkinter window setup
         self.root: Tk = Tk()
-        self.root.geometry("300x200+500+200")
+        self.root.geometry("480x200+500+200")
         self.root.resizable(False, False)
         self.root.title("Voice Recorder")
 
@@ -38,9 +65,11 @@ class Recorder:
 
         self.record_audio_tab: Frame = Frame(self.root)
         self.play_audio_tab: Frame = Frame(self.root)
+        self.tools_tab: Frame = Frame(self.root)
 
         self.tabs.add(self.record_audio_tab, text="Record Audio")
         self.tabs.add(self.play_audio_tab, text="Play Audio")
+        self.tabs.add(self.tools_tab, text="Tools")
 
         self.tabs.pack(expand=1, fill="both")
 
@@ -82,13 +111,65 @@ class Recorder:
                                           command=self.stop_recording)
         self.stop_button.place(relx=0.8, rely=0.75, anchor="center")
 
+        self.vad_button: Button = Button(self.record_audio_tab,
+                                         text="VAD: Off",
+                                         font=(self.BUTTON_FONT, 7),
+                                         width=12,
+                                         command=self.toggle_vad_mode)
+        self.vad_button.place(relx=0.98, rely=0.04, anchor="ne")
+
+        self.overdub_button: Button = Button(self.record_audio_tab,
+                                             text="Overdub: Off",
+                                             font=(self.BUTTON_FONT, 7),
+                                             width=12,
+                                             command=self.toggle_overdub)
+        self.overdub_button.place(relx=0.02, rely=0.04, anchor="nw")
+
         # record_audio_tab data and attributes
         self.recording_audio: bool = False
         self.recording_audio_paused: bool =False
         self.reset: bool = False
         self.current_time: int = 0 # microseconds
+        self.timer_job: str | None = None
+
+        # voice activity detection: off, skip, trigger or mark
+        self.vad_mode: str = "off"
+
+        # play the selected recording back while recording a new take, and
+        # the recording played back by the current take
+        self.overdub: bool = False
+        self.overdub_reference: str = ""
+
+        # remove the learned noise profile from new recordings
+        self.live_noise_reduction: bool = False
+
+        # format new recordings are stored in, and recordings being converted
+        self.storage_codec: str = ".wav"
+        self.transcoding: set[str] = set()
+
+        # recording, playback and file work runs on the scheduler's threads,
+        # with the running recording, replay and merge, split or export
+        self.scheduler: TaskScheduler = TaskScheduler()
+        self.capture_task: Task | None = None
+        self.playback_task: Task | None = None
+        self.edit_task: Task | None = None
         
         self.recordings: list[str] = []
+        self.pending_recordings: list[str] = [] # finished but not yet saved
+
+        # input devices recorded together, the default device if fewer than
+        # two, and whether they are saved as separate or interleaved tracks
+        self.capture_devices: list[int] = []
+        self.capture_layout: str = "separate"
+
+        # searchable index of the recordings and the ones currently listed
+        self.recording_index: RecordingIndex = RecordingIndex()
+        self.visible_recordings: list[str] = []
+
+        # format details read from the headers of the listed recordings
+        self.info_updates: Queue = Queue()
+        self.recording_info: RecordingInfoLoader = RecordingInfoLoader(
+            "audio_recordings", lambda name, info: self.info_updates.put(name))
 
         # play_audio_tab ui elements
         self.play_audio_tab.config(background=self.bg_color)
@@ -105,10 +186,31 @@ class Recorder:
 
         self.title_and_selection.pack(side=TOP, fill="x")
 
+        # search bar
+        self.search_bar: Frame = Frame(self.play_audio_tab,
+                                       background=self.bg_color)
+
+        self.search_label: Label = Label(self.search_bar, text="Search:",
+                                         font=(self.TEXT_FONT, 9),
+                                         background=self.bg_color)
+        self.search_label.pack(side=LEFT, padx=(5, 0))
+
+        self.search_text: StringVar = StringVar(self.root)
+        self.search_text.trace_add("write",
+                                   lambda *args: self.update_recording_listbox())
+
+        self.search_entry: Entry = Entry(self.search_bar,
+                                         textvariable=self.search_text,
+                                         font=(self.TEXT_FONT, 9))
+        self.search_entry.pack(side=LEFT, fill="x", expand=1, padx=5)
+
+        self.search_bar.pack(side=TOP, fill="x")
+
         # audio list
         self.recording_listbox: Listbox = Listbox(self.play_audio_tab,
                                                   relief="sunken",
-                                                  width=31, height=10)
+                                                  font=(self.TEXT_FONT, 8),
+                                                  width=48, height=9)
         self.recording_listbox.pack(side=LEFT, padx=(5, 0), pady=5)
 
         # scrollbar
@@ -152,17 +254,20 @@ class Recorder:
 
         self.buttons.pack(side=RIGHT, fill='y', padx=5, pady=5)
 
-        # connect recording listbox and scrollbar
-        self.recording_listbox.config(yscrollcommand=self.scrollbar.set)
+        # connect recording listbox and scrollbar, load the details of the
+        # rows that scroll into view
+        def on_listbox_scroll(first: str, last: str) -> None:
+            self.scrollbar.set(first, last)
+            self.show_visible_info()
+
+        self.recording_listbox.config(yscrollcommand=on_listbox_scroll)
         self.scrollbar.config(command=self.recording_listbox.yview)
 
         self.current_audio: str = ""
 
         def on_listbox_select(event) -> None:
             try:
-                index: int = int(event.widget.curselection()[0])
-                value: str = event.widget.get(index)
-                self.current_audio = value
+                self.current_audio = self.selected_recording()
                 
                 self.current_audio_selection.config(text=self.current_audio)
             except IndexError:
@@ -175,32 +280,228 @@ class Recorder:
         self.playing_audio: bool = False
         self.playing_audio_paused: bool = False
 
-        # ensure audio folder exists and set recordings list
-        self.sort_audio_recordings()
-        self.update_recording_listbox()
+        # tools_tab ui elements
+        self.tools_tab.config(background=self.bg_color)
+
+        self.batch_button: Button = Button(self.tools_tab, text="Batch",
+                                           font=(self.BUTTON_FONT, 9),
+                                           width=10,
+                                           command=self.batch_process_menu)
+        self.batch_button.grid(row=0, column=0, padx=5, pady=(10, 1))
+
+        self.denoise_button: Button = Button(self.tools_tab, text="Denoise",
+                                             font=(self.BUTTON_FONT, 9),
+                                             width=10,
+                                             command=self.noise_reduction_menu)
+        self.denoise_button.grid(row=0, column=1, padx=5, pady=(10, 1))
+
+        self.codec_button: Button = Button(self.tools_tab, text="Codec: WAV",
+                                           font=(self.BUTTON_FONT, 9),
+                                           width=10,
+                                           command=self.toggle_storage_codec)
+        self.codec_button.grid(row=1, column=0, padx=5, pady=1)
+
+        self.tags_button: Button = Button(self.tools_tab, text="Tags",
+                                          font=(self.BUTTON_FONT, 9),
+                                          width=10,
+                                          command=self.edit_tags_menu)
+        self.tags_button.grid(row=1, column=1, padx=5, pady=1)
+
+        self.duplicates_button: Button = Button(self.tools_tab,
+                                                text="Duplicates",
+                                                font=(self.BUTTON_FONT, 9),
+                                                width=10,
+                                                command=self.duplicates_menu)
+        self.duplicates_button.grid(row=2, column=0, padx=5, pady=1)
+
+        self.merge_button: Button = Button(self.tools_tab, text="Merge",
+                                           font=(self.BUTTON_FONT, 9),
+                                           width=10,
+                                           command=self.merge_menu)
+        self.merge_button.grid(row=2, column=1, padx=5, pady=1)
+
+        self.split_button: Button = Button(self.tools_tab, text="Split",
+                                           font=(self.BUTTON_FONT, 9),
+                                           width=10,
+                                           command=self.split_menu)
+        self.split_button.grid(row=3, column=0, padx=5, pady=1)
+
+        self.export_button: Button = Button(self.tools_tab, text="Export",
+                                            font=(self.BUTTON_FONT, 9),
+                                            width=10,
+                                            command=self.export_menu)
+        self.export_button.grid(row=3, column=1, padx=5, pady=1)
+
+        self.edit_button: Button = Button(self.tools_tab, text="Edit",
+                                          font=(self.BUTTON_FONT, 9),
+                                          width=10,
+                                          command=self.edit_recording_menu)
+        self.edit_button.grid(row=4, column=0, padx=5, pady=1)
+
+        self.devices_button: Button = Button(self.tools_tab, text="Devices",
+                                             font=(self.BUTTON_FONT, 9),
+                                             width=10,
+                                             command=self.capture_devices_menu)
+        self.devices_button.grid(row=4, column=1, padx=5, pady=1)
+
+        self.calibrate_button: Button = Button(self.tools_tab,
+                                               text="Calibrate",
+                                               font=(self.BUTTON_FONT, 9),
+                                               width=10,
+                                               command=self.calibration_menu)
+        self.calibrate_button.grid(row=5, column=0, padx=5, pady=1)
+
+        # read the recordings list in the background, so the window shows up
+        # straight away however large the library is, then follow changes
+        # made to the audio folder by other programs
+        self.library_loaded: bool = False
+        self.library_snapshot: Snapshot = {}
+        self.library_updates: Queue = Queue()
+        self.library_changes: Queue = Queue()
+        self.library_watcher: DirectoryWatcher = DirectoryWatcher(
+            "audio_recordings", self.library_changes.put, include=is_recording)
+
+        self.scheduler.submit("files", self.load_library)
+        self.root.after(0, self.apply_library_load)
+        self.root.after(100, self.apply_recording_info)
+        self.root.after(0, self.apply_task_callbacks)
+
+        # run posted callbacks straight away where Tk can watch files,
+        # rather than on the next poll
+        if hasattr(self.root.tk, "createfilehandler"):
+            self.root.tk.createfilehandler(
+                self.scheduler.wakeup_fd(), READABLE,
+                lambda *args: self.scheduler.run_callbacks())
+
+        # serve the control API, its commands run on the Tk thread
+        self.control: ControlServer | None = None
+        if control:
+            self.control = ControlServer(control, self.control_command,
+                                         self.scheduler.post)
+            self.control.start()
+
+        if headless:
+            self.root.withdraw()
 
         self.root.mainloop()
 
+        # stop the background work before exiting, an unsaved recording is
+        # discarded
+        if self.control is not None:
+            self.control.stop()
+        self.scheduler.shutdown()
+        self.library_watcher.stop()
+        self.recording_info.shutdown()
 
-    def sort_audio_recordings(self) -> None:
+
+    def apply_task_callbacks(self) -> None:
+        """
+        Run the completion callbacks and UI updates posted by scheduled
+        tasks. Runs periodically on the Tk thread.
+        """
+        try:
+            self.scheduler.run_callbacks()
+        finally:
+            self.root.after(20, self.apply_task_callbacks)
+
+
+    def load_library(self, token: CancelToken) -> None:
         """
-        Sort the files in the audio_recordings folder in descending order
-        acording to their date of creation and store them in the recordings
-        list. Create the folder if it doesn't exist.
+        Read the files in the audio_recordings folder, sorted by their date
+        of creation, along with their metadata. Create the folder if it
+        doesn't exist. Runs as a scheduled task, handing the recordings to
+        apply_library_load in batches, newest first, so the rows at the top
+        of the list are filled in first.
+
+        :param token: cancels loading.
         """
         while True:
             try:
-                files: list[str] = []
-                for audio_file in os.listdir("./audio_recordings"):
-                    files.append(audio_file)
-
-                files.sort(key=lambda path: \
-                           os.stat(f"audio_recordings/{path}").st_ctime)
-                
-                self.recordings = files
+                files: list[tuple[float, str, int]] = []
+                snapshot: Snapshot = {}
+                with os.scandir("./audio_recordings") as entries:
+                    for entry in entries:
+                        if is_recording(entry.name):
+                            stat: os.stat_result = entry.stat()
+                            files.append((stat.st_ctime, entry.name,
+                                          stat.st_size))
+                            snapshot[entry.name] = (entry.inode(),
+                                                    stat.st_mtime_ns,
+                                                    stat.st_size)
+
+                files.sort()
                 break
             except FileNotFoundError:
-                os.makedirs("audio_recordings")
+                os.makedirs("audio_recordings", exist_ok=True)
+
+        # only recordings with a metadata file have tags or a known duration
+        try:
+            described: set[str] = set(os.listdir(METADATA_FOLDER))
+        except FileNotFoundError:
+            described = set()
+
+        # a small first batch fills the rows in view quickly
+        batch_size: int = 50
+        end: int = len(files)
+        while end > 0:
+            token.check()
+            start: int = max(end - batch_size, 0)
+            batch: list[tuple[float, str, int, dict]] = []
+            for created, name, size in files[start:end]:
+                metadata: dict = load_metadata(name) \
+                    if f"{name}.json" in described else {}
+                batch.append((created, name, size, metadata))
+
+            self.library_updates.put(batch)
+            end = start
+            batch_size = 500
+
+        self.library_snapshot = snapshot
+        self.library_updates.put(None)
+
+
+    def apply_library_load(self) -> None:
+        """
+        Add the recordings read by load_library to the recordings list and
+        index as they arrive. Runs periodically on the Tk thread until the
+        whole library is loaded, then starts following changes to the audio
+        folder and generates a <<LibraryLoaded>> event.
+        """
+        loaded: bool = False
+        added: bool = False
+        try:
+            while not loaded:
+                batch: list | None = self.library_updates.get_nowait()
+                if batch is None:
+                    loaded = True
+                    continue
+
+                # every batch is older than the recordings already listed,
+                # recordings made meanwhile are in the index already
+                names: list[str] = []
+                for created, name, size, metadata in batch:
+                    if name not in self.recording_index:
+                        self.recording_index.add(name, created, size,
+                                                 metadata.get("duration"),
+                                                 metadata.get("tags"))
+                        names.append(name)
+                self.recordings[:0] = names
+                added = True
+        except Empty:
+            pass
+
+        if added:
+            self.update_recording_listbox()
+
+        if not loaded:
+            self.root.after(20, self.apply_library_load)
+            return
+
+        # changes made while loading show up against the snapshot
+        self.library_loaded = True
+        self.library_watcher.start(self.library_snapshot)
+        self.root.after(100, self.apply_library_changes)
+        self.root.event_generate("<<LibraryLoaded>>")
 
 
     def start_recording(self) -> None:
@@ -219,6 +520,7 @@ class Recorder:
             self.recording_indicator.config(foreground="grey")
             self.start_button.config(text="Start")
             self.root.title("Voice Recorder")
+            self.emit("recording", state="paused")
         else:
             # start/continue recording audio
             self.recording_audio = True
@@ -228,15 +530,16 @@ class Recorder:
             if not self.recording_audio_paused:
                 self.recording_audio_paused = True
 
-                # start new audio thread
-                audio_thread: Thread = Thread(target=self.start_audio)
-                audio_thread.daemon = True
-                audio_thread.start()
+                # play the selected recording along with a new take
+                self.overdub_reference = self.current_audio \
+                    if self.overdub and \
+                    self.current_audio in self.recording_index else ""
 
-                # start new timer thread
-                timer_thread: Thread = Thread(target=self.start_timer)
-                timer_thread.daemon = True
-                timer_thread.start()
+                # record on the capture lane, a recording that is still
+                # being written finishes first
+                self.capture_task = self.scheduler.submit("capture",
+                                                          self.start_audio)
+                self.start_timer()
             else:
                 self.recording_audio_paused = False
 
@@ -244,8 +547,30 @@ class Recorder:
             self.recording_indicator.config(foreground="red")
             self.start_button.config(text="Pause")
             self.root.title("RECORDING...")
+            self.emit("recording", state="recording")
 
     
+    def toggle_vad_mode(self) -> None:
+        """
+        Cycle through the voice activity detection modes. The mode is used
+        by the next recording that is started.
+        """
+        modes: list[str] = ["off", *SpeechGate.MODES]
+        self.vad_mode = modes[(modes.index(self.vad_mode) + 1) % len(modes)]
+        self.vad_button.config(text=f"VAD: {self.vad_mode.capitalize()}")
+
+
+    def toggle_overdub(self) -> None:
+        """
+        Turn overdubbing on or off. While overdubbing, the recording selected
+        on the play tab is played back through a full-duplex stream as the
+        next recording is made.
+        """
+        self.overdub = not self.overdub
+        self.overdub_button.config(
+            text=f"Overdub: {'On' if self.overdub else 'Off'}")
+
+
     def update_timer_text(self, mins: int, secs: int, micros: int) -> None:
         """
         Update the timer ui with the given hour, second and microsecond 
@@ -261,29 +586,36 @@ class Recorder:
 
     def start_timer(self) -> None:
         """
-        Start the recording timer.
+        Start the recording timer. It ticks on the Tk thread, replacing the
+        timer of an earlier recording.
         """
-        minutes, seconds, microseconds = 0, 0, 0
+        if self.timer_job is not None:
+            self.root.after_cancel(self.timer_job)
+        self.tick_timer()
 
-        while True:
-            # run timer
-            while self.recording_audio:
-                seconds, microseconds = divmod(self.current_time, 100)
-                minutes, seconds = divmod(seconds, 60)
 
-                self.update_timer_text(minutes, seconds, microseconds)
+    def tick_timer(self) -> None:
+        """
+        Advance the recording timer every hundredth of a second while
+        recording, hold it while paused and stop once the recording stops.
+        """
+        self.timer_job = None
+
+        # stop timer
+        if not (self.recording_audio or self.recording_audio_paused):
+            return
+
+        # run timer
+        if self.recording_audio:
+            seconds, microseconds = divmod(self.current_time, 100)
+            minutes, seconds = divmod(seconds, 60)
 
-                time.sleep(0.01)
-                self.current_time += 1
+            self.update_timer_text(minutes, seconds, microseconds)
+            self.current_time += 1
+
+        self.timer_job = self.root.after(10, self.tick_timer)
 
-            # pause timer
-            while self.recording_audio_paused:
-                time.sleep(0.001)
 
-            # stop timer
-            if not (self.recording_audio or self.recording_audio_paused):
-                break
-            
 
     def generate_temporary_file_name(self) -> str:
         """
@@ -296,37 +628,104 @@ class Recorder:
         return name
     
 
-    def start_audio(self) -> None:
+    def start_audio(self, token: CancelToken) -> None:
         """
-        Start recording audio.
+        Start recording audio. Runs as a scheduled task until the recording
+        is stopped.
+
+        :param token: cancels the recording, which is then discarded.
         """
-        # record audio frames
+        if len(self.capture_devices) > 1:
+            self.start_multi_device_audio(token)
+            return
+
+        # the buffer size and latency measured for the default devices
+        calibration: dict = load_calibration() or {}
+        buffer_size: int = calibration.get("frames_per_buffer", 1024)
+
+        # record audio frames, through a duplex stream playing the reference
+        # recording back when overdubbing
+        import pyaudio
+
         audio = pyaudio.PyAudio()
-        stream = audio.open(format=pyaudio.paInt16, channels=1, rate=44100,
-                            input=True, frames_per_buffer=1024)
+        duplex: DuplexSession | None = None
+        if self.overdub_reference:
+            duplex = DuplexSession(
+                audio, f"audio_recordings/{self.overdub_reference}",
+                frames_per_buffer=buffer_size,
+                latency=calibration.get("latency"))
+            duplex.start()
+        else:
+            stream = audio.open(format=pyaudio.paInt16, channels=1, rate=44100,
+                                input=True, frames_per_buffer=buffer_size)
         
         frames: list[bytes] = list()
 
+        # optionally pass the audio through voice activity detection
+        gate: SpeechGate | None = None
+        if self.vad_mode != "off":
+            gate = SpeechGate(VoiceActivityDetector(rate=44100, channels=1),
+                              self.vad_mode)
+        auto_stopped: bool = False
+
+        # optionally remove background noise before anything else, a
+        # profile learned at another sample rate does not fit
+        denoiser: SpectralGate | None = None
+        profile: NoiseProfile | None = NoiseProfile.load()
+        if self.live_noise_reduction and profile is not None and \
+                profile.rate == 44100:
+            denoiser = SpectralGate(profile, channels=1, rate=44100)
+
         while True:
             # record audio
-            while self.recording_audio:
-                data: bytes = stream.read(1024)
-                frames.append(data)
+            while self.recording_audio and not token.is_set():
+                if duplex is None:
+                    data: bytes = stream.read(buffer_size)
+                elif not (data := duplex.read()):
+                    continue
+
+                if denoiser is not None:
+                    data = to_pcm(denoiser.process(from_pcm(data, 2, 1)), 2)
+
+                if gate is None:
+                    frames.append(data)
+                    continue
+
+                frames.extend(gate.process(data))
+
+                # a triggered recording stops itself after a long silence
+                if gate.finished and not auto_stopped:
+                    auto_stopped = True
+                    self.scheduler.post(self.stop_recording)
 
-            # pause recording
-            while self.recording_audio_paused:
-                time.sleep(0.001)
+            # pause recording, and playback along with it
+            if duplex is not None:
+                duplex.pause()
+
+            while self.recording_audio_paused and not token.wait(0.001):
+                pass
 
             # stop recording
-            if not (self.recording_audio or self.recording_audio_paused):
+            if token.is_set() or \
+                    not (self.recording_audio or self.recording_audio_paused):
                 break
+
+            if duplex is not None:
+                duplex.resume()
         
-        stream.stop_stream()
-        stream.close()
+        if duplex is not None:
+            duplex.stop()
+        else:
+            stream.stop_stream()
+            stream.close()
         audio.terminate()
 
-        # do not save the file if the reset button was hit
-        if self.reset:
+        if denoiser is not None:
+            frames.append(to_pcm(denoiser.flush(), 2))
+
+        # do not save the file if the reset button was hit, or the application
+        # is closing
+        if self.reset or token.is_set():
             self.reset = False
             return
 
@@ -345,7 +744,88 @@ class Recorder:
         sound_file.writeframes(b''.join(frames))
         sound_file.close()
 
+        metadata: dict = {"duration": sum(map(len, frames)) / 2 / 44100}
+        if gate is not None:
+            metadata.update(vad_mode=gate.mode,
+                            speech_regions=gate.speech_regions())
+        if duplex is not None:
+            # the take is late by the round trip latency, trimming it off
+            # lines the take up with the reference
+            metadata.update(overdub_of=self.overdub_reference,
+                            latency=duplex.latency,
+                            underruns=duplex.underruns,
+                            edits=EditList(trim_in=duplex.latency).to_dict())
+        update_metadata(temp_file_name, **metadata)
+
         self.recordings.append(temp_file_name)
+        self.pending_recordings = [temp_file_name]
+
+
+    def start_multi_device_audio(self, token: CancelToken) -> None:
+        """
+        Start recording all the chosen input devices together, each on its
+        own track. Voice activity detection and noise reduction only apply
+        to single device recordings.
+
+        :param token: cancels the recording, which is then discarded.
+        """
+        import pyaudio
+
+        audio = pyaudio.PyAudio()
+
+        # create temporary files to store the tracks
+        paths: list[str] = []
+        while len(paths) < len(self.recording_titles("")):
+            temp_file_name: str = f"{self.generate_temporary_file_name()}.wav"
+            if temp_file_name not in self.recordings + paths:
+                paths.append(temp_file_name)
+
+        capture: MultiCapture = MultiCapture(audio, self.capture_devices,
+                                             paths, self.capture_layout)
+        capture.start()
+
+        # follow pauses until the recording is stopped
+        while (self.recording_audio or self.recording_audio_paused) and \
+                not token.is_set():
+            if self.recording_audio != capture.running:
+                if self.recording_audio:
+                    capture.resume()
+                else:
+                    capture.pause()
+            token.wait(0.01)
+
+        capture.stop()
+        audio.terminate()
+
+        # do not save the files if the reset button was hit, or the
+        # application is closing
+        if self.reset or token.is_set():
+            self.reset = False
+            for path in paths:
+                os.remove(path)
+            return
+
+        for path in paths:
+            update_metadata(path, duration=capture.duration,
+                            devices=self.capture_devices,
+                            layout=self.capture_layout,
+                            overflows=capture.overflows)
+            self.recordings.append(path)
+        self.pending_recordings = paths
+
+
+    def recording_titles(self, title: str) -> list[str]:
+        """
+        Get the titles the next recording is saved under, one per track when
+        several devices are recorded to separate files.
+
+        :param title: the title given to the recording.
+        :return: the titles of the recording's files.
+        """
+        if len(self.capture_devices) > 1 and self.capture_layout == "separate":
+            return [f"{title}_{number}"
+                    for number in range(1, len(self.capture_devices) + 1)]
+        return [title]
 
 
     def reset_recording(self) -> None:
@@ -370,6 +850,13 @@ class Recorder:
         if not confirm:
             return
         
+        self.discard_recording()
+
+
+    def discard_recording(self) -> None:
+        """
+        Throw away a paused recording without asking.
+        """
         # unpause and reset the recording
         self.reset = True
         self.recording_audio_paused = False
@@ -380,6 +867,7 @@ class Recorder:
 
         self.recording_indicator.config(foreground="grey")    
         self.start_button.config(text="Start")
+        self.emit("recording", state="discarded")
 
 
     def confirm_reset(self) -> bool:
@@ -452,6 +940,19 @@ class Recorder:
         if not (self.recording_audio or self.recording_audio_paused):
             return
 
+        self.hold_recording()
+
+        # launch save recording pop-up menu and get recording title
+        save_title: str = self.save_recording_menu()
+
+        if save_title:
+            self.save_recording(save_title)
+
+
+    def hold_recording(self) -> None:
+        """
+        Pause the recording until it is saved, discarded or resumed.
+        """
         # pause recording
         self.recording_audio = False
         self.recording_audio_paused = True
@@ -459,37 +960,157 @@ class Recorder:
         self.recording_indicator.config(foreground="grey")
         self.start_button.config(text="Start")
         self.root.title("Voice Recorder")
+        self.emit("recording", state="stopped")
 
-        # launch save recording pop-up menu and get recording title
-        save_title: str = self.save_recording_menu()
 
-        if save_title:
-            # stop the recording
-            self.recording_audio_paused = False
+    def save_recording(self, save_title: str) -> list[str]:
+        """
+        Finish a held recording and save it under a title, without asking.
+
+        :param save_title: the title, checked with title_problem.
+        :return: the saved recordings, one per track.
+        """
+        saved: list[str] = []
+
+        # stop the recording
+        self.recording_audio_paused = False
 
-            # reset timer and update ui elements
-            self.update_timer_text(0, 0, 0)
-            self.current_time = 0
+        # reset timer and update ui elements
+        self.update_timer_text(0, 0, 0)
+        self.current_time = 0
 
-            # change file name
-            time.sleep(0.5)
+        # change file name once the recording is written
+        if self.capture_task is not None:
+            self.capture_task.wait()
+            self.capture_task = None
 
-            recording: str = self.recordings[-1]
-            os.rename(recording, f"{save_title}.wav")
-            recording = f"{save_title}.wav"
-            self.recordings = self.recordings[:-1] + [recording]
+        # the directory watcher may have added recordings in the meantime
+        titles: list[str] = self.recording_titles(save_title)
+        for pending, title in zip(self.pending_recordings, titles):
+            recording: str = f"{title}.wav"
+            os.rename(pending, recording)
+            rename_metadata(pending, recording)
+            self.recordings.remove(pending)
+            self.recordings.append(recording)
 
             # store file in the appropriate folder
             self.move_audio_to_file(recording)
+            self.index_recording(recording)
+            saved.append(recording)
+            self.emit("saved", recording=recording,
+                      path=os.path.abspath(
+                          os.path.join("audio_recordings", recording)),
+                      duration=load_metadata(recording).get("duration"))
 
-            # update recording listbox
-            self.update_recording_listbox()
+            # compress the recording in the background
+            if self.storage_codec != ".wav":
+                self.transcode_recording(recording, self.storage_codec)
 
-            # if there is no selected audio, update ui accordingly
-            if not self.current_replay:
-                self.current_audio = ""
+        self.pending_recordings = []
+
+        # update recording listbox
+        self.update_recording_listbox()
+
+        # if there is no selected audio, update ui accordingly
+        if not self.current_replay:
+            self.current_audio = ""
+            self.current_audio_selection.config(text=self.current_audio)
+
+        return saved
+
+
+    def toggle_storage_codec(self) -> None:
+        """
+        Cycle through the formats new recordings are stored in.
+        """
+        extensions: list[str] = list(CODECS)
+        index: int = extensions.index(self.storage_codec)
+        self.storage_codec = extensions[(index + 1) % len(extensions)]
+        self.codec_button.config(
+            text=f"Codec: {CODECS[self.storage_codec].name}")
+
+
+    def transcode_recording(self, recording: str, extension: str) -> None:
+        """
+        Convert a recording to another format in a separate thread, and
+        swap it into the recordings list once it is done. The recording
+        cannot be renamed or deleted in the meantime.
+
+        :param recording: the recording to convert.
+        :param extension: the format to convert to.
+        """
+        self.transcoding.add(recording)
+
+        def finish(converted: str) -> None:
+            self.transcoding.discard(recording)
+            if not converted:
+                return
+
+            rename_metadata(recording, converted)
+            if recording in self.recordings:
+                index: int = self.recordings.index(recording)
+                self.recordings[index] = converted
+
+            self.recording_index.rename(recording, converted)
+            self.recording_index.update(
+                converted, size=os.path.getsize(f"audio_recordings/{converted}"))
+
+            if self.current_audio == recording:
+                self.current_audio = converted
                 self.current_audio_selection.config(text=self.current_audio)
 
+            self.update_recording_listbox()
+            self.emit("transcoded", recording=recording, converted=converted)
+
+        def run(token: CancelToken) -> str:
+            try:
+                path: str = transcode(f"audio_recordings/{recording}",
+                                      extension)
+                return os.path.basename(path)
+            except OSError:
+                # the original is in use, keep it as it is
+                return ""
+
+        self.scheduler.submit("files", run, done=finish)
+
+
+    def index_recording(self, recording: str) -> None:
+        """
+        Add a recording in the audio_recordings folder to the recording index.
+
+        :param recording: the recording's file name.
+        """
+        stat: os.stat_result = os.stat(f"audio_recordings/{recording}")
+        metadata: dict = load_metadata(recording)
+        self.recording_index.add(recording, stat.st_ctime, stat.st_size,
+                                 metadata.get("duration"),
+                                 metadata.get("tags"))
+
+
+    def recording_title_taken(self, title: str) -> bool:
+        """
+        Check whether a title is used by a recording in any format.
+
+        :param title: the title without an extension.
+        :return: True -> the title is taken, False -> the title is free.
+        """
+        return any(f"{title}{extension}" in self.recordings
+                   for extension in CODECS)
+
+
+    def title_problem(self, title: str) -> str:
+        """
+        Check whether the next recording can be saved under a title.
+
+        :param title: the title without an extension.
+        :return: what is wrong with the title, empty if it can be used.
+        """
+        if any(map(self.recording_title_taken, self.recording_titles(title))):
+            return "file name taken"
+        if title == "":
+            return "enter a file name"
+        return ""
+
 
     def move_audio_to_file(self, filename: str) -> None:
         """
@@ -576,10 +1197,9 @@ class Recorder:
             # save the audio file to the root directory with the given name
             given_name: str = title_entry.get().replace('.wav', '')
 
-            if f"{given_name}.wav" in self.recordings:
-                warning_text.config(text="*file name taken")
-            elif given_name == "":
-                warning_text.config(text="*enter a file name")
+            problem: str = self.title_problem(given_name)
+            if problem:
+                warning_text.config(text=f"*{problem}")
             else:
                 self.title = given_name
                 menu.destroy()
@@ -607,13 +1227,179 @@ class Recorder:
 
     def update_recording_listbox(self) -> None:
         """
-        Update the listbox UI with the current set of recordings.
+        Update the listbox UI with the recordings matching the search bar,
+        newest first. When only a few rows change, only those rows are
+        touched, so the selection and scroll position are kept.
+        """
+        query: str = self.search_text.get()
+        visible: list[str] = self.recording_index.search(query)[::-1]
+
+        keep: set[str] = set(visible)
+        removed: list[int] = [row for row, recording
+                              in enumerate(self.visible_recordings)
+                              if recording not in keep]
+        shown: set[str] = set(self.visible_recordings)
+        added: list[int] = [row for row, recording in enumerate(visible)
+                            if recording not in shown]
+
+        if not removed and \
+                visible[:len(self.visible_recordings)] == self.visible_recordings:
+            # rows only added at the bottom, as while the library loads
+            self.recording_listbox.insert(
+                END, *map(self.listbox_row,
+                          visible[len(self.visible_recordings):]))
+        elif len(removed) + len(added) > 50:
+            self.recording_listbox.delete(0, END)
+            self.recording_listbox.insert(END, *map(self.listbox_row, visible))
+        else:
+            # rows keep their relative order, delete bottom up, insert top down
+            for row in reversed(removed):
+                self.recording_listbox.delete(row)
+            for row in added:
+                self.recording_listbox.insert(row,
+                                              self.listbox_row(visible[row]))
+
+        self.visible_recordings = visible
+        self.show_visible_info()
+
+
+    def listbox_row(self, recording: str) -> str:
+        """
+        Get the text of a recording's row in the listbox.
+
+        :param recording: the recording's file name.
+        :return: the name, followed by the format details once they are
+        loaded.
+        """
+        info = self.recording_info.get(recording)
+        if info is None:
+            return recording
+        return f"{recording:<25} {info.describe():>21}"
+
+
+    def show_visible_info(self) -> None:
+        """
+        Fill in the details of the rows currently scrolled into view, and
+        request the ones that are not loaded yet.
+        """
+        if not self.visible_recordings:
+            return
+
+        listbox: Listbox = self.recording_listbox
+        top: int = listbox.nearest(0)
+        bottom: int = max(listbox.nearest(listbox.winfo_height()),
+                          top + int(listbox.cget("height")))
+
+        missing: list[str] = []
+        for row in range(top, min(bottom + 1, len(self.visible_recordings))):
+            recording: str = self.visible_recordings[row]
+            text: str = self.listbox_row(recording)
+            if text == recording:
+                missing.append(recording)
+            elif listbox.get(row) != text:
+                selected: bool = listbox.selection_includes(row)
+                listbox.delete(row)
+                listbox.insert(row, text)
+                if selected:
+                    listbox.select_set(row)
+
+        self.recording_info.request(missing)
+
+
+    def apply_recording_info(self) -> None:
+        """
+        Show the recording details loaded in the background and add their
+        durations to the index. Runs periodically on the Tk thread.
+        """
+        loaded: bool = False
+        try:
+            while True:
+                recording: str = self.info_updates.get_nowait()
+                info = self.recording_info.get(recording)
+                if info is not None:
+                    self.recording_index.update(recording,
+                                                duration=info.duration)
+                    loaded = True
+        except Empty:
+            pass
+
+        if loaded:
+            self.show_visible_info()
+
+        self.root.after(100, self.apply_recording_info)
+
+
+    def apply_library_changes(self) -> None:
+        """
+        Apply the changes the directory watcher found in the audio folder to
+        the recordings list and index. Runs periodically on the Tk thread.
+        Changes made by the application itself are already applied and are
+        skipped.
+        """
+        changes: list[Change] = []
+        try:
+            while True:
+                changes.extend(self.library_changes.get_nowait())
+        except Empty:
+            pass
+
+        for change in changes:
+            kind, recording = change[0], change[-1]
+            self.recording_info.forget(change[1])
+
+            try:
+                if kind == "renamed" and change[1] in self.recording_index:
+                    rename_metadata(change[1], recording)
+                    self.recording_index.rename(change[1], recording)
+                    if change[1] in self.recordings:
+                        self.recordings.remove(change[1])
+                    if self.current_audio == change[1]:
+                        self.current_audio = recording
+                        self.current_audio_selection.config(
+                            text=self.current_audio)
+                elif kind in ("added", "renamed") and \
+                        recording not in self.recording_index:
+                    self.index_recording(recording)
+                elif kind == "removed":
+                    self.recording_index.remove(recording)
+                elif kind == "modified":
+                    size: int = os.path.getsize(f"audio_recordings/{recording}")
+                    self.recording_index.update(recording, size=size)
+            except FileNotFoundError:
+                # the file is already gone again
+                continue
+
+            if kind == "removed":
+                if recording in self.recordings:
+                    self.recordings.remove(recording)
+            elif recording not in self.recordings:
+                self.recordings.append(recording)
+
+        if changes:
+            self.update_recording_listbox()
+
+        self.root.after(100, self.apply_library_changes)
+
+
+    def selected_recording(self) -> str:
+        """
+        Get the recording selected in the listbox.
+
+        :return: the recording's file name.
+        :raise IndexError: no recording is selected.
+        """
+        return self.visible_recordings[self.recording_listbox.curselection()[0]]
+
+
+    def select_recording(self, recording: str) -> None:
         """
-        self.sort_audio_recordings()
-        self.recording_listbox.delete(0, END)
+        Select a recording in the listbox, if it is listed.
 
-        for audio_file in self.recordings:
-            self.recording_listbox.insert(0, audio_file)
+        :param recording: the recording's file name.
+        """
+        if recording in self.visible_recordings:
+            index: int = self.visible_recordings.index(recording)
+            self.recording_listbox.select_set(index)
 
 
     def play_recording(self) -> None:
@@ -624,68 +1410,123 @@ class Recorder:
             return 
         
         try:
-            recording_index: int = self.recording_listbox.curselection()[0]
+            self.selected_recording()
         except IndexError:
             return
         
         if self.current_replay:
-            # stop
-            self.current_replay = ""
-            self.playing_audio = False
-            self.playing_audio_paused = False
-            self.play_button.config(text="Play")
-            self.pause_button.config(text="Pause")
-            self.current_audio_selection.config(text=self.current_audio)
+            self.stop_replay()
         else:
-            # start
-            self.playing_audio_paused = False
-            replay_thread: Thread = Thread(target=self.play_audio)
-            replay_thread.daemon = True
-            replay_thread.start()
-            self.play_button.config(text="Stop")
+            self.start_replay(self.selected_recording())
+
+
+    def start_replay(self, recording: str) -> None:
+        """
+        Start playing a recording, after the previous replay has closed its
+        file.
+
+        :param recording: the recording's file name.
+        """
+        self.stop_playback()
+        self.current_replay = recording
+        self.playing_audio = True
+        self.playing_audio_paused = False
+        self.root.title(f"Playing: {recording}")
+
+        task: Task = self.scheduler.submit(
+            "playback", self.play_audio, recording,
+            done=lambda _: self.finish_playback(task))
+        self.playback_task = task
+        self.play_button.config(text="Stop")
+        self.emit("playback", state="playing", recording=recording)
+
+
+    def stop_replay(self) -> None:
+        """
+        Stop the current replay and reset the player.
+        """
+        self.current_replay = ""
+        self.playing_audio = False
+        self.playing_audio_paused = False
+        self.play_button.config(text="Play")
+        self.pause_button.config(text="Pause")
+        self.current_audio_selection.config(text=self.current_audio)
         
         
-    def play_audio(self) -> None:
+
+    def play_audio(self, recording: str, token: CancelToken) -> None:
         """
-        Play an audio recording.
+        Play an audio recording. Runs as a scheduled task until the
+        recording ends or the replay is stopped.
+
+        :param recording: the recording's file name.
+        :param token: stops the replay.
         """
-        recording_index: int = self.recording_listbox.curselection()[0]
-        recording: str = self.recording_listbox.get(recording_index)
-        self.current_replay = recording
         recording_path: str = f"audio_recordings/{recording}"
 
-        CHUNK: int = 1024
+        CHUNK: int = (load_calibration() or {}).get("frames_per_buffer", 1024)
+
+        # edits are rendered while playing, the file itself is never changed
+        reader = open_recording(recording_path)
+        edits: EditList = EditList.load(recording)
+        if edits:
+            reader = EditedReader(reader, edits)
+
+        import pyaudio
 
-        with wave.open(recording_path, "rb") as wf:
+        with reader as wf:
             audio = pyaudio.PyAudio()
 
             stream = audio.open(format=audio.get_format_from_width(wf.getsampwidth()),
                                 channels=wf.getnchannels(),
                                 rate=wf.getframerate(),
                                 output=True)
-            
-            self.playing_audio = True
-            self.root.title(f"Playing: {recording}")
 
-            while self.current_replay:
+            while self.current_replay and not token.is_set():
                 # play audio
-                while len(data := wf.readframes(CHUNK)) and self.playing_audio:
+                while len(data := wf.readframes(CHUNK)) and \
+                        self.playing_audio and not token.is_set():
                     stream.write(data)
 
                 # break the loop if the recording has reached the end
                 if not len(data): break
 
                 # pause audio
-                while self.playing_audio_paused:
-                    time.sleep(0.001)
+                while self.playing_audio_paused and not token.wait(0.001):
+                    pass
             
         stream.close()
         audio.terminate()
 
+
+    def finish_playback(self, task: Task) -> None:
+        """
+        Reset the player once a replay ends, unless another replay has
+        started since.
+
+        :param task: the replay's task.
+        """
+        if task is not self.playback_task:
+            return
+
+        self.playback_task = None
         self.root.title("Voice Recorder")
         self.playing_audio = False
         self.current_replay = ""
         self.play_button.config(text="Play")
+        self.emit("playback", state="stopped")
+
+
+    def stop_playback(self) -> None:
+        """
+        Stop the current replay and wait for it to close its file, so the
+        recording can be renamed or deleted.
+        """
+        self.current_replay = ""
+        self.playing_audio_paused = False
+        if self.playback_task is not None:
+            self.playback_task.cancel()
+            self.playback_task.wait()
             
     
     def pause_recording(self) -> None:
@@ -717,12 +1558,11 @@ class Recorder:
         Rename the selected audio recording.
         """
         try:
-            index: int = self.recording_listbox.curselection()[0]
-            current_name = self.recording_listbox.get(index)
+            current_name: str = self.selected_recording()
         except IndexError:
             return
 
-        if self.recording_audio:
+        if self.recording_audio or current_name in self.transcoding:
             return
         
         if current_name == self.current_replay:
@@ -787,33 +1627,40 @@ class Recorder:
 
         def rename_file() -> None:
             ## rename the selected audio recording
-            new_name: str = title_entry.get().replace('.wav', '')
+            current_title, extension = split_recording_name(current_name)
+            new_name: str = split_recording_name(title_entry.get())[0]
 
-            if new_name == current_name.replace('.wav', ''):
+            if new_name == current_title:
                 menu.destroy()
+            elif current_name not in self.recordings:
+                # the recording was removed while the window was open
+                warning_text.config(text="*recording removed")
             else:
                 # stop all audio if current audio is being renamed
                 if current_name == self.current_replay:
-                    self.playing_audio_paused = False
                     self.pause_button.config(text="Pause")
                     self.current_audio_selection.config(text=self.current_replay)
-                    self.current_replay = ""
-
-                time.sleep(0.1)
+                    self.stop_playback()
 
                 # update list
-                new_path: str = f"{new_name}.wav"
-                if new_path in self.recordings:
+                new_path: str = f"{new_name}{extension}"
+                if self.recording_title_taken(new_name):
                     warning_text.config(text="*file name taken")
                 elif new_name == "":
                     warning_text.config(text="*enter a title")
                 else:
-                    self.recordings.pop(index)
-                    self.recordings.insert(index, new_path)
-
                     # rename file
-                    os.rename(f"audio_recordings/{current_name}",
-                            f"audio_recordings/{new_path}")
+                    try:
+                        os.rename(f"audio_recordings/{current_name}",
+                                f"audio_recordings/{new_path}")
+                    except FileNotFoundError:
+                        warning_text.config(text="*recording removed")
+                        return
+
+                    position: int = self.recordings.index(current_name)
+                    self.recordings[position] = new_path
+                    rename_metadata(current_name, new_path)
+                    self.recording_index.rename(current_name, new_path)
                 
                     
                     self.update_recording_listbox()
@@ -821,13 +1668,12 @@ class Recorder:
                     if self.current_replay:
                         # get the index of the current replay and set the selection
                         self.current_audio = self.current_replay
-                        idx: int = self.recordings[::-1].index(self.current_replay)
-                        self.recording_listbox.select_set(idx)
+                        self.select_recording(self.current_replay)
                         self.current_audio_selection.config(text=self.current_audio)
                     else:
                         # set current audio selection to the renamed audio
-                        self.recording_listbox.select_set(index)
-                        self.current_audio = f"{new_name}.wav"
+                        self.select_recording(new_path)
+                        self.current_audio = new_path
                         self.current_audio_selection.config(text=self.current_audio)
                     
                     menu.destroy()
@@ -844,12 +1690,11 @@ class Recorder:
         Delete the selected audio recording.
         """
         try:
-            index: int = self.recording_listbox.curselection()[0]
-            current_recording: str = self.recording_listbox.get(index)
+            current_recording: str = self.selected_recording()
         except IndexError:
             return
         
-        if self.recording_audio:
+        if self.recording_audio or current_recording in self.transcoding:
             return
     
         if current_recording == self.current_replay:
@@ -891,33 +1736,7 @@ class Recorder:
 
         def delete() -> None:
             ## delete the selected audio recording
-            # stop all audio if current audio is being deleted
-            if current_recording == self.current_replay:
-                self.playing_audio_paused = False
-                self.pause_button.config(text="Pause")
-                self.current_replay = ""
-
-            time.sleep(0.1)
-
-            # remove from the recording list
-            self.recordings.remove(current_recording)
-
-            # delete the audio file
-            os.remove(f"audio_recordings/{current_recording}")
-
-            self.update_recording_listbox()
-
-            if self.current_replay:
-                # get the index of the current replay and set the selection
-                self.current_audio = self.current_replay
-                idx: int = self.recordings[::-1].index(self.current_replay)
-                self.recording_listbox.select_set(idx)
-                self.current_audio_selection.config(text=self.current_audio)
-            else:
-                # set current audio to none and update ui
-                self.current_audio = ""
-                self.current_audio_selection.config(text=self.current_audio)
-
+            self.erase_recording(current_recording)
             menu.destroy()
 
         def cancel() -> None:
@@ -937,14 +1756,58 @@ class Recorder:
         cancel_button.place(relx=0.7, rely=0.7, anchor="center")
         
 
+    def remove_recording(self, recording: str) -> None:
+        """
+        Delete a recording along with its metadata and index entries,
+        stopping its replay first. The listbox is left to the caller.
+
+        :param recording: the recording's file name.
+        """
+        # stop all audio if current audio is being deleted
+        if recording == self.current_replay:
+            self.pause_button.config(text="Pause")
+            self.stop_playback()
+
+        # remove from the recording list
+        self.recordings.remove(recording)
+
+        # delete the audio file
+        os.remove(f"audio_recordings/{recording}")
+        delete_metadata(recording)
+        self.recording_index.remove(recording)
+        self.recording_info.forget(recording)
+        self.emit("deleted", recording=recording)
+
+
+    def erase_recording(self, recording: str) -> None:
+        """
+        Delete a recording without asking, and update the list.
+
+        :param recording: the recording's file name.
+        """
+        self.remove_recording(recording)
+        self.update_recording_listbox()
+
+        if self.current_replay:
+            # get the index of the current replay and set the selection
+            self.current_audio = self.current_replay
+            self.select_recording(self.current_replay)
+            self.current_audio_selection.config(text=self.current_audio)
+        else:
+            # set current audio to none and update ui
+            self.current_audio = ""
+            self.current_audio_selection.config(text=self.current_audio)
+
+
     def delete_all_recordings(self) -> None:
         """
         Delete all audio recordings.
         """
-        if self.recording_audio:
+        if self.recording_audio or self.transcoding:
             return
         
-        if not self.recordings:
+        # only the whole library can be deleted
+        if not (self.recordings and self.library_loaded):
             return
         
         # pause the audio
@@ -990,18 +1853,21 @@ class Recorder:
             ## delete all audio recordings
             # stop all audio
             if self.playing_audio_paused:
-                self.playing_audio_paused = False
                 self.pause_button.config(text="Pause")
-                self.current_replay = ""
-
-                time.sleep(0.1)
+                self.stop_playback()
 
             # delete all audio files
             for audio_file in self.recordings:
-                os.remove(f"audio_recordings/{audio_file}")
+                try:
+                    os.remove(f"audio_recordings/{audio_file}")
+                except FileNotFoundError:
+                    # another program already removed it
+                    pass
+                delete_metadata(audio_file)
 
             # empty list
             self.recordings = []
+            self.recording_index.clear()
 
             # update ui
             self.update_recording_listbox()
@@ -1028,6 +1894,1115 @@ class Recorder:
         cancel_button.place(relx=0.7, rely=0.7, anchor="center")
         
 
+    def place_menu(self, menu: Toplevel, width: int, height: int) -> None:
+        """
+        Center a pop-up window over the main window.
+
+        :param menu: the pop-up window.
+        :param width: the width of the pop-up window.
+        :param height: the height of the pop-up window.
+        """
+        root_geometry: str = self.root.wm_geometry(None)
+
+        root_width: int = int(root_geometry.split('x')[0])
+        root_height: int = int(root_geometry.split('+')[0].split('x')[1])
+
+        posx: int = int(root_geometry.split('+')[1]) + \
+            ((root_width - width) // 2)
+        posy: int = int(root_geometry.split('+')[2]) + \
+            ((root_height - height) // 2)
+        menu.geometry(f"{width}x{height}+{posx}+{posy}")
+
+        menu.resizable(False, False)
+        menu.config(background=self.bg_color)
+        menu.grab_set()
+
+
+    def batch_process_menu(self) -> None:
+        """
+        Launch a pop-up window to process all recordings at once.
+        """
+        if self.recording_audio or not self.recordings:
+            return
+
+        # process pools are only set up once batch processing is used
+        from BatchProcessor import BatchProcessor
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 260, 170)
+        menu.title("Batch Process")
+
+        trim: IntVar = IntVar(menu, value=0)
+        normalize: IntVar = IntVar(menu, value=0)
+        keep_originals: IntVar = IntVar(menu, value=1)
+
+        for row, (text, variable) in enumerate((("Trim silence", trim),
+                                                ("Normalize", normalize),
+                                                ("Keep originals",
+                                                 keep_originals))):
+            check: Checkbutton = Checkbutton(menu, text=text,
+                                             variable=variable,
+                                             font=(self.TEXT_FONT, 9),
+                                             background=self.bg_color)
+            check.grid(row=row, column=0, columnspan=2, sticky="w", padx=5)
+
+        entries: dict[str, Entry] = {}
+        for row, text in enumerate(("Gain (dB)", "Sample rate"), start=3):
+            label: Label = Label(menu, text=text, font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+            label.grid(row=row, column=0, sticky="w", padx=5)
+
+            entries[text] = Entry(menu, font=(self.TEXT_FONT, 9), width=10)
+            entries[text].grid(row=row, column=1, sticky="w")
+
+        progress_text: Label = Label(menu, text="", width=30,
+                                     font=(self.TEXT_FONT, 8),
+                                     background=self.bg_color)
+        progress_text.grid(row=5, column=0, columnspan=2)
+
+        self.batch_processor: BatchProcessor | None = None
+        batch: list[str] = [] # recordings that cannot be changed meanwhile
+
+        def report(fraction: float, path: str) -> None:
+            text: str = f"{fraction:.0%} {os.path.basename(path)}"
+            self.scheduler.post(lambda: progress_text.config(text=text))
+
+        def release() -> None:
+            self.transcoding.difference_update(batch)
+            batch.clear()
+            self.batch_processor = None
+
+        def fail() -> None:
+            release()
+            progress_text.config(text="*batch failed", foreground="red")
+
+        def finish(results: dict) -> None:
+            release()
+
+            # replaced recordings may have been trimmed, the watcher only
+            # notices their new size
+            for result in results.values():
+                if isinstance(result, BaseException):
+                    continue
+                recording: str = os.path.basename(result)
+                if recording in self.recording_index:
+                    self.recording_index.update(
+                        recording,
+                        size=os.path.getsize(f"audio_recordings/{recording}"),
+                        duration=load_metadata(recording).get("duration"))
+
+            failed: int = sum(isinstance(result, BaseException)
+                              for result in results.values())
+            progress_text.config(text=f"done, {failed} not processed"
+                                 if failed else "done")
+
+        def run(processor: BatchProcessor, paths: list[str],
+                token: CancelToken) -> dict:
+            token.on_cancel(processor.cancel)
+            try:
+                return processor.run(paths, report)
+            except Exception:
+                # finish is not called, free the recordings anyway
+                self.scheduler.post(fail)
+                raise
+
+        def start() -> None:
+            if self.batch_processor is not None:
+                return
+
+            operations: dict = {}
+            try:
+                if trim.get():
+                    operations["trim"] = {"threshold_db": -50.0}
+                if normalize.get():
+                    operations["normalize"] = {"peak_db": -1.0}
+                if entries["Gain (dB)"].get():
+                    operations["gain"] = {"db": float(entries["Gain (dB)"].get())}
+                if entries["Sample rate"].get():
+                    operations["convert"] = \
+                        {"rate": int(entries["Sample rate"].get())}
+            except ValueError:
+                progress_text.config(text="*enter a number", foreground="red")
+                return
+
+            if not operations:
+                progress_text.config(text="*choose an operation",
+                                     foreground="red")
+                return
+
+            if self.transcoding:
+                progress_text.config(text="*wait for conversions to finish",
+                                     foreground="red")
+                return
+
+            progress_text.config(text="starting...", foreground="black")
+            self.batch_processor = BatchProcessor(
+                operations, "alongside" if keep_originals.get() else "replace")
+
+            # block renaming and deleting the recordings until the batch ends
+            batch.extend(self.recordings)
+            self.transcoding.update(batch)
+
+            paths: list[str] = [f"audio_recordings/{recording}"
+                                for recording in batch]
+            self.scheduler.submit("background", run, self.batch_processor,
+                                  paths, done=finish)
+
+        def cancel() -> None:
+            # cancel a running batch, otherwise close the pop-up window
+            if self.batch_processor is not None:
+                self.batch_processor.cancel()
+                progress_text.config(text="cancelling...")
+            else:
+                menu.destroy()
+
+        start_button: Button = Button(menu, text="Start",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=start)
+        start_button.grid(row=6, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=cancel)
+        cancel_button.grid(row=6, column=1, pady=5)
+        
+
+    def noise_reduction_menu(self) -> None:
+        """
+        Launch a pop-up window to learn the background noise from a quiet
+        span of the selected recording and remove it, either from the
+        selected recording or from new recordings.
+        """
+        if self.recording_audio:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 260, 150)
+        menu.title("Noise Reduction")
+
+        selection: Label = Label(menu,
+                                 text=self.current_audio or "no selection",
+                                 font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+        selection.grid(row=0, column=0, columnspan=2, padx=5, sticky="w")
+
+        entries: dict[str, Entry] = {}
+        for row, text in enumerate(("Noise from (s)", "Noise to (s)"), start=1):
+            label: Label = Label(menu, text=text, font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+            label.grid(row=row, column=0, sticky="w", padx=5)
+
+            entries[text] = Entry(menu, font=(self.TEXT_FONT, 9), width=8)
+            entries[text].grid(row=row, column=1, sticky="w")
+
+        live: IntVar = IntVar(menu, value=int(self.live_noise_reduction))
+
+        def toggle_live() -> None:
+            self.live_noise_reduction = bool(live.get())
+
+        live_check: Checkbutton = Checkbutton(menu, text="Use while recording",
+                                              variable=live,
+                                              command=toggle_live,
+                                              font=(self.TEXT_FONT, 9),
+                                              background=self.bg_color)
+        live_check.grid(row=3, column=0, columnspan=2, padx=5, sticky="w")
+
+        status_text: Label = Label(menu, text="", width=30,
+                                   font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=4, column=0, columnspan=2)
+
+        recording: str = self.current_audio
+
+        # the recordings being written, so they are not written twice
+        writing: set[str] = set()
+
+        def learn() -> None:
+            # learn the noise profile from the given span
+            if not recording:
+                status_text.config(text="*select a recording")
+                return
+
+            try:
+                start: float = float(entries["Noise from (s)"].get())
+                end: float = float(entries["Noise to (s)"].get())
+                profile: NoiseProfile = NoiseProfile.learn(
+                    f"audio_recordings/{recording}", start, end)
+            except ValueError:
+                status_text.config(text="*enter a longer quiet span")
+                return
+            except (OSError, EOFError, wave.Error):
+                # the recording is gone or is not valid audio
+                status_text.config(text="*cannot read the recording")
+                return
+
+            profile.save()
+            status_text.config(text="noise profile learned")
+
+        def apply() -> None:
+            # write a noise reduced copy of the selected recording
+            profile: NoiseProfile | None = NoiseProfile.load()
+            if not recording or profile is None:
+                status_text.config(text="*learn a noise profile first")
+                return
+
+            name, extension = split_recording_name(recording)
+            denoised: str = f"{name}_denoised{extension}"
+            if self.recording_title_taken(f"{name}_denoised") or \
+                    denoised in writing or \
+                    os.path.exists(f"audio_recordings/{denoised}"):
+                status_text.config(text=f"*{name}_denoised exists already")
+                return
+
+            def report(fraction: float) -> None:
+                self.scheduler.post(lambda: menu.winfo_exists() and
+                                    status_text.config(
+                                        text=f"{fraction:.0%} reduced"))
+
+            def run(token: CancelToken) -> str:
+                try:
+                    reduce_noise(f"audio_recordings/{recording}",
+                                 f"audio_recordings/{denoised}", profile,
+                                 report)
+                except (ValueError, OSError) as error:
+                    return str(error)
+                return ""
+
+            def finish(error: str) -> None:
+                writing.discard(denoised)
+                if not error and \
+                        os.path.exists(f"audio_recordings/{denoised}"):
+                    # list it now rather than once the watcher notices it
+                    if denoised not in self.recording_index:
+                        self.index_recording(denoised)
+                    if denoised not in self.recordings:
+                        self.recordings.append(denoised)
+                    self.update_recording_listbox()
+
+                if menu.winfo_exists():
+                    status_text.config(text=f"*{error}" if error
+                                       else "noise reduced")
+
+            writing.add(denoised)
+            self.scheduler.submit("files", run, done=finish,
+                                  name="reduce_noise")
+
+        learn_button: Button = Button(menu, text="Learn",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=learn)
+        learn_button.grid(row=5, column=0, pady=5)
+
+        apply_button: Button = Button(menu, text="Apply",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=apply)
+        apply_button.grid(row=5, column=1, pady=5)
+
+
+    def edit_tags_menu(self) -> None:
+        """
+        Launch a pop-up window to edit the tags of the selected recording.
+        """
+        recording: str = self.current_audio
+        if recording not in self.recording_index:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 260, 100)
+        menu.title("Edit Tags")
+
+        entry_label: Label = Label(menu, text="Tags: ",
+                                   font=(self.TEXT_FONT, 10),
+                                   background=self.bg_color)
+        entry_label.place(relx=0.15, rely=0.25, anchor="center")
+
+        tags_entry: Entry = Entry(menu, font=(self.TEXT_FONT, 10))
+        tags_entry.place(relx=0.6, rely=0.25, anchor="center")
+        tags_entry.insert(0, ", ".join(
+            self.recording_index.details(recording)["tags"]))
+        tags_entry.focus()
+
+        hint_text: Label = Label(menu, text="separate tags with commas",
+                                 font=(self.TEXT_FONT, 8),
+                                 background=self.bg_color)
+        hint_text.place(relx=0.5, rely=0.48, anchor="center")
+
+        def save_tags() -> None:
+            # store the tags and update the index
+            tags: list[str] = [tag.strip() for tag in tags_entry.get().split(",")
+                               if tag.strip()]
+            update_metadata(recording, tags=tags)
+            self.recording_index.update(recording, tags=tags)
+            self.update_recording_listbox()
+            menu.destroy()
+
+        save_button: Button = Button(menu, text="Save",
+                                     font=(self.BUTTON_FONT, 8),
+                                     width=7,
+                                     command=save_tags)
+        save_button.place(relx=0.3, rely=0.75, anchor="center")
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=7,
+                                       command=menu.destroy)
+        cancel_button.place(relx=0.7, rely=0.75, anchor="center")
+
+
+    def duplicates_menu(self) -> None:
+        """
+        Launch a pop-up window listing groups of duplicate recordings, found
+        by their audio fingerprints. Exact copies of the oldest recording in
+        a group are selected for deletion, near duplicates are left for the
+        user to choose.
+        """
+        if self.recording_audio or self.transcoding or not self.recordings:
+            return
+
+        from AudioFingerprint import FingerprintIndex
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 320, 200)
+        menu.title("Duplicates")
+
+        duplicates_listbox: Listbox = Listbox(menu, relief="sunken",
+                                              selectmode="multiple",
+                                              font=(self.TEXT_FONT, 8),
+                                              width=50, height=8)
+        duplicates_listbox.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+
+        progress_text: Label = Label(menu, text="fingerprinting...",
+                                     width=40, font=(self.TEXT_FONT, 8),
+                                     background=self.bg_color)
+        progress_text.grid(row=1, column=0, columnspan=2)
+
+        # the recording shown in every row, None for group headers
+        rows: list[str | None] = []
+
+        def report(fraction: float) -> None:
+            text: str = f"fingerprinting... {fraction:.0%}"
+            self.scheduler.post(lambda: menu.winfo_exists() and
+                                progress_text.config(text=text))
+
+        def show(groups: list[tuple[str, list[tuple[str, bool]]]]) -> None:
+            if not menu.winfo_exists():
+                return
+
+            for kind, members in groups:
+                duplicates_listbox.insert(END, f"{kind} duplicates:")
+                rows.append(None)
+
+                # a group can hold exact and near copies of the same audio
+                for number, (recording, exact) in enumerate(members):
+                    label: str = "keep" if number == 0 else \
+                        "exact" if exact else "near"
+                    duplicates_listbox.insert(END, f"  {label} {recording}")
+                    rows.append(recording)
+                    if number and exact:
+                        duplicates_listbox.select_set(len(rows) - 1)
+
+            progress_text.config(text=f"{len(groups)} groups found"
+                                 if groups else "no duplicates found")
+
+        def run(recordings: list[str], token: CancelToken) \
+                -> list[tuple[str, list[tuple[str, bool]]]]:
+            index: FingerprintIndex = FingerprintIndex.load()
+            index.update("audio_recordings", recordings, report)
+            index.save()
+
+            # mark every recording that is an exact copy of the one kept
+            groups: list[tuple[str, list[tuple[str, bool]]]] = []
+            for kind, names in index.duplicates():
+                kept: bytes = index.entries[names[0]].digest
+                groups.append((kind, [(name, index.entries[name].digest == kept)
+                                      for name in names]))
+            return groups
+
+        def delete() -> None:
+            ## delete the selected duplicates
+            if self.recording_audio or self.transcoding:
+                return
+
+            selected: list[str] = [rows[row] for row
+                                   in duplicates_listbox.curselection()
+                                   if rows[row] in self.recording_index]
+            for recording in selected:
+                self.remove_recording(recording)
+
+            self.update_recording_listbox()
+
+            if self.current_audio not in self.recording_index:
+                self.current_audio = ""
+                self.current_audio_selection.config(text=self.current_audio)
+
+            menu.destroy()
+
+        delete_button: Button = Button(menu, text="Delete",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=delete)
+        delete_button.grid(row=2, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=menu.destroy)
+        cancel_button.grid(row=2, column=1, pady=5)
+
+        self.scheduler.submit("background", run, list(self.recordings),
+                              done=show)
+
+
+    def run_edit(self, menu: Toplevel, status_text: Label, work) -> None:
+        """
+        Run a merge, split or export in a separate thread, showing its
+        progress in its pop-up window. The recordings it writes to the
+        audio_recordings folder are added to the recordings list together
+        once all of them are complete.
+
+        :param menu: the pop-up window of the operation.
+        :param status_text: the label showing the progress.
+        :param work: called with a progress callback and a cancel token,
+        returns the paths of the written recordings.
+        """
+        if self.edit_task is not None:
+            return
+
+        status_text.config(text="starting...", foreground="black")
+
+        def report(fraction: float) -> None:
+            self.scheduler.post(lambda: menu.winfo_exists() and
+                                status_text.config(
+                                    text=f"{fraction:.0%} done"))
+
+        def finish(outputs: list[str], error: str) -> None:
+            self.edit_task = None
+
+            for path in outputs:
+                folder, recording = os.path.split(path)
+                if os.path.abspath(folder) != os.path.abspath("audio_recordings"):
+                    continue
+                if recording not in self.recording_index:
+                    self.index_recording(recording)
+                if recording not in self.recordings:
+                    self.recordings.append(recording)
+            self.update_recording_listbox()
+
+            if not menu.winfo_exists():
+                return
+            if error:
+                status_text.config(text=error, foreground="red")
+            else:
+                menu.destroy()
+
+        def run(token: CancelToken) -> tuple[list[str], str]:
+            try:
+                return work(report, token), ""
+            except EditCancelled:
+                return [], "cancelled"
+            except (OSError, EOFError, ValueError) as exception:
+                return [], f"*{exception}"
+
+        self.edit_task = self.scheduler.submit(
+            "files", run, done=lambda result: finish(*result))
+
+
+    def cancel_edit(self, menu: Toplevel) -> None:
+        """
+        Cancel the running merge, split or export, otherwise close its pop-up
+        window.
+
+        :param menu: the pop-up window of the operation.
+        """
+        if self.edit_task is not None:
+            self.edit_task.cancel()
+        else:
+            menu.destroy()
+
+
+    def merge_menu(self) -> None:
+        """
+        Launch a pop-up window to join recordings into a new one, oldest
+        first. The new recording has the sample rate, channels and sample
+        width of the oldest, and is stored in the current storage codec.
+        """
+        if self.recording_audio or len(self.recordings) < 2:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 300, 230)
+        menu.title("Merge Recordings")
+
+        recordings: list[str] = list(self.recordings)
+        merge_listbox: Listbox = Listbox(menu, relief="sunken",
+                                         selectmode="multiple",
+                                         font=(self.TEXT_FONT, 8),
+                                         width=45, height=8)
+        merge_listbox.insert(END, *recordings)
+        merge_listbox.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+
+        title_label: Label = Label(menu, text="Title", font=(self.TEXT_FONT, 9),
+                                   background=self.bg_color)
+        title_label.grid(row=1, column=0, sticky="w", padx=5)
+
+        title_entry: Entry = Entry(menu, font=(self.TEXT_FONT, 9), width=20)
+        title_entry.grid(row=1, column=1, sticky="w")
+
+        status_text: Label = Label(menu, text="", width=35,
+                                   font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=2, column=0, columnspan=2)
+
+        def start() -> None:
+            selected: list[str] = [recordings[row] for row
+                                   in merge_listbox.curselection()]
+            title: str = title_entry.get().strip()
+
+            if len(selected) < 2:
+                status_text.config(text="*select two or more recordings",
+                                   foreground="red")
+            elif not title:
+                status_text.config(text="*enter a title", foreground="red")
+            elif self.recording_title_taken(title):
+                status_text.config(text="*file name taken", foreground="red")
+            else:
+                paths: list[str] = [f"audio_recordings/{recording}"
+                                    for recording in selected]
+                destination: str = \
+                    f"audio_recordings/{title}{self.storage_codec}"
+                self.run_edit(menu, status_text,
+                              lambda report, cancel_event: [merge_recordings(
+                                  paths, destination, report, cancel_event)])
+
+        start_button: Button = Button(menu, text="Merge",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=start)
+        start_button.grid(row=3, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=lambda: self.cancel_edit(menu))
+        cancel_button.grid(row=3, column=1, pady=5)
+
+
+    def split_menu(self) -> None:
+        """
+        Launch a pop-up window to cut the selected recording into pieces,
+        keeping the original.
+        """
+        recording: str = self.current_audio
+        if self.recording_audio or recording not in self.recording_index:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 260, 130)
+        menu.title("Split Recording")
+
+        selection: Label = Label(menu, text=recording,
+                                 font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+        selection.grid(row=0, column=0, columnspan=2, padx=5, sticky="w")
+
+        times_label: Label = Label(menu, text="Split at (s)",
+                                   font=(self.TEXT_FONT, 9),
+                                   background=self.bg_color)
+        times_label.grid(row=1, column=0, sticky="w", padx=5)
+
+        times_entry: Entry = Entry(menu, font=(self.TEXT_FONT, 9), width=12)
+        times_entry.grid(row=1, column=1, sticky="w")
+
+        status_text: Label = Label(menu, text="separate times with commas",
+                                   width=30, font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=2, column=0, columnspan=2)
+
+        def start() -> None:
+            try:
+                times: list[float] = [float(time) for time
+                                      in times_entry.get().split(",")
+                                      if time.strip()]
+            except ValueError:
+                times = []
+            if not times:
+                status_text.config(text="*enter the times to split at",
+                                   foreground="red")
+                return
+
+            # the pieces are numbered after the original's title
+            title, extension = split_recording_name(recording)
+            titles: list[str] = [f"{title}_{number}"
+                                 for number in range(1, len(times) + 2)]
+            if any(map(self.recording_title_taken, titles)):
+                status_text.config(text="*file name taken", foreground="red")
+                return
+
+            destinations: list[str] = [f"audio_recordings/{piece}{extension}"
+                                       for piece in titles]
+            self.run_edit(menu, status_text,
+                          lambda report, cancel_event: split_recording(
+                              f"audio_recordings/{recording}", times,
+                              destinations, report, cancel_event))
+
+        start_button: Button = Button(menu, text="Split",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=start)
+        start_button.grid(row=3, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=lambda: self.cancel_edit(menu))
+        cancel_button.grid(row=3, column=1, pady=5)
+
+
+    def export_menu(self) -> None:
+        """
+        Launch a pop-up window to write a copy of the selected recording to
+        another folder, optionally in another format or sample rate.
+        """
+        recording: str = self.current_audio
+        if self.recording_audio or recording not in self.recording_index:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 280, 170)
+        menu.title("Export Recording")
+
+        selection: Label = Label(menu, text=recording,
+                                 font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+        selection.grid(row=0, column=0, columnspan=2, padx=5, sticky="w")
+
+        entries: dict[str, Entry] = {}
+        for row, text in enumerate(("Folder", "Sample rate"), start=1):
+            label: Label = Label(menu, text=text, font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+            label.grid(row=row, column=0, sticky="w", padx=5)
+
+            entries[text] = Entry(menu, font=(self.TEXT_FONT, 9), width=16)
+            entries[text].grid(row=row, column=1, sticky="w")
+        entries["Folder"].insert(0, os.path.expanduser("~"))
+
+        title, extension = split_recording_name(recording)
+        export_format: list[str] = [extension]
+
+        edits: EditList = EditList.load(recording)
+        apply_edits: IntVar = IntVar(menu, value=int(bool(edits)))
+
+        def toggle_format() -> None:
+            extensions: list[str] = list(CODECS)
+            index: int = extensions.index(export_format[0])
+            export_format[0] = extensions[(index + 1) % len(extensions)]
+            format_button.config(
+                text=f"Format: {CODECS[export_format[0]].name}")
+
+        format_button: Button = Button(menu,
+                                       text=f"Format: {CODECS[extension].name}",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=14,
+                                       command=toggle_format)
+        format_button.grid(row=3, column=0, pady=2)
+
+        edits_check: Checkbutton = Checkbutton(menu, text="Apply edits",
+                                               variable=apply_edits,
+                                               font=(self.TEXT_FONT, 9),
+                                               background=self.bg_color)
+        edits_check.grid(row=3, column=1, sticky="w")
+
+        status_text: Label = Label(menu, text="", width=30,
+                                   font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=4, column=0, columnspan=2)
+
+        def start() -> None:
+            folder: str = os.path.expanduser(entries["Folder"].get().strip())
+            destination: str = os.path.join(folder,
+                                            f"{title}{export_format[0]}")
+
+            if not os.path.isdir(folder):
+                status_text.config(text="*folder not found", foreground="red")
+                return
+            if os.path.exists(destination):
+                status_text.config(text="*file exists", foreground="red")
+                return
+
+            path: str = f"audio_recordings/{recording}"
+            audio_format: tuple[int, int, int] | None = None
+            if entries["Sample rate"].get():
+                try:
+                    rate: int = int(entries["Sample rate"].get())
+                    if rate <= 0:
+                        raise ValueError(rate)
+                except ValueError:
+                    status_text.config(text="*enter a number",
+                                       foreground="red")
+                    return
+
+                with open_recording(path) as reader:
+                    audio_format = (rate, reader.getnchannels(),
+                                    reader.getsampwidth())
+
+            rendered: EditList | None = edits if apply_edits.get() else None
+            self.run_edit(menu, status_text,
+                          lambda report, cancel_event: [export_recording(
+                              path, destination, audio_format, report,
+                              cancel_event, rendered)])
+
+        start_button: Button = Button(menu, text="Export",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=start)
+        start_button.grid(row=5, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=lambda: self.cancel_edit(menu))
+        cancel_button.grid(row=5, column=1, pady=5)
+
+
+    def edit_recording_menu(self) -> None:
+        """
+        Launch a pop-up window to edit the trim points, cut regions and gain
+        of the selected recording. Edits are only stored, they are applied
+        while playing and rendered into a file on export.
+        """
+        recording: str = self.current_audio
+        if recording not in self.recording_index:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 260, 170)
+        menu.title("Edit Recording")
+
+        selection: Label = Label(menu, text=recording,
+                                 font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+        selection.grid(row=0, column=0, columnspan=3, padx=5, sticky="w")
+
+        edits: EditList = EditList.load(recording)
+        values: dict[str, str] = {
+            "Trim in (s)": f"{edits.trim_in:g}" if edits.trim_in else "",
+            "Trim out (s)": "" if edits.trim_out is None else
+            f"{edits.trim_out:g}",
+            "Cuts (s)": ", ".join(f"{start:g}-{end:g}"
+                                  for start, end in edits.cuts),
+            "Gain (dB)": f"{edits.gain_db:g}" if edits.gain_db else "",
+        }
+
+        entries: dict[str, Entry] = {}
+        for row, (text, value) in enumerate(values.items(), start=1):
+            label: Label = Label(menu, text=text, font=(self.TEXT_FONT, 9),
+                                 background=self.bg_color)
+            label.grid(row=row, column=0, sticky="w", padx=5)
+
+            entries[text] = Entry(menu, font=(self.TEXT_FONT, 9), width=14)
+            entries[text].insert(0, value)
+            entries[text].grid(row=row, column=1, columnspan=2, sticky="w")
+
+        status_text: Label = Label(menu, text="cuts look like 3-5, 10-12.5",
+                                   width=30, font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=5, column=0, columnspan=3)
+
+        def save_edits() -> None:
+            # store the edits in the recording's metadata
+            try:
+                trim_in: str = entries["Trim in (s)"].get().strip()
+                trim_out: str = entries["Trim out (s)"].get().strip()
+                gain: str = entries["Gain (dB)"].get().strip()
+                cuts: list[tuple[float, float]] = []
+                for cut in entries["Cuts (s)"].get().split(","):
+                    if cut.strip():
+                        start, end = cut.split("-")
+                        cuts.append((float(start), float(end)))
+
+                if any(end <= start for start, end in cuts):
+                    status_text.config(text="*cuts must end after they start",
+                                       foreground="red")
+                    return
+
+                edited: EditList = EditList(
+                    float(trim_in) if trim_in else 0.0,
+                    float(trim_out) if trim_out else None,
+                    cuts, float(gain) if gain else 0.0)
+            except ValueError:
+                status_text.config(text="*enter numbers", foreground="red")
+                return
+
+            edited.save(recording)
+            menu.destroy()
+
+        def clear_edits() -> None:
+            EditList().save(recording)
+            menu.destroy()
+
+        save_button: Button = Button(menu, text="Save",
+                                     font=(self.BUTTON_FONT, 8),
+                                     width=7,
+                                     command=save_edits)
+        save_button.grid(row=6, column=0, pady=5)
+
+        clear_button: Button = Button(menu, text="Clear",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=7,
+                                      command=clear_edits)
+        clear_button.grid(row=6, column=1, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=7,
+                                       command=menu.destroy)
+        cancel_button.grid(row=6, column=2, pady=5)
+
+
+    def capture_devices_menu(self) -> None:
+        """
+        Launch a pop-up window to choose the input devices that are recorded
+        together, and how their tracks are saved.
+        """
+        if self.recording_audio or self.recording_audio_paused:
+            return
+
+        import pyaudio
+
+        audio = pyaudio.PyAudio()
+        devices: list[tuple[int, str]] = []
+        for index in range(audio.get_device_count()):
+            info: dict = audio.get_device_info_by_index(index)
+            if info["maxInputChannels"] > 0:
+                devices.append((index, info["name"]))
+        audio.terminate()
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 300, 200)
+        menu.title("Input Devices")
+
+        devices_listbox: Listbox = Listbox(menu, relief="sunken",
+                                           selectmode="multiple",
+                                           font=(self.TEXT_FONT, 8),
+                                           width=45, height=6)
+        for row, (index, name) in enumerate(devices):
+            devices_listbox.insert(END, f"{index}: {name}")
+            if index in self.capture_devices:
+                devices_listbox.select_set(row)
+        devices_listbox.grid(row=0, column=0, columnspan=2, padx=5, pady=5)
+
+        layout: list[str] = [self.capture_layout]
+
+        def toggle_layout() -> None:
+            layouts: tuple[str, ...] = MultiCapture.LAYOUTS
+            layout[0] = layouts[(layouts.index(layout[0]) + 1) % len(layouts)]
+            layout_button.config(text=f"Tracks: {layout[0]}")
+
+        layout_button: Button = Button(menu, text=f"Tracks: {layout[0]}",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=20,
+                                       command=toggle_layout)
+        layout_button.grid(row=1, column=0, columnspan=2)
+
+        hint_text: Label = Label(menu, text="select two or more devices to "
+                                 "record them together",
+                                 font=(self.TEXT_FONT, 8),
+                                 background=self.bg_color)
+        hint_text.grid(row=2, column=0, columnspan=2)
+
+        def save_devices() -> None:
+            self.capture_devices = [devices[row][0] for row
+                                    in devices_listbox.curselection()]
+            self.capture_layout = layout[0]
+            menu.destroy()
+
+        save_button: Button = Button(menu, text="Save",
+                                     font=(self.BUTTON_FONT, 8),
+                                     width=8,
+                                     command=save_devices)
+        save_button.grid(row=3, column=0, pady=5)
+
+        cancel_button: Button = Button(menu, text="Cancel",
+                                       font=(self.BUTTON_FONT, 8),
+                                       width=8,
+                                       command=menu.destroy)
+        cancel_button.grid(row=3, column=1, pady=5)
+
+
+    def calibration_menu(self) -> None:
+        """
+        Launch a pop-up window to measure the round trip latency of the
+        default devices. A test signal is played and recorded back, at
+        several buffer sizes, and the recommended buffer size and its
+        latency are stored for recording, playback and overdubs to use.
+        """
+        if self.recording_audio or self.recording_audio_paused or \
+                self.playing_audio:
+            return
+
+        menu: Toplevel = Toplevel()
+        self.place_menu(menu, 300, 150)
+        menu.title("Calibrate Latency")
+
+        def describe(calibration: dict | None) -> str:
+            if calibration is None:
+                return "not calibrated"
+            return f"{calibration['frames_per_buffer']} frames, " \
+                f"{calibration['latency'] * 1000:.1f} ms round trip, " \
+                f"{calibration['jitter'] * 1000:.1f} ms jitter"
+
+        hint_text: Label = Label(menu, text="connect the output to the input, "
+                                 "or hold the microphone to the speaker",
+                                 font=(self.TEXT_FONT, 8), wraplength=280,
+                                 background=self.bg_color)
+        hint_text.grid(row=0, column=0, columnspan=2, pady=5)
+
+        status_text: Label = Label(menu, text=describe(load_calibration()),
+                                   width=40, font=(self.TEXT_FONT, 8),
+                                   background=self.bg_color)
+        status_text.grid(row=1, column=0, columnspan=2)
+
+        def show(text: str) -> None:
+            self.scheduler.post(lambda: menu.winfo_exists() and
+                                status_text.config(text=text))
+
+        def run(token: CancelToken) -> None:
+            import pyaudio
+
+            audio = pyaudio.PyAudio()
+            try:
+                calibration: dict = calibrate(
+                    PyAudioLoopback(audio), progress=lambda fraction:
+                    show(f"measuring... {fraction:.0%}"))
+            except (CalibrationError, OSError) as error:
+                show(f"calibration failed: {error}")
+                return
+            finally:
+                audio.terminate()
+
+            save_calibration(calibration)
+            show(describe(calibration))
+
+        def start() -> None:
+            if self.recording_audio or self.recording_audio_paused or \
+                    self.playing_audio:
+                return
+
+            status_text.config(text="measuring...")
+            self.scheduler.submit("background", run, name="calibrate")
+
+        measure_button: Button = Button(menu, text="Measure",
+                                        font=(self.BUTTON_FONT, 8),
+                                        width=8,
+                                        command=start)
+        measure_button.grid(row=2, column=0, pady=5)
+
+        close_button: Button = Button(menu, text="Close",
+                                      font=(self.BUTTON_FONT, 8),
+                                      width=8,
+                                      command=menu.destroy)
+        close_button.grid(row=2, column=1, pady=5)
+
+
+    def emit(self, event: str, **fields) -> None:
+        """
+        Tell the clients of the control API about a change.
+
+        :param event: the kind of change.
+        :param fields: the details of the change.
+        """
+        if getattr(self, "control", None) is not None:
+            self.control.broadcast(event, **fields)
+
+
+    def control_command(self, command: str, arguments: dict):
+        """
+        Carry out a command received by the control API. Runs on the Tk
+        thread, and does what the matching buttons do without any pop-up
+        windows.
+
+        :param command: start, pause, stop, save, discard, play,
+        stop_playback, list, delete or state.
+        :param arguments: "title" to save a recording under, "recording"
+        to play or delete.
+        :return: the result sent back to the client.
+        :raise ControlError: the command cannot be carried out now.
+        """
+        recording: str = arguments.get("recording", "")
+        title: str = arguments.get("title", "")
+        taking: bool = self.recording_audio or self.recording_audio_paused
+
+        if command == "start":
+            # starts a new recording, or resumes a paused one
+            if self.recording_audio:
+                raise ControlError("already recording")
+            self.start_recording()
+        elif command == "pause":
+            if not self.recording_audio:
+                raise ControlError("not recording")
+            self.start_recording()
+        elif command in ("stop", "save"):
+            # stop holds the recording until it is saved, unless a title is
+            # given right away
+            if not taking:
+                raise ControlError("not recording")
+            if command == "save" and not title:
+                raise ControlError("enter a file name")
+            if title and (problem := self.title_problem(title)):
+                raise ControlError(problem)
+
+            if self.recording_audio:
+                self.hold_recording()
+            if title:
+                return self.save_recording(title)
+        elif command == "discard":
+            if not taking:
+                raise ControlError("not recording")
+            if self.recording_audio:
+                self.hold_recording()
+            self.discard_recording()
+        elif command == "play":
+            if self.recording_audio:
+                raise ControlError("recording")
+            if recording not in self.recording_index:
+                raise ControlError(f"no recording named {recording!r}")
+            self.start_replay(recording)
+        elif command == "stop_playback":
+            if self.current_replay:
+                self.stop_replay()
+        elif command == "list":
+            return [{"recording": name,
+                     **self.recording_index.details(name)}
+                    for name in reversed(self.recordings)
+                    if name in self.recording_index]
+        elif command == "delete":
+            if recording not in self.recording_index:
+                raise ControlError(f"no recording named {recording!r}")
+            if self.recording_audio or recording in self.transcoding:
+                raise ControlError("recording is in use")
+            self.erase_recording(recording)
+        elif command != "state":
+            raise ControlError(f"unknown command {command!r}")
+
+        return {"recording": self.recording_audio,
+                "paused": self.recording_audio_paused and
+                not self.recording_audio,
+                "time": self.current_time / 100,
+                "playing": self.current_replay}
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and play audio.")
+    parser.add_argument("--control", metavar="ADDRESS",
+                        help="serve the control API on a port or Unix "
+                        "socket path")
+    parser.add_argument("--headless", action="store_true",
+                        help="keep the window hidden, for use with "
+                        "--control")
+    args = parser.parse_args()
+
     # create an instance of the recorder application
-    Recorder()
\ No newline at end of file
+    Recorder(args.control, args.headless)
\ No newline at end of file